@@ -0,0 +1,162 @@
+"""
+Room charge accrual for Hospital management system
+
+This module posts daily room charges for every open stay in bulk.
+
+A night is billable from admitted_date until discharged_date (or today for open stays,
+and for stays whose discharge is scheduled after today), which is the same period as
+PatientType.duration. The first unbilled night is found from the bill itself, after
+the latest charge posted with the engine's category and description, so running it
+twice never bills a night twice, also from a new engine in another process.
+"""
+
+import weakref
+from typing import Iterable, List
+
+from main import DateType, ChargeHistoryItem, BillType
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class RoomAccrual:
+    """
+    This is the nightly accrual engine.
+    The first unbilled night of each bill is kept with the bill's version,
+    so a bill is looked through again only when it was changed by someone else.
+
+    A discharged_date moved earlier after billing is not refunded here.
+    """
+
+    def __init__(
+            self,
+            daily_rate: int,
+            category: str = 'room',
+            description: str = None,
+            catalog=None
+    ):
+        """
+        Initialize this class.
+
+        Args:
+            daily_rate: (int) cost of one night.
+            category: (str) category of charges. It must be available.
+            description: (str|None) description of charges.
+            catalog: (catalog.Catalog|catalog.TenantCatalog|None) catalog to check the category with.
+                None is ChargeHistoryItem.categories. Bills with their own BillType.catalog are
+                also checked with it on every run.
+        """
+
+        if catalog is not None:
+            catalog.validate(category)
+        else:
+            ChargeHistoryItem.validate_categories([category])
+
+        self.__daily_rate = daily_rate
+        self.__category = category
+        self.__description = description
+        # bill -> (version of the bill, first unbilled night ordinal)
+        self.__billed_until = weakref.WeakKeyDictionary()
+
+    def first_unbilled(self, bill: BillType) -> int:
+        """
+        Find the first night which is not billed by this engine's category and description.
+
+        Args:
+            bill: (BillType) the bill.
+
+        Returns:
+            (int): ordinal of the night. It is admitted_date when nothing is billed.
+        """
+
+        cached = self.__billed_until.get(bill)
+        snapshot = bill.snapshot()
+        if cached is not None and cached[0] == snapshot.version:
+            return cached[1]
+
+        category, description = self.__category.lower(), self.__description
+        first = bill.patient.admitted_date.toordinal()
+        for charge in snapshot:
+            posted = charge.posted_date
+            if posted is not None and charge.description == description and charge.category.lower() == category:
+                first = max(first, posted.toordinal() + 1)
+
+        self.__billed_until[bill] = (snapshot.version, first)
+        return first
+
+    def unbilled_nights(self, bill: BillType, today: DateType = None) -> range:
+        """
+        Find unbilled nights of the bill.
+
+        Args:
+            bill: (BillType) the bill.
+            today: (DateType|None) end of open stays. None is today.
+
+        Returns:
+            (range): ordinals of unbilled nights.
+        """
+
+        today = (today or DateType.today()).toordinal()
+        starts, ends = self.__periods([bill], today)
+        return range(starts[0], ends[0])
+
+    def run(self, bills: Iterable[BillType], today: DateType = None) -> int:
+        """
+        Post every unbilled night, one charge per night with posted_date.
+
+        Args:
+            bills: (Iterable[BillType]) bills of stays.
+            today: (DateType|None) end of open stays. None is today.
+
+        Returns:
+            (int): number of posted charges.
+        """
+
+        today = (today or DateType.today()).toordinal()
+        bills = list(bills)
+
+        # the category is checked with the catalog of every hospital before anything is posted.
+        catalogs = {id(bill.catalog): bill.catalog for bill in bills if bill.catalog is not None}
+        for catalog in catalogs.values():
+            catalog.validate(self.__category)
+
+        starts, ends = self.__periods(bills, today)
+
+        # nights are counted for every bill at once, and only bills with nights are touched.
+        if np is not None:
+            counts = np.maximum(np.asarray(ends, dtype=np.int64) - np.asarray(starts, dtype=np.int64), 0)
+            pending = np.flatnonzero(counts).tolist()
+        else:
+            pending = [index for index, (start, end) in enumerate(zip(starts, ends)) if end > start]
+
+        # posted dates are shared between bills; DateType is read-only.
+        dates = {}
+        rate, category, description = self.__daily_rate, self.__category, self.__description
+        make = ChargeHistoryItem.from_trusted
+
+        posted = 0
+        for index in pending:
+            nights = range(starts[index], ends[index])
+            for night in nights:
+                if night not in dates:
+                    dates[night] = DateType.fromordinal(night)
+
+            bill = bills[index]
+            bill.add_charges([make(rate, category, description, dates[night]) for night in nights])
+            self.__billed_until[bill] = (bill.version, nights.stop)
+            posted += len(nights)
+
+        return posted
+
+    def __periods(self, bills: List[BillType], today: int) -> tuple:
+        starts, ends = [], []
+
+        for bill in bills:
+            discharged = bill.patient.discharged_date
+            starts.append(self.first_unbilled(bill))
+            # a discharge scheduled after today is still an open stay.
+            ends.append(min(discharged.toordinal(), today) if discharged is not None else today)
+
+        return starts, ends
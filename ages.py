@@ -0,0 +1,174 @@
+"""
+Age maintenance for Hospital management system
+
+This module keeps PatientType.age equal to the age on today, derived from birthday.
+
+Patients are indexed by the month and day of their birthday, so a date rollover
+updates only patients whose birthday is in the elapsed days, not every patient.
+A birthday on 29 Feb is counted on 1 Mar in common years.
+
+age stays a normal attribute, so it can still be set by hand; the index overwrites it
+only for patients whose birthday passes, or on recompute_all.
+"""
+
+from calendar import isleap
+from typing import Dict, Iterable, Tuple
+
+from main import DateType, PatientType
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def age_on(birthday: DateType, today: DateType) -> int:
+    """
+    Calculate the age on a day.
+
+    Args:
+        birthday: (DateType) date of birth.
+        today: (DateType) the day.
+
+    Returns:
+        (int): completed years.
+    """
+    return today.year - birthday.year - ((today.month, today.day) < (birthday.month, birthday.day))
+
+
+def _birthdays_on(day: DateType) -> Tuple[Tuple[int, int], ...]:
+    # keys of birthdays celebrated on the day.
+    if day.month == 3 and day.day == 1 and not isleap(day.year):
+        return (3, 1), (2, 29)
+    return (day.month, day.day),
+
+
+class AgeIndex:
+    """
+    This is an index of patients by birthday, with the day their ages are computed for.
+    """
+
+    def __init__(self, patients: Iterable[PatientType] = (), today: DateType = None):
+        """
+        Initialize this class. Ages of the patients are computed for today.
+
+        Args:
+            patients: (Iterable[PatientType]) patients.
+            today: (DateType|None) the day of ages. None is today.
+        """
+
+        self.__today = today or DateType.today()
+        # (month, day) of birthday -> patient id -> patient
+        self.__birthdays: Dict[Tuple[int, int], Dict[int, PatientType]] = {}
+        self.__size = 0
+
+        patients = list(patients)
+        for patient in patients:
+            self.__insert(patient)
+        self.recompute_all(patients)
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def today(self) -> DateType:
+        """
+        It returns the day ages are computed for.
+
+        Returns:
+            (DateType): the day.
+        """
+        return self.__today
+
+    def __insert(self, patient: PatientType):
+        birthday = patient.birthday
+        patients = self.__birthdays.setdefault((birthday.month, birthday.day), {})
+        if patient.id not in patients:
+            self.__size += 1
+        patients[patient.id] = patient
+
+    def add(self, patient: PatientType):
+        """
+        Add a patient and set the age for the index's day.
+
+        Args:
+            patient: (PatientType) the patient.
+        """
+
+        self.__insert(patient)
+        patient.age = age_on(patient.birthday, self.__today)
+
+    def remove(self, patient: PatientType):
+        """
+        Remove a patient, e.g. at discharge.
+
+        Args:
+            patient: (PatientType) the patient.
+        """
+
+        birthday = patient.birthday
+        patients = self.__birthdays.get((birthday.month, birthday.day), {})
+        if patients.pop(patient.id, None) is not None:
+            self.__size -= 1
+
+    def rollover(self, today: DateType = None) -> int:
+        """
+        Move to a new day. Only patients with a birthday after the old day, until the new day, are updated.
+        When a whole year or more has passed, or the day goes back, every age is computed again.
+
+        Args:
+            today: (DateType|None) the new day. None is today.
+
+        Returns:
+            (int): number of updated patients.
+        """
+
+        today = today or DateType.today()
+        first, last = self.__today.toordinal() + 1, today.toordinal()
+
+        if last < first - 1 or last - first >= 365:
+            self.__today = today
+            return self.recompute_all()
+
+        updated = 0
+        for ordinal in range(first, last + 1):
+            for key in _birthdays_on(DateType.fromordinal(ordinal)):
+                for patient in self.__birthdays.get(key, {}).values():
+                    patient.age = age_on(patient.birthday, today)
+                    updated += 1
+
+        self.__today = today
+        return updated
+
+    def recompute_all(self, patients: Iterable[PatientType] = None) -> int:
+        """
+        Compute ages of patients for the index's day at once, vectorized with numpy when it is installed.
+        It is for bulk loads; nightly rollover does not need it.
+
+        Args:
+            patients: (Iterable[PatientType]|None) patients. None is every patient in the index.
+
+        Returns:
+            (int): number of updated patients.
+        """
+
+        if patients is None:
+            patients = [patient for day in self.__birthdays.values() for patient in day.values()]
+        else:
+            patients = list(patients)
+
+        today = self.__today
+        birthdays = [patient.birthday for patient in patients]
+
+        if np is not None:
+            years = np.fromiter((birthday.year for birthday in birthdays), dtype=np.int64, count=len(birthdays))
+            days = np.fromiter(
+                (birthday.month * 100 + birthday.day for birthday in birthdays), dtype=np.int64, count=len(birthdays)
+            )
+            ages = (today.year - years - (days > today.month * 100 + today.day)).tolist()
+        else:
+            ages = [age_on(birthday, today) for birthday in birthdays]
+
+        for patient, age in zip(patients, ages):
+            patient.age = age
+        return len(patients)
@@ -0,0 +1,670 @@
+"""
+Benchmarks for Hospital management system
+
+Run every benchmark with `python benchmark.py`,
+or some of them with `python benchmark.py dates ...`.
+"""
+
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from main import PersonType, DateType, DoctorType, PatientType, ChargeHistoryItem, BillType
+
+# registered benchmarks; name -> function
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark function under the name.
+
+    Args:
+        name: (str) name for command line.
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+def report(label: str, seconds: float, count: int):
+    """
+    Print one line of result.
+
+    Args:
+        label: (str) what was measured.
+        seconds: (float) elapsed time.
+        count: (int) number of operations.
+    """
+
+    print(f'{label:<48} {seconds * 1000:>10.1f} ms {count / seconds:>14,.0f} ops/s')
+
+
+def skewed_dates(count: int, days: int = 365, seed: int = 0) -> list:
+    """
+    Make date strings with a Zipf-like distribution.
+    A few admission days are very common, like real hospital data.
+
+    Args:
+        count: (int) number of strings.
+        days: (int) number of distinct days.
+        seed: (int) random seed.
+
+    Returns:
+        (list): date strings in 'dd/mm/YYYY'.
+    """
+
+    from datetime import date, timedelta
+
+    rng = random.Random(seed)
+    first = date(2022, 1, 1)
+    pool = [(first + timedelta(days=i)).strftime('%d/%m/%Y') for i in range(days)]
+    weights = [1 / (rank + 1) for rank in range(days)]
+    return rng.choices(pool, weights=weights, k=count)
+
+
+@benchmark('dates')
+def bench_dates(count: int = 200_000):
+    from datetime import date, datetime
+
+    texts = skewed_dates(count)
+
+    # baseline: strptime every time.
+    start = time.perf_counter()
+    for text in texts:
+        datetime.strptime(text, '%d/%m/%Y')
+    report('parse: datetime.strptime', time.perf_counter() - start, count)
+
+    DateType.clear_cache()
+    start = time.perf_counter()
+    dates = DateType.parse_many(texts)
+    report('parse: DateType.parse_many (cold cache)', time.perf_counter() - start, count)
+
+    start = time.perf_counter()
+    DateType.parse_many(texts)
+    report('parse: DateType.parse_many (warm cache)', time.perf_counter() - start, count)
+
+    # baseline: a new date for every rendering, like PatientType.__str__ did.
+    start = time.perf_counter()
+    for the_date in dates:
+        date(the_date.year, the_date.month, the_date.day).strftime('%d/%m/%Y')
+    report('format: date().strftime', time.perf_counter() - start, count)
+
+    start = time.perf_counter()
+    for the_date in dates:
+        the_date.strftime('%d/%m/%Y')
+    report('format: DateType.strftime (memoized)', time.perf_counter() - start, count)
+
+
+def sample_patient() -> PatientType:
+    """
+    Make a patient for benchmarks.
+
+    Returns:
+        (PatientType): the patient.
+    """
+
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    return PatientType('Chis', 'A', 18, DateType(2011, 3, 13), doctor, DateType(2022, 4, 14))
+
+
+def report_latency(label: str, latencies: list):
+    """
+    Print percentiles of latencies.
+
+    Args:
+        label: (str) what was measured.
+        latencies: (list) seconds of each operation.
+    """
+
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(
+        f'{label:<48} p50 {p50 * 1e6:>8.1f} us  p99 {p99 * 1e6:>8.1f} us  '
+        f'mean {statistics.fmean(latencies) * 1e6:>8.1f} us'
+    )
+
+
+class LockedBill:
+    """
+    Baseline for the snapshot benchmark: one list guarded by one coarse lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.charges = []
+
+    def add_charge(self, cost: int, category: str):
+        item = ChargeHistoryItem(cost, category)
+        with self.lock:
+            self.charges.append(item)
+
+    def report(self) -> int:
+        # a reader holds the lock while it walks the charges.
+        with self.lock:
+            return len('\n'.join(map(str, self.charges))) + sum(self.charges)
+
+
+@benchmark('snapshot')
+def bench_snapshot(posts: int = 5_000, readers: int = 4, prefill: int = 1_000):
+    bill = BillType(sample_patient())
+    locked = LockedBill()
+
+    def run(post, report):
+        stop = threading.Event()
+
+        def reader():
+            count = 0
+            while not stop.is_set():
+                report()
+                count += 1
+            return count
+
+        latencies = []
+        with ThreadPoolExecutor(max_workers=readers) as pool:
+            futures = [pool.submit(reader) for _ in range(readers)]
+            started = time.perf_counter()
+            for _ in range(posts):
+                start = time.perf_counter()
+                post(22, 'room')
+                latencies.append(time.perf_counter() - start)
+            stop.set()
+            elapsed = time.perf_counter() - started
+
+        return latencies, sum(future.result() for future in futures) / elapsed
+
+    def report_snapshot():
+        # same work as LockedBill.report, but without any lock.
+        snapshot = bill.snapshot()
+        return len('\n'.join(map(str, snapshot))) + snapshot.total_fee
+
+    # both bills start with the same history, so reports have real work.
+    for _ in range(prefill):
+        bill.add_charge(22, 'room')
+        locked.add_charge(22, 'room')
+
+    for label, post, report_func in (
+            ('coarse lock', locked.add_charge, locked.report),
+            ('snapshot()', bill.add_charge, report_snapshot),
+    ):
+        latencies, reports = run(post, report_func)
+        report_latency(f'post under {readers} readers: {label}', latencies)
+        print(f'{"":<48} readers: {reports:,.0f} reports/s')
+
+
+@benchmark('simulation')
+def bench_simulation(years: int = 10, replications: int = 4):
+    from simulation import BedSimulation, synthetic_stays, replicate, summarize
+
+    simulation = {'beds': 400, 'doctors': {'surgery': 20, 'medicine': 20}, 'max_wait': 1.0}
+    synthetic = {
+        'days': 365 * years,
+        'arrivals_per_day': 90,
+        'mean_length': 4,
+        'specialities': {'surgery': 1, 'medicine': 1},
+    }
+
+    start = time.perf_counter()
+    result = BedSimulation(**simulation).run(synthetic_stays(seed=0, **synthetic))
+    report(f'{years} years, one process', time.perf_counter() - start, result.arrivals)
+
+    start = time.perf_counter()
+    results = replicate(simulation, synthetic, range(replications))
+    report(f'{years} years x {replications} replications', time.perf_counter() - start, replications * result.arrivals)
+
+    summary = summarize(results)
+    print(f'mean occupancy {summary["mean_occupancy"]:.1f} / 400, overflow {summary["overflowed"]:.0f}')
+
+
+@benchmark('accrual')
+def bench_accrual(inpatients: int = 1_000_000):
+    from accrual import RoomAccrual
+
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    birthday = DateType(1990, 1, 1)
+    admitted = [DateType.fromordinal(DateType(2022, 4, 1).toordinal() + day) for day in range(14)]
+
+    start = time.perf_counter()
+    bills = [
+        BillType(PatientType.from_trusted('Chis', 'A', 30, birthday, doctor, admitted[index % 14]))
+        for index in range(inpatients)
+    ]
+    report(f'create {inpatients:,} inpatients and bills', time.perf_counter() - start, inpatients)
+
+    accrual = RoomAccrual(22)
+    for night, today in enumerate((DateType(2022, 4, 15), DateType(2022, 4, 16))):
+        start = time.perf_counter()
+        posted = accrual.run(bills, today)
+        report(f'night {night + 1}: post {posted:,} room charges', time.perf_counter() - start, inpatients)
+
+    start = time.perf_counter()
+    posted = accrual.run(bills, DateType(2022, 4, 16))
+    report(f'rerun: post {posted:,} room charges', time.perf_counter() - start, inpatients)
+
+    # a restarted job finds billed nights from the bills.
+    start = time.perf_counter()
+    posted = RoomAccrual(22).run(bills, DateType(2022, 4, 16))
+    report(f'restarted rerun: post {posted:,} room charges', time.perf_counter() - start, inpatients)
+
+
+def _private_memory_kb() -> int:
+    # anonymous (not shared) memory of this process. It is Linux only.
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1])
+    return 0
+
+
+def _shared_store_reader(name: str, results):
+    from shared_store import SharedStoreReader
+
+    before = _private_memory_kb()
+    reader = SharedStoreReader(name)
+    total = sum(patient.total_fee for patient in reader)
+    results.put((total, _private_memory_kb() - before))
+    reader.close()
+
+
+@benchmark('shared_store')
+def bench_shared_store(patients: int = 200_000, readers: tuple = (1, 2, 4, 8)):
+    import multiprocessing
+    import os
+    from shared_store import SharedStoreWriter
+
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    bills = []
+    for index in range(patients):
+        bill = BillType(PatientType.from_trusted('Chis', 'A', 30, DateType(1990, 1, 1), doctor, DateType(2022, 4, 1)))
+        bill.add_charges([ChargeHistoryItem.from_trusted(22, 'room') for _ in range(5)])
+        bills.append(bill)
+
+    writer = SharedStoreWriter(f'hms_bench_{os.getpid()}')
+    try:
+        start = time.perf_counter()
+        writer.publish(bills)
+        report(f'publish {patients:,} patients', time.perf_counter() - start, patients)
+
+        for count in readers:
+            results = multiprocessing.Queue()
+            processes = [
+                multiprocessing.Process(target=_shared_store_reader, args=(f'hms_bench_{os.getpid()}', results))
+                for _ in range(count)
+            ]
+            for process in processes:
+                process.start()
+            growth = [results.get()[1] for _ in processes]
+            for process in processes:
+                process.join()
+            print(f'{count} readers: private memory growth per reader {max(growth) / 1024:.1f} MB')
+    finally:
+        writer.close()
+
+
+@benchmark('query')
+def bench_query(patients: int = 200_000, repeats: int = 20):
+    from query import F, PatientTable
+
+    doctors = [DoctorType(speciality, 'Thomas', 'Edison') for speciality in ('Surgery', 'Pediatrics', 'Neurology')]
+    first_day = DateType(2021, 1, 1).toordinal()
+    rng = random.Random(0)
+    bills = []
+    for index in range(patients):
+        bill = BillType(PatientType.from_trusted(
+            'Chis', 'A', rng.randrange(90), DateType(1990, 1, 1), doctors[index % 3],
+            DateType.fromordinal(first_day + rng.randrange(730)),
+        ))
+        bill.add_charges([ChargeHistoryItem.from_trusted(rng.randrange(2000), 'room')])
+        bills.append(bill)
+
+    low, high = DateType(2022, 4, 1), DateType(2022, 4, 30)
+    predicate = (
+        F('age').between(20, 40) & (F('speciality') == 'Surgery')
+        & F('admitted_date').between(low, high) & (F('total_fee') > 1000)
+    )
+
+    def matches(bill):
+        patient = bill.patient
+        admitted = patient.admitted_date.toordinal()
+        return (20 <= patient.age <= 40 and patient.attending_physician.speciality == 'Surgery'
+                and low.toordinal() <= admitted <= high.toordinal() and bill.total_fee > 1000)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        expected = [bill for bill in bills if matches(bill)]
+    report('lambda full scan', time.perf_counter() - start, repeats)
+
+    table = PatientTable(bills)
+    table.where(predicate).count()  # columns are built once.
+    start = time.perf_counter()
+    for _ in range(repeats):
+        scanned = table.where(predicate).bills()
+    report('column scan', time.perf_counter() - start, repeats)
+
+    table.create_index('admitted_date')
+    start = time.perf_counter()
+    for _ in range(repeats):
+        indexed = table.where(predicate).bills()
+    report('index scan', time.perf_counter() - start, repeats)
+
+    assert expected == scanned == indexed
+    print(table.where(predicate).explain())
+
+
+@benchmark('reconcile')
+def bench_reconcile(bills: int = 50_000, charges: int = 20, changed: float = 0.01):
+    from reconcile import Reconciler, ledger_of
+
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    first_night = DateType(2022, 4, 1).toordinal()
+    ours = []
+    for _ in range(bills):
+        bill = BillType(PatientType.from_trusted('Chis', 'A', 30, DateType(1990, 1, 1), doctor, DateType(2022, 4, 1)))
+        bill.add_charges([
+            ChargeHistoryItem.from_trusted(22, 'room', None, DateType.fromordinal(first_night + night))
+            for night in range(charges)
+        ])
+        ours.append(bill)
+
+    # the insurer's copy is reordered, and a few costs differ.
+    rng = random.Random(0)
+    theirs = {}
+    for bill in ours:
+        records = [(charge.cost, charge.category, charge.description, charge.posted_date) for charge in bill]
+        rng.shuffle(records)
+        if rng.random() < changed:
+            records[0] = (30,) + records[0][1:]
+        theirs[bill.patient.id] = records
+
+    def naive(our_charges, their_charges):
+        # every charge is searched in the other list.
+        left = list(their_charges)
+        for charge in our_charges:
+            for index, other in enumerate(left):
+                if (charge.cost, charge.category, charge.description, charge.posted_date) == other:
+                    del left[index]
+                    break
+        return left
+
+    start = time.perf_counter()
+    different = sum(1 for bill in ours if naive(bill, theirs[bill.patient.id]))
+    report(f'item by item, {different} different', time.perf_counter() - start, bills)
+
+    reconciler = Reconciler()
+    ledger = ledger_of(ours)
+    for label in ('first run', 'rerun with cached digests'):
+        start = time.perf_counter()
+        result = reconciler.reconcile(ledger, theirs)
+        report(f'{label}, {len(result.diffs)} different', time.perf_counter() - start, bills)
+
+
+def _zipf_names(count: int, distinct: int, seed: int) -> list:
+    # name frequencies follow Zipf's law, like surnames in a census.
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    pool = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 10))).title()
+            for _ in range(distinct)]
+    # every record gets its own str object, like a parsed import file.
+    return [''.join(list(name)) for name in rng.choices(pool, weights, k=count)]
+
+
+@benchmark('names')
+def bench_names(people: int = 1_000_000):
+    import tracemalloc
+
+    class PlainPerson:
+        # a person keeping its own str objects, as before the name pool.
+        def __init__(self, first_name, last_name):
+            self.first_name = first_name
+            self.last_name = last_name
+
+    for label, make in (('plain str', PlainPerson), ('name pool', PersonType)):
+        # names are parsed while tracing, so memory kept through them is counted.
+        tracemalloc.start()
+        first_names = _zipf_names(people, 5_000, 1)
+        last_names = _zipf_names(people, 50_000, 2)
+        start = time.perf_counter()
+        persons = [make(first, last) for first, last in zip(first_names, last_names)]
+        seconds = time.perf_counter() - start
+        del first_names, last_names
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        report(f'{label}: create {people:,} persons', seconds, people)
+        print(f'{label}: {retained / 2 ** 20:.1f} MiB retained, {retained / people:.0f} bytes per person')
+        del persons
+
+    print(f'name pool: {len(PersonType.name_pool):,} distinct names')
+    surnames = PersonType.name_pool.lookup(_zipf_names(1, 50_000, 2)[0].upper())
+    print(f'case-insensitive lookup: {len(surnames)} handle(s)')
+
+
+@benchmark('ages')
+def bench_ages(patients: int = 1_000_000):
+    from ages import AgeIndex, age_on
+
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    rng = random.Random(0)
+    first_day = DateType(1930, 1, 1).toordinal()
+    birthdays = [DateType.fromordinal(first_day + rng.randrange(33_000)) for _ in range(1_000)]
+    people = [
+        PatientType.from_trusted('Chis', 'A', 0, birthdays[index % 1_000], doctor, DateType(2022, 4, 1))
+        for index in range(patients)
+    ]
+
+    today = DateType(2022, 4, 15)
+    start = time.perf_counter()
+    index = AgeIndex(people, today)
+    report(f'index and recompute {patients:,} ages', time.perf_counter() - start, patients)
+
+    start = time.perf_counter()
+    for patient in people:
+        patient.age = age_on(patient.birthday, today)
+    report('nightly loop over every patient', time.perf_counter() - start, patients)
+
+    start = time.perf_counter()
+    updated = index.rollover(DateType(2022, 4, 16))
+    report(f'rollover, {updated:,} birthdays', time.perf_counter() - start, max(updated, 1))
+
+
+@benchmark('ingestion')
+def bench_ingestion(seconds: float = 3.0, overload: float = 2.0):
+    from dedup import DuplicateIndex
+    from events import Backpressure
+    from ingestion import Admission, IngestionPipeline
+
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    admissions = [
+        Admission(first, last, 30, DateType(1990, 1, 1 + index % 28), doctor, DateType(2022, 4, 14), ((22, 'room', None),))
+        for index, (first, last) in enumerate(zip(_zipf_names(1000, 500, 1), _zipf_names(1000, 2000, 2)))
+    ]
+
+    def sink(bills):
+        # inserting into an index is the slow part of an admission.
+        for bill in bills:
+            index.add(bill.patient)
+
+    # capacity of the pipeline without overload.
+    index = DuplicateIndex()
+    with IngestionPipeline(sink, maxsize=1_000_000, workers=2) as pipeline:
+        start = time.perf_counter()
+        futures = [pipeline.submit(admissions[i % 1000]) for i in range(20_000)]
+        for future in futures:
+            future.result()
+        capacity = 20_000 / (time.perf_counter() - start)
+    print(f'capacity about {capacity:,.0f} admissions/s; offered {overload:.0f}x for {seconds:.0f} s')
+
+    for label, maxsize, overflow in (('unbounded queue', 10_000_000, 'block'), ('bounded queue, shedding', 512, 'error')):
+        index = DuplicateIndex()
+        with IngestionPipeline(sink, maxsize=maxsize, workers=2, overflow=overflow) as pipeline:
+            rate, sent, rejected = capacity * overload, 0, 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                # producers send at the offered rate, in small bursts.
+                due = int((time.perf_counter() - start) * rate)
+                while sent < due:
+                    try:
+                        pipeline.submit(admissions[sent % 1000])
+                    except Backpressure:
+                        rejected += 1
+                    sent += 1
+                time.sleep(0.001)
+        metrics = pipeline.metrics()
+        print(
+            f'{label:<28} accepted {metrics["completed"]:>8,}  rejected {rejected:>8,}  '
+            f'p50 {metrics["p50"] * 1e3:>8.1f} ms  p99 {metrics["p99"] * 1e3:>8.1f} ms'
+        )
+
+
+@benchmark('discharge_planning')
+def bench_discharge_planning(inpatients: int = 200_000, updates: int = 100_000):
+    import events
+    from discharge_planning import DischargePlanner
+
+    doctors = [DoctorType(speciality, 'Thomas', 'Edison') for speciality in ('Surgery', 'Pediatrics', 'Neurology')]
+    first_day = DateType(2022, 1, 1).toordinal()
+    rng = random.Random(0)
+    patients = [
+        PatientType.from_trusted('Chis', 'A', 30, DateType(1990, 1, 1), doctors[index % 3],
+                                 DateType.fromordinal(first_day + rng.randrange(120)))
+        for index in range(inpatients)
+    ]
+    stays = {'Surgery': 6, 'Pediatrics': 3, 'Neurology': 9}
+    today = DateType(2022, 4, 20)
+
+    def expected(patient):
+        return patient.admitted_date.toordinal() + stays[patient.attending_physician.speciality]
+
+    start = time.perf_counter()
+    for _ in range(10):
+        scanned = sorted(patients, key=expected)[:20]
+        late = [patient for patient in patients if expected(patient) < today.toordinal()]
+    report('scan every patient: next 20 and overdue', time.perf_counter() - start, 10)
+
+    planner = DischargePlanner(stays)
+    for patient in patients:
+        planner.add(patient)
+
+    start = time.perf_counter()
+    for _ in range(10):
+        nearest = planner.next_k(20)
+    report('planner: next 20', time.perf_counter() - start, 10)
+    same = [expected(patient) for patient in scanned] == [item.expected.toordinal() for item in nearest]
+    print(f'planner: next 20 {"match" if same else "DO NOT match"} the scan')
+
+    start = time.perf_counter()
+    late = planner.overdue(DateType(2022, 1, 10))
+    report(f'planner: overdue, {len(late):,} found', time.perf_counter() - start, 1)
+
+    # reassignment moves a patient in the heap.
+    start = time.perf_counter()
+    for _ in range(updates):
+        patient = patients[rng.randrange(inpatients)]
+        patient.attending_physician = doctors[rng.randrange(3)]
+        planner.handle([events.PhysicianChanged(patient, None, patient.attending_physician)])
+    report('planner: physician changes', time.perf_counter() - start, updates)
+
+
+@benchmark('render')
+def bench_render(bills: int = 2_000, charges: int = 50, refreshes: int = 10):
+    from main import render_cache
+
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    screen = []
+    for _ in range(bills):
+        bill = BillType(PatientType('Chis', 'A', 30, DateType(1990, 1, 1), doctor, DateType(2022, 4, 1)))
+        bill.add_charges([ChargeHistoryItem.from_trusted(22, 'room', 'night') for _ in range(charges)])
+        screen.append(bill)
+
+    # a UI refresh prints every bill on screen; one bill changes between refreshes.
+    for label, maxsize in (('no cache', 0), ('render cache', 4096)):
+        render_cache.maxsize = maxsize
+        render_cache.clear()
+        start = time.perf_counter()
+        for refresh in range(refreshes):
+            screen[refresh].add_charge(10, 'medicine')
+            for bill in screen:
+                str(bill)
+        report(f'{label}: refresh {bills:,} bills', time.perf_counter() - start, refreshes)
+    render_cache.maxsize = 4096
+
+
+@benchmark('catalog')
+def bench_catalog(tenants: int = 500, categories: int = 40, posts: int = 50_000):
+    from catalog import CatalogRegistry
+
+    def letters(number: int) -> str:
+        return ''.join(chr(ord('a') + int(digit)) for digit in str(number))
+
+    catalogs = {
+        f'hospital{tenant}': {f'{letters(tenant)}x{letters(index)}': 10 + index for index in range(categories)}
+        for tenant in range(tenants)
+    }
+    registry = CatalogRegistry(catalogs)
+    rng = random.Random(7)
+    names = list(catalogs)
+    picks = [
+        (name, list(catalogs[name])[rng.randrange(categories)])
+        for name in (names[rng.randrange(tenants)] for _ in range(posts))
+    ]
+
+    # before: every hospital's categories in the one shared list.
+    shared = ChargeHistoryItem.categories
+    ChargeHistoryItem.categories = shared + [category for prices in catalogs.values() for category in prices]
+    try:
+        sample = picks[:posts // 50]
+        start = time.perf_counter()
+        for _, category in sample:
+            ChargeHistoryItem(10, category)
+        report(f'shared list ({len(ChargeHistoryItem.categories):,} categories)', time.perf_counter() - start, len(sample))
+    finally:
+        ChargeHistoryItem.categories = shared
+
+    bills = {name: BillType(sample_patient()) for name in names}
+    for name, bill in bills.items():
+        bill.catalog = registry.tenant(name)
+
+    def post(label: str):
+        latencies = []
+        for name, category in picks:
+            start = time.perf_counter()
+            bills[name].add_charge(10, category)
+            latencies.append(time.perf_counter() - start)
+        report(label, sum(latencies), posts)
+        report_latency(label, latencies)
+
+    post(f'tenant catalogs ({tenants} tenants)')
+
+    # every tenant is reloaded again and again while charges are posted.
+    stop, reloads = threading.Event(), [0]
+
+    def reload():
+        while not stop.is_set():
+            registry.bulk_reload(catalogs)
+            reloads[0] += 1
+
+    reloader = threading.Thread(target=reload)
+    reloader.start()
+    try:
+        post('tenant catalogs, bulk reloading')
+    finally:
+        stop.set()
+        reloader.join()
+    print(f'{reloads[0]} bulk reloads of {tenants} tenants during posting')
+
+
+def main(names: list):
+    for name in names or BENCHMARKS:
+        print(f'== {name} ==')
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
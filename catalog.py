@@ -0,0 +1,340 @@
+"""
+Category and price catalog for Hospital management system
+
+This module keeps charge categories and standard prices for each hospital (tenant),
+instead of the one ChargeHistoryItem.categories list shared by every hospital.
+
+A Catalog is an immutable snapshot with a version. The registry replaces snapshots
+(copy-on-write), and readers take the current one with a dict lookup, so validation
+is O(1) and never takes a lock, and a reload never pauses charge posting.
+
+    registry = CatalogRegistry()
+    registry.reload('north', {'room': 220, 'medicine': None})
+    bill.catalog = registry.tenant('north')
+    bill.add_charge(220, 'room')
+"""
+
+import threading
+from types import MappingProxyType
+from typing import Callable, Dict, Iterable, Mapping, Optional
+
+
+def _check_category(category: str):
+    # the same rules as ChargeHistoryItem.add_new_category.
+    # when the value is not str.
+    if not isinstance(category, str):
+        raise TypeError('It must be str.')
+
+    # when the value does not consist of only alphabet.
+    elif not category.isalpha():
+        raise ValueError('It must consist of alphabet.')
+
+
+class Catalog:
+    """
+    This is one version of a tenant's catalog. It is never changed.
+    Categories are matched in any case, like ChargeHistoryItem.validation_category.
+    """
+
+    def __init__(self, tenant: str, prices: Mapping[str, Optional[int]], version: int = 1):
+        """
+        Initialize this class.
+
+        Args:
+            tenant: (str) tenant name.
+            prices: (Mapping[str, Optional[int]]) category -> standard price. None is no standard price.
+            version: (int) version of the catalog.
+        """
+
+        for category in prices:
+            _check_category(category)
+
+        self.__tenant = tenant
+        self.__version = version
+        self.__prices = MappingProxyType({category.lower(): price for category, price in prices.items()})
+
+    def __contains__(self, category: str) -> bool:
+        return isinstance(category, str) and category.lower() in self.__prices
+
+    def __reduce__(self):
+        # the read-only mapping cannot be pickled, e.g. for worker processes.
+        return Catalog, (self.__tenant, dict(self.__prices), self.__version)
+
+    def __len__(self) -> int:
+        return len(self.__prices)
+
+    @property
+    def tenant(self) -> str:
+        """
+        It returns tenant name.
+
+        Returns:
+            (str): __tenant
+        """
+        return self.__tenant
+
+    @property
+    def version(self) -> int:
+        """
+        It returns version. It is increased on every reload of the tenant.
+
+        Returns:
+            (int): __version
+        """
+        return self.__version
+
+    @property
+    def categories(self) -> frozenset:
+        """
+        It returns categories.
+
+        Returns:
+            (frozenset): categories in lower case.
+        """
+        return frozenset(self.__prices)
+
+    @property
+    def prices(self) -> Mapping[str, Optional[int]]:
+        """
+        It returns standard prices.
+
+        Returns:
+            (Mapping[str, Optional[int]]): read-only category -> price.
+        """
+        return self.__prices
+
+    def price(self, category: str) -> Optional[int]:
+        """
+        It returns the standard price of the category.
+
+        Args:
+            category: (str) category.
+
+        Returns:
+            (int|None): the price. None when it has no standard price.
+        """
+
+        self.validate(category)
+        return self.__prices[category.lower()]
+
+    def validate(self, category: str):
+        """
+        Check the category is in this catalog.
+
+        Args:
+            category: (str) category.
+        """
+
+        # when the value is not str.
+        if not isinstance(category, str):
+            raise TypeError('It must be str.')
+
+        # when the value is not in available categories.
+        if category.lower() not in self.__prices:
+            raise ValueError(f'It must be in categories of {self.__tenant};' + ', '.join(self.__prices))
+
+    def validate_categories(self, values: Iterable[str]):
+        """
+        Validate a whole column of categories at once, like ChargeHistoryItem.validate_categories.
+
+        Args:
+            values: (Iterable[str]) categories to validate.
+        """
+
+        checked = set()
+        for index, value in enumerate(values):
+            # when the value is not str.
+            if not isinstance(value, str):
+                raise TypeError(f'It must be str. (index: {index})')
+
+            # when the value is not in available categories.
+            if value not in checked:
+                if value.lower() not in self.__prices:
+                    raise ValueError(
+                        f'It must be in categories of {self.__tenant};{", ".join(self.__prices)} (index: {index})'
+                    )
+                checked.add(value)
+
+    def snapshot(self) -> 'Catalog':
+        """
+        It returns itself, so a Catalog can be used where a TenantCatalog is.
+
+        Returns:
+            (Catalog): self
+        """
+        return self
+
+    def replace(self, prices: Mapping[str, Optional[int]]) -> 'Catalog':
+        """
+        Make the next version with other prices.
+
+        Args:
+            prices: (Mapping[str, Optional[int]]) category -> standard price.
+
+        Returns:
+            (Catalog): new catalog.
+        """
+        return Catalog(self.__tenant, prices, self.__version + 1)
+
+
+class TenantCatalog:
+    """
+    This is a tenant's view of the registry. It always reads the current snapshot,
+    so a bill keeping it sees reloads. It can be set as BillType.catalog.
+    """
+
+    def __init__(self, registry: 'CatalogRegistry', tenant: str):
+        self.__registry = registry
+        self.__tenant = tenant
+
+    @property
+    def tenant(self) -> str:
+        return self.__tenant
+
+    def snapshot(self) -> Catalog:
+        """
+        It returns the current catalog. Use one snapshot for a batch to validate it with one version.
+
+        Returns:
+            (Catalog): the catalog.
+        """
+        return self.__registry[self.__tenant]
+
+    def validate(self, category: str):
+        self.snapshot().validate(category)
+
+    def validate_categories(self, values: Iterable[str]):
+        self.snapshot().validate_categories(values)
+
+    def price(self, category: str) -> Optional[int]:
+        return self.snapshot().price(category)
+
+
+class CatalogRegistry:
+    """
+    This keeps the current catalog of every tenant.
+    Writers take a lock and replace the whole mapping; readers take no lock.
+    """
+
+    def __init__(self, catalogs: Mapping[str, Mapping[str, Optional[int]]] = None):
+        """
+        Initialize this class.
+
+        Args:
+            catalogs: (Mapping[str, Mapping[str, Optional[int]]]|None) tenant -> category -> price.
+        """
+
+        self.__catalogs: Mapping[str, Catalog] = MappingProxyType({})
+        self.__lock = threading.Lock()
+        if catalogs:
+            self.bulk_reload(catalogs)
+
+    def __getitem__(self, tenant: str) -> Catalog:
+        return self.__catalogs[tenant]
+
+    def __contains__(self, tenant: str) -> bool:
+        return tenant in self.__catalogs
+
+    def __len__(self) -> int:
+        return len(self.__catalogs)
+
+    @property
+    def tenants(self) -> Iterable[str]:
+        return list(self.__catalogs)
+
+    def tenant(self, tenant: str) -> TenantCatalog:
+        """
+        It returns a view of the tenant.
+
+        Args:
+            tenant: (str) tenant name. It must be loaded.
+
+        Returns:
+            (TenantCatalog): the view.
+        """
+
+        # when the tenant is not loaded.
+        if tenant not in self.__catalogs:
+            raise KeyError(tenant)
+        return TenantCatalog(self, tenant)
+
+    def reload(self, tenant: str, prices: Mapping[str, Optional[int]]) -> Catalog:
+        """
+        Replace the catalog of one tenant.
+
+        Args:
+            tenant: (str) tenant name.
+            prices: (Mapping[str, Optional[int]]) category -> standard price.
+
+        Returns:
+            (Catalog): new catalog.
+        """
+        return self.bulk_reload({tenant: prices})[tenant]
+
+    def bulk_reload(self, catalogs: Mapping[str, Mapping[str, Optional[int]]]) -> Dict[str, Catalog]:
+        """
+        Replace catalogs of many tenants at once. Readers see every old one or every new one.
+        Catalogs are built before the lock is taken; only the mapping is replaced under it.
+
+        Args:
+            catalogs: (Mapping[str, Mapping[str, Optional[int]]]) tenant -> category -> price.
+
+        Returns:
+            (Dict[str, Catalog]): new catalogs.
+        """
+
+        def build(current):
+            built = {}
+            for tenant, prices in catalogs.items():
+                old = current.get(tenant)
+                built[tenant] = Catalog(tenant, prices, old.version + 1 if old is not None else 1)
+            return built
+
+        return self.__swap(build)
+
+    def add_category(self, tenant: str, category: str, price: int = None) -> Catalog:
+        """
+        Add a category to one tenant only, unlike ChargeHistoryItem.add_new_category.
+
+        Args:
+            tenant: (str) tenant name.
+            category: (str) new category.
+            price: (int|None) standard price.
+
+        Returns:
+            (Catalog): new catalog.
+        """
+
+        _check_category(category)
+
+        def build(current):
+            old = current[tenant]
+            return {tenant: old.replace({**old.prices, category.lower(): price})}
+
+        return self.__swap(build)[tenant]
+
+    def remove(self, tenant: str):
+        """
+        Remove a tenant.
+
+        Args:
+            tenant: (str) tenant name.
+        """
+
+        with self.__lock:
+            current = dict(self.__catalogs)
+            del current[tenant]
+            self.__catalogs = MappingProxyType(current)
+
+    def __swap(self, build: Callable[[Mapping[str, Catalog]], Dict[str, Catalog]]) -> Dict[str, Catalog]:
+        # build the next catalogs from the current ones without the lock, then take the lock
+        # only to check nothing was replaced meanwhile and to swap references; otherwise build again.
+        while True:
+            current = self.__catalogs
+            built = build(current)
+            following = MappingProxyType({**current, **built})
+            with self.__lock:
+                if self.__catalogs is current:
+                    # one assignment publishes every tenant.
+                    self.__catalogs = following
+                    return built
@@ -0,0 +1,371 @@
+"""
+Duplicate patient detection for Hospital management system
+
+This module includes a blocking index for checking a new patient at admission,
+and a batch deduplication for a whole import file.
+
+Only patients sharing a blocking key (phonetic names + birthday or birth year)
+are compared, so a lookup costs the size of a few blocks, not the number of patients.
+"""
+
+import os
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from main import PatientType
+
+# soundex digit of each letter. Vowels, h, w and y have no digit.
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+class PatientRecord(NamedTuple):
+    """
+    This is the part of a patient used for matching. It is small and picklable for workers.
+    """
+
+    id: int
+    first_name: str  # normalized
+    last_name: str  # normalized
+    birthday: int  # ordinal
+
+    @classmethod
+    def of(cls, patient: PatientType) -> 'PatientRecord':
+        """
+        Make a record of the patient.
+
+        Args:
+            patient: (PatientType) the patient.
+
+        Returns:
+            (PatientRecord): the record.
+        """
+
+        return cls(
+            patient.id,
+            normalize_name(patient.first_name),
+            normalize_name(patient.last_name),
+            patient.birthday.toordinal(),
+        )
+
+
+def normalize_name(name: str) -> str:
+    """
+    Lower the name and remove accents and every non-alphabet character.
+
+    Args:
+        name: (str) name.
+
+    Returns:
+        (str): normalized name. e.g. "O'Brien" -> 'obrien', 'Jérôme' -> 'jerome'
+    """
+
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    return ''.join(char for char in decomposed if char.isalpha() and not unicodedata.combining(char))
+
+
+def soundex(name: str) -> str:
+    """
+    Calculate American Soundex of the normalized name.
+
+    Args:
+        name: (str) normalized name.
+
+    Returns:
+        (str): 4 characters code. e.g. 'robert' -> 'R163'. It is '' for ''.
+    """
+
+    if not name:
+        return ''
+
+    code = name[0].upper()
+    last = _SOUNDEX_CODES.get(name[0], '')
+    for char in name[1:]:
+        digit = _SOUNDEX_CODES.get(char, '')
+
+        # same digits separated by h or w are coded once.
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+
+        if char not in 'hw':
+            last = digit
+
+    return code.ljust(4, '0')
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    """
+    Calculate Jaro-Winkler similarity.
+
+    Args:
+        a: (str) first string.
+        b: (str) second string.
+
+    Returns:
+        (float): 1.0 is same, 0.0 is completely different.
+    """
+
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    matched_b = [False] * len(b)
+    matches_a = []
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not matched_b[j] and b[j] == char:
+                matched_b[j] = True
+                matches_a.append(char)
+                break
+
+    if not matches_a:
+        return 0.0
+
+    matches_b = [char for char, matched in zip(b, matched_b) if matched]
+    transpositions = sum(x != y for x, y in zip(matches_a, matches_b)) / 2
+    m = len(matches_a)
+    jaro = (m / len(a) + m / len(b) + (m - transpositions) / m) / 3
+
+    # common prefix up to 4 characters boosts the similarity.
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def blocking_keys(record: PatientRecord) -> List[tuple]:
+    """
+    Make blocking keys of the record.
+    Two records are candidates if they share any key.
+
+    Args:
+        record: (PatientRecord) the record.
+
+    Returns:
+        (List[tuple]): blocking keys.
+    """
+
+    first, last = soundex(record.first_name), soundex(record.last_name)
+    year = (record.birthday - 1) // 365  # close enough to the birth year for blocking.
+    return [
+        # same birthday, and a phonetically same name.
+        ('last', last, record.birthday),
+        ('first', first, record.birthday),
+        # phonetically same names, but a typo in birthday.
+        ('names', min(first, last), max(first, last), year),
+    ]
+
+
+def score(a: PatientRecord, b: PatientRecord) -> float:
+    """
+    Calculate how likely the two records are the same patient.
+    Swapped first and last names are also considered.
+
+    Args:
+        a: (PatientRecord) first record.
+        b: (PatientRecord) second record.
+
+    Returns:
+        (float): 0.0 ~ 1.0
+    """
+
+    names = max(
+        (jaro_winkler(a.first_name, b.first_name) + jaro_winkler(a.last_name, b.last_name)) / 2,
+        (jaro_winkler(a.first_name, b.last_name) + jaro_winkler(a.last_name, b.first_name)) / 2,
+    )
+
+    if a.birthday == b.birthday:
+        birthday = 1.0
+    elif abs(a.birthday - b.birthday) <= 31:
+        birthday = 0.5
+    else:
+        birthday = 0.0
+
+    return 0.8 * names + 0.2 * birthday
+
+
+class DuplicateIndex:
+    """
+    This is a blocking index of patients for admission checks.
+    """
+
+    def __init__(self, patients: Iterable[PatientType] = ()):
+        """
+        Initialize this class.
+
+        Args:
+            patients: (Iterable[PatientType]) patients to add first.
+        """
+
+        self.__records: Dict[int, PatientRecord] = {}
+        self.__blocks: Dict[tuple, Set[int]] = {}
+
+        for patient in patients:
+            self.add(patient)
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def add(self, patient: PatientType):
+        """
+        Add the patient. If the id is already added, it is replaced.
+
+        Args:
+            patient: (PatientType) the patient.
+        """
+
+        self.remove(patient.id)
+
+        record = PatientRecord.of(patient)
+        self.__records[record.id] = record
+        for key in blocking_keys(record):
+            self.__blocks.setdefault(key, set()).add(record.id)
+
+    def remove(self, patient_id: int):
+        """
+        Remove the patient. Nothing happens if it is not added.
+
+        Args:
+            patient_id: (int) id of the patient.
+        """
+
+        record = self.__records.pop(patient_id, None)
+        if record is None:
+            return
+
+        for key in blocking_keys(record):
+            block = self.__blocks[key]
+            block.discard(patient_id)
+            if not block:
+                del self.__blocks[key]
+
+    def candidates(self, patient: PatientType) -> Set[int]:
+        """
+        Find ids sharing a blocking key with the patient.
+
+        Args:
+            patient: (PatientType) the patient.
+
+        Returns:
+            (Set[int]): candidate ids, except the patient's own id.
+        """
+
+        found = set()
+        for key in blocking_keys(PatientRecord.of(patient)):
+            found.update(self.__blocks.get(key, ()))
+
+        found.discard(patient.id)
+        return found
+
+    def match(self, patient: PatientType, threshold: float = 0.9, limit: int = 5) -> List[Tuple[float, int]]:
+        """
+        Score candidates and return likely duplicates.
+
+        Args:
+            patient: (PatientType) the patient.
+            threshold: (float) minimum score.
+            limit: (int) max number of results.
+
+        Returns:
+            (List[Tuple[float, int]]): (score, id) in descending score.
+        """
+
+        record = PatientRecord.of(patient)
+        scored = [
+            (score(record, self.__records[candidate]), candidate)
+            for candidate in self.candidates(patient)
+        ]
+        return sorted((item for item in scored if item[0] >= threshold), reverse=True)[:limit]
+
+
+def _score_pairs(pairs: List[Tuple[PatientRecord, PatientRecord]], threshold: float) -> List[Tuple[float, int, int]]:
+    result = []
+    for a, b in pairs:
+        value = score(a, b)
+        if value >= threshold:
+            result.append((value, a.id, b.id))
+    return result
+
+
+def deduplicate(
+        patients: Iterable[PatientType],
+        threshold: float = 0.9,
+        workers: int = None,
+        max_block: int = 1000,
+        chunk_size: int = 10000
+) -> List[List[int]]:
+    """
+    Find groups of duplicates in a whole import file.
+    Candidate pairs are scored in worker processes.
+
+    Args:
+        patients: (Iterable[PatientType]) patients.
+        threshold: (float) minimum score for a duplicate pair.
+        workers: (int|None) number of processes. None is cpu count, 1 scores in this process.
+        max_block: (int) blocks bigger than this are skipped, because they are too common to be useful.
+        chunk_size: (int) pairs per task.
+
+    Returns:
+        (List[List[int]]): groups of ids (2 or more), sorted.
+    """
+
+    records = [PatientRecord.of(patient) for patient in patients]
+
+    blocks: Dict[tuple, List[PatientRecord]] = {}
+    for record in records:
+        for key in blocking_keys(record):
+            blocks.setdefault(key, []).append(record)
+
+    # a pair can share several keys, so pairs are collected once.
+    pairs = {}
+    for block in blocks.values():
+        if len(block) > max_block:
+            continue
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                if a.id != b.id:
+                    pairs[(a.id, b.id) if a.id < b.id else (b.id, a.id)] = (a, b)
+
+    pairs = list(pairs.values())
+    chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        results = [_score_pairs(chunk, threshold) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_score_pairs, chunks, [threshold] * len(chunks)))
+
+    # union-find over duplicate pairs.
+    parents = {}
+
+    def find(x):
+        parents.setdefault(x, x)
+        while parents[x] != x:
+            parents[x] = parents[parents[x]]
+            x = parents[x]
+        return x
+
+    for result in results:
+        for _, a, b in result:
+            parents[find(a)] = find(b)
+
+    groups = {}
+    for x in parents:
+        groups.setdefault(find(x), []).append(x)
+
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
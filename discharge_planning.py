@@ -0,0 +1,315 @@
+"""
+Discharge planning for Hospital management system
+
+This module keeps open stays in a priority queue by expected discharge date,
+for bed turnover planning: who leaves next, and whose stay is longer than expected.
+
+The expected discharge is the scheduled discharged_date when it is set, or else
+admitted_date + the expected length of stay of the attending physician's speciality.
+Like census and archiving, a patient is in hospital until the day of discharged_date:
+a discharge scheduled after today keeps the patient in the queue under that date, and
+the patient leaves the queue once the date is today or earlier (see release).
+It is kept up to date from events:
+- DischargedDateChanged: the patient is re-keyed to the scheduled date, or leaves the queue.
+- PhysicianChanged: the speciality can change, so the expected date is computed again.
+
+The queue is an indexed binary heap, so an update is O(log n) and a query
+reads only the part of the heap it returns.
+"""
+
+import threading
+from heapq import heappop, heappush
+from typing import Dict, List, NamedTuple, Tuple
+
+from main import DateType, PatientType
+from events import EventBus, Subscription, DischargedDateChanged, PhysicianChanged
+
+
+def _left(patient: PatientType, today: int) -> bool:
+    # a patient is in hospital until the day of discharged_date.
+    return patient.discharged_date is not None and patient.discharged_date.toordinal() <= today
+
+
+class ExpectedDischarge(NamedTuple):
+    """
+    This is a patient with the expected discharge date.
+    """
+
+    patient: PatientType
+    expected: DateType
+
+
+class DischargePlanner:
+    """
+    This is the priority queue of open stays.
+    """
+
+    def __init__(self, expected_stay: Dict[str, int] = None, default_stay: int = 3):
+        """
+        Initialize this class.
+
+        Args:
+            expected_stay: (Dict[str, int]|None) speciality -> expected length of stay in days.
+            default_stay: (int) days for other specialities.
+        """
+
+        self.__expected_stay = dict(expected_stay or {})
+        self.__default_stay = default_stay
+        self.__lock = threading.RLock()
+
+        # heap of (expected ordinal, patient id), and where each id is in it.
+        self.__heap: List[Tuple[int, int]] = []
+        self.__positions: Dict[int, int] = {}
+        self.__patients: Dict[int, PatientType] = {}
+
+    def __len__(self) -> int:
+        return len(self.__heap)
+
+    def __contains__(self, patient: PatientType) -> bool:
+        return patient.id in self.__positions
+
+    def expected_stay(self, speciality: str) -> int:
+        """
+        It returns the expected length of stay.
+
+        Args:
+            speciality: (str) speciality.
+
+        Returns:
+            (int): days.
+        """
+        return self.__expected_stay.get(speciality, self.__default_stay)
+
+    def set_expected_stay(self, speciality: str, days: int):
+        """
+        Change the expected length of stay. Patients of the speciality are updated.
+
+        Args:
+            speciality: (str) speciality.
+            days: (int) days.
+        """
+
+        # when the value is not int.
+        if not isinstance(days, int):
+            raise TypeError('It must be int.')
+
+        with self.__lock:
+            self.__expected_stay[speciality] = days
+            for patient in list(self.__patients.values()):
+                if patient.attending_physician.speciality == speciality:
+                    self.__update(patient)
+
+    def expected(self, patient: PatientType) -> DateType:
+        """
+        It returns the expected discharge date of the patient in the queue.
+
+        Args:
+            patient: (PatientType) the patient.
+
+        Returns:
+            (DateType): expected discharge date.
+        """
+        return DateType.fromordinal(self.__heap[self.__positions[patient.id]][0])
+
+    def add(self, patient: PatientType, today: DateType = None):
+        """
+        Add a stay. A patient discharged on or before today is ignored. A patient already in the queue is updated.
+
+        Args:
+            patient: (PatientType) the patient.
+            today: (DateType|None) the day. None is today.
+        """
+
+        with self.__lock:
+            if _left(patient, (today or DateType.today()).toordinal()):
+                self.remove(patient)
+            else:
+                self.__patients[patient.id] = patient
+                self.__update(patient)
+
+    def remove(self, patient: PatientType):
+        """
+        Remove the patient, if it is in the queue.
+
+        Args:
+            patient: (PatientType) the patient.
+        """
+
+        with self.__lock:
+            position = self.__positions.pop(patient.id, None)
+            if position is None:
+                return
+            del self.__patients[patient.id]
+
+            last = self.__heap.pop()
+            if position < len(self.__heap):
+                self.__heap[position] = last
+                self.__positions[last[1]] = position
+                self.__sift_down(position)
+                self.__sift_up(self.__positions[last[1]])
+
+    def release(self, today: DateType = None) -> int:
+        """
+        Remove patients whose scheduled discharge is today or earlier, e.g. every night.
+        They are at the top of the heap, so only they are visited.
+
+        Args:
+            today: (DateType|None) the day. None is today.
+
+        Returns:
+            (int): number of removed patients.
+        """
+
+        today = (today or DateType.today()).toordinal()
+
+        with self.__lock:
+            heap, leaving = self.__heap, []
+            stack = [0] if heap else []
+            while stack:
+                position = stack.pop()
+                if position >= len(heap) or heap[position][0] > today:
+                    continue
+                patient = self.__patients[heap[position][1]]
+                if _left(patient, today):
+                    leaving.append(patient)
+                stack.extend((2 * position + 1, 2 * position + 2))
+
+            for patient in leaving:
+                self.remove(patient)
+            return len(leaving)
+
+    def subscribe(self, bus: EventBus) -> Subscription:
+        """
+        Follow changes of patients from the bus.
+
+        Args:
+            bus: (EventBus) the bus patients publish to.
+
+        Returns:
+            (Subscription): the subscription, for EventBus.unsubscribe.
+        """
+        return bus.subscribe(self.handle)
+
+    def handle(self, events: List):
+        """
+        Apply a batch of events.
+
+        Args:
+            events: (List) events.
+        """
+
+        with self.__lock:
+            for event in events:
+                if isinstance(event, DischargedDateChanged):
+                    self.add(event.patient)
+                elif isinstance(event, PhysicianChanged) and event.patient.id in self.__positions:
+                    self.__update(event.patient)
+
+    def next_k(self, k: int, today: DateType = None) -> List[ExpectedDischarge]:
+        """
+        It returns the k patients expected to leave first.
+        Patients already left by their discharged_date, before release, are skipped.
+        Only the heap nodes near the top are visited, O(k log k).
+
+        Args:
+            k: (int) number of patients.
+            today: (DateType|None) the day. None is today.
+
+        Returns:
+            (List[ExpectedDischarge]): patients by expected date.
+        """
+
+        today = (today or DateType.today()).toordinal()
+
+        with self.__lock:
+            heap, result = self.__heap, []
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier and len(result) < k:
+                (ordinal, patient_id), position = heappop(frontier)
+                patient = self.__patients[patient_id]
+                if not _left(patient, today):
+                    result.append(ExpectedDischarge(patient, DateType.fromordinal(ordinal)))
+                for child in (2 * position + 1, 2 * position + 2):
+                    if child < len(heap):
+                        heappush(frontier, (heap[child], child))
+            return result
+
+    def overdue(self, today: DateType = None) -> List[ExpectedDischarge]:
+        """
+        It returns patients staying longer than expected, the longest first.
+        A patient with a scheduled discharge is never overdue: it is under that date until it leaves.
+        A subtree is skipped as soon as its top is not overdue, so it is O(k log k) for k results.
+
+        Args:
+            today: (DateType|None) the day. None is today.
+
+        Returns:
+            (List[ExpectedDischarge]): patients whose expected date is before today.
+        """
+
+        today = (today or DateType.today()).toordinal()
+
+        with self.__lock:
+            heap, found = self.__heap, []
+            stack = [0] if heap else []
+            while stack:
+                position = stack.pop()
+                if position >= len(heap) or heap[position][0] >= today:
+                    continue
+                if self.__patients[heap[position][1]].discharged_date is None:
+                    found.append(heap[position])
+                stack.extend((2 * position + 1, 2 * position + 2))
+
+            return [
+                ExpectedDischarge(self.__patients[patient_id], DateType.fromordinal(ordinal))
+                for ordinal, patient_id in sorted(found)
+            ]
+
+    def __update(self, patient: PatientType):
+        scheduled = patient.discharged_date
+        if scheduled is not None:
+            key = (scheduled.toordinal(), patient.id)
+        else:
+            key = (
+                patient.admitted_date.toordinal() + self.expected_stay(patient.attending_physician.speciality),
+                patient.id,
+            )
+        position = self.__positions.get(patient.id)
+        if position is None:
+            self.__heap.append(key)
+            position = self.__positions[patient.id] = len(self.__heap) - 1
+        else:
+            self.__heap[position] = key
+            self.__sift_down(position)
+            position = self.__positions[patient.id]
+        self.__sift_up(position)
+
+    def __sift_up(self, position: int):
+        heap, positions = self.__heap, self.__positions
+        item = heap[position]
+        while position > 0:
+            parent = (position - 1) // 2
+            if heap[parent] <= item:
+                break
+            heap[position] = heap[parent]
+            positions[heap[position][1]] = position
+            position = parent
+        heap[position] = item
+        positions[item[1]] = position
+
+    def __sift_down(self, position: int):
+        heap, positions = self.__heap, self.__positions
+        item, size = heap[position], len(heap)
+        while True:
+            child = 2 * position + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if item <= heap[child]:
+                break
+            heap[position] = heap[child]
+            positions[heap[position][1]] = position
+            position = child
+        heap[position] = item
+        positions[item[1]] = position
@@ -0,0 +1,404 @@
+"""
+Change events for Hospital management system
+
+This module includes typed mutation events and an opt-in event bus.
+Nothing is published until an EventBus is set on the classes:
+
+    bus = EventBus()
+    PatientType.event_bus = bus
+    BillType.event_bus = bus
+"""
+
+import threading
+from collections import deque
+from typing import Any, Callable, List, NamedTuple
+
+
+class ChargeAdded(NamedTuple):
+    """
+    It is published by BillType.add_charge.
+    """
+
+    bill: Any  # BillType
+    index: int
+    charge: Any  # ChargeHistoryItem
+
+
+class ChargeRemoved(NamedTuple):
+    """
+    It is published by BillType.remove_charge.
+    """
+
+    bill: Any  # BillType
+    index: int
+    charge: Any  # ChargeHistoryItem
+
+
+class DischargedDateChanged(NamedTuple):
+    """
+    It is published by the discharged_date setter and update_discharged_date_as_today.
+    """
+
+    patient: Any  # PatientType
+    old: Any  # DateType|None
+    new: Any  # DateType
+
+
+class PhysicianChanged(NamedTuple):
+    """
+    It is published by the attending_physician setter.
+    """
+
+    patient: Any  # PatientType
+    old: Any  # DoctorType
+    new: Any  # DoctorType
+
+
+class Backpressure(Exception):
+    """
+    It is raised to a publisher when a bounded queue cannot take more events.
+    """
+
+
+class Subscription:
+    """
+    This is a synchronous subscriber.
+    Events are buffered and the handler is called with a list of events
+    when batch_size events are collected or flush() is called.
+    If the handler raises, its batch is lost and needs_resync is set.
+    """
+
+    def __init__(self, handler: Callable[[List], None], batch_size: int = 1):
+        """
+        Initialize this class.
+
+        Args:
+            handler: (Callable[[List], None]) it receives a batch of events.
+            batch_size: (int) number of events for one call.
+        """
+
+        if batch_size < 1:
+            raise ValueError('It must be positive.')
+
+        self.__handler = handler
+        self.__batch_size = batch_size
+        self.__buffer = []
+        self.__lock = threading.Lock()
+        self.__needs_resync = False
+
+    @property
+    def needs_resync(self) -> bool:
+        """
+        It returns whether events were lost. A view built from the events must be rebuilt, then call resynced().
+
+        Returns:
+            (bool): __needs_resync
+        """
+        return self.__needs_resync
+
+    def resynced(self):
+        """
+        Clear needs_resync after the view is rebuilt.
+        """
+        self.__needs_resync = False
+
+    def __handle(self, batch: List):
+        try:
+            self.__handler(batch)
+        except Exception:
+            self.__needs_resync = True
+            raise
+
+    def deliver(self, event):
+        """
+        Buffer the event, and call the handler when the batch is full.
+
+        Args:
+            event: one of event types.
+        """
+
+        with self.__lock:
+            self.__buffer.append(event)
+            if len(self.__buffer) < self.__batch_size:
+                return
+            batch, self.__buffer = self.__buffer, []
+
+        self.__handle(batch)
+
+    def flush(self):
+        """
+        Call the handler with buffered events even if the batch is not full.
+        """
+
+        with self.__lock:
+            batch, self.__buffer = self.__buffer, []
+
+        if batch:
+            self.__handle(batch)
+
+
+class EventQueue:
+    """
+    This is a bounded queue subscriber for consumers in other threads.
+
+    When the queue is full, overflow decides what happens to the publisher:
+    - 'block': wait until the consumer takes events (Backpressure after timeout).
+    - 'error': raise Backpressure immediately.
+    - 'drop': drop the new event and count it.
+    Whenever an event is not taken, needs_resync is set: a consumer must check it
+    before trusting a view built from the events.
+    """
+
+    overflows = ('block', 'error', 'drop')
+
+    def __init__(self, maxsize: int = 1024, overflow: str = 'block', timeout: float = None):
+        """
+        Initialize this class.
+
+        Args:
+            maxsize: (int) capacity of the queue.
+            overflow: (str) one of overflows.
+            timeout: (float|None) max seconds to block the publisher. None is forever.
+        """
+
+        if maxsize < 1:
+            raise ValueError('It must be positive.')
+
+        if overflow not in self.overflows:
+            raise ValueError('It must be in overflows;' + ', '.join(self.overflows))
+
+        self.__maxsize = maxsize
+        self.__overflow = overflow
+        self.__timeout = timeout
+        self.__events = deque()
+        self.__dropped = 0
+        self.__needs_resync = False
+        self.__condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.__events)
+
+    @property
+    def dropped(self) -> int:
+        """
+        It returns the number of dropped events.
+
+        Returns:
+            (int): __dropped
+        """
+        return self.__dropped
+
+    @property
+    def needs_resync(self) -> bool:
+        """
+        It returns whether events were dropped or rejected. A view built from the events must be rebuilt,
+        then call resynced().
+
+        Returns:
+            (bool): __needs_resync
+        """
+        return self.__needs_resync
+
+    def resynced(self):
+        """
+        Clear needs_resync after the view is rebuilt.
+        """
+        self.__needs_resync = False
+
+    def deliver(self, event):
+        """
+        Put the event in the queue, following the overflow policy.
+
+        Args:
+            event: one of event types.
+        """
+
+        with self.__condition:
+            if len(self.__events) >= self.__maxsize:
+                if self.__overflow == 'drop':
+                    self.__dropped += 1
+                    self.__needs_resync = True
+                    return
+
+                # 'error', or 'block' which ran out of time.
+                if self.__overflow == 'error' or not self.__condition.wait_for(
+                        lambda: len(self.__events) < self.__maxsize, self.__timeout
+                ):
+                    self.__needs_resync = True
+                    raise Backpressure(f'Event queue is full. ({self.__maxsize})')
+
+            self.__events.append(event)
+            self.__condition.notify_all()
+
+    def flush(self):
+        """
+        Nothing to do. Events are visible as soon as they are delivered.
+        """
+
+    def get_batch(self, max_items: int = 256, timeout: float = None) -> List:
+        """
+        Take up to max_items events.
+        It waits until at least one event arrives.
+
+        Args:
+            max_items: (int) max number of events.
+            timeout: (float|None) max seconds to wait. None is forever.
+
+        Returns:
+            (List): events in published order. It is empty after timeout.
+        """
+
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.__events, timeout):
+                return []
+
+            count = min(max_items, len(self.__events))
+            batch = [self.__events.popleft() for _ in range(count)]
+
+            # wake blocked publishers.
+            self.__condition.notify_all()
+            return batch
+
+    def drain(self) -> List:
+        """
+        Take every event without waiting.
+
+        Returns:
+            (List): events in published order.
+        """
+
+        with self.__condition:
+            batch = list(self.__events)
+            self.__events.clear()
+            self.__condition.notify_all()
+            return batch
+
+
+class EventBus:
+    """
+    This publishes events to subscribers.
+    Subscribers are kept in a tuple which is replaced on change,
+    so publish() does not take any lock.
+
+    Events are published after the change is applied, so an error of a subscriber
+    (Backpressure of a full queue, or an exception of a handler) never reaches the writer:
+    the writer would think the change failed and post it again. It is recorded in
+    failed and failures instead, and the other subscribers still get the event.
+    The subscriber which lost the event has needs_resync set, so its consumer knows
+    its view must be rebuilt.
+    """
+
+    def __init__(self, window: int = 100):
+        """
+        Initialize this class.
+
+        Args:
+            window: (int) number of recent failures to keep.
+        """
+
+        self.__subscribers = ()
+        self.__lock = threading.Lock()
+        self.__failed = 0
+        self.__failures = deque(maxlen=window)
+
+    @property
+    def failed(self) -> int:
+        """
+        It returns the number of deliveries which failed.
+
+        Returns:
+            (int): __failed
+        """
+        return self.__failed
+
+    @property
+    def failures(self) -> List[tuple]:
+        """
+        It returns recent failed deliveries.
+
+        Returns:
+            (List[tuple]): (subscriber, event, error) from the oldest.
+        """
+        with self.__lock:
+            return list(self.__failures)
+
+    def subscribe(self, handler: Callable[[List], None], batch_size: int = 1) -> Subscription:
+        """
+        Add a synchronous subscriber.
+
+        Args:
+            handler: (Callable[[List], None]) it receives a batch of events.
+            batch_size: (int) number of events for one call.
+
+        Returns:
+            (Subscription): new subscriber.
+        """
+
+        return self.add(Subscription(handler, batch_size))
+
+    def subscribe_queue(self, maxsize: int = 1024, overflow: str = 'block', timeout: float = None) -> EventQueue:
+        """
+        Add a bounded queue subscriber.
+
+        Args:
+            maxsize: (int) capacity of the queue.
+            overflow: (str) one of EventQueue.overflows.
+            timeout: (float|None) max seconds to block the publisher.
+
+        Returns:
+            (EventQueue): new subscriber.
+        """
+
+        return self.add(EventQueue(maxsize, overflow, timeout))
+
+    def add(self, subscriber):
+        """
+        Add a subscriber which has deliver() and flush().
+
+        Args:
+            subscriber: (Subscription|EventQueue) new subscriber.
+
+        Returns:
+            the subscriber.
+        """
+
+        with self.__lock:
+            self.__subscribers = self.__subscribers + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Remove a subscriber. Buffered events are flushed first.
+
+        Args:
+            subscriber: (Subscription|EventQueue) subscriber to remove.
+        """
+
+        with self.__lock:
+            self.__subscribers = tuple(s for s in self.__subscribers if s is not subscriber)
+        subscriber.flush()
+
+    def publish(self, event):
+        """
+        Deliver the event to every subscriber.
+
+        Args:
+            event: one of event types.
+        """
+
+        for subscriber in self.__subscribers:
+            try:
+                subscriber.deliver(event)
+            except Exception as error:
+                with self.__lock:
+                    self.__failed += 1
+                    self.__failures.append((subscriber, event, error))
+
+    def flush(self):
+        """
+        Flush buffered events of every subscriber.
+        """
+
+        for subscriber in self.__subscribers:
+            subscriber.flush()
+
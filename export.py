@@ -0,0 +1,428 @@
+"""
+Columnar export for Hospital management system
+
+This module writes patients and charges as columns, chunk by chunk,
+and reads them back without copying.
+
+- If pyarrow is installed, every table is one Arrow IPC file ({name}.arrow).
+- Otherwise every column is one .npy file ({name}/{column}.npy).
+  They are written with the standard library, so numpy is not required to export,
+  and numpy.load(path, mmap_mode='r') can open them.
+
+Tables:
+- patients: id, first_name, last_name, age, birthday, admitted_date, discharged_date, physician
+  (dates are ordinals, discharged_date is -1 if None, physician is a row of doctors)
+- doctors: speciality, first_name, last_name
+- charges: bill_id (patient id of the bill), cost, category (a row of categories)
+- categories: name
+"""
+
+import ast
+import mmap
+import os
+import sys
+from array import array
+from typing import Dict, Iterable, List
+
+from main import PatientType, ChargeHistoryItem, BillType
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# column type -> (array typecode, npy descr)
+_NUMERIC_TYPES = {
+    'int64': ('q', '<i8'),
+    'int32': ('i', '<i4'),
+    'int16': ('h', '<i2'),
+    'uint8': ('B', '|u1'),
+}
+
+# column types of each table.
+SCHEMAS = {
+    'patients': {
+        'id': 'int64',
+        'first_name': 'utf8',
+        'last_name': 'utf8',
+        'age': 'int32',
+        'birthday': 'int32',
+        'admitted_date': 'int32',
+        'discharged_date': 'int32',
+        'physician': 'int32',
+    },
+    'doctors': {
+        'speciality': 'utf8',
+        'first_name': 'utf8',
+        'last_name': 'utf8',
+    },
+    'charges': {
+        'bill_id': 'int64',
+        'cost': 'int64',
+        'category': 'int16',
+    },
+    'categories': {
+        'name': 'utf8',
+    },
+}
+
+# total size of npy magic and header. It is reserved first and filled when the shape is known.
+_NPY_HEADER_SIZE = 128
+
+
+def default_format() -> str:
+    """
+    It returns 'arrow' if pyarrow is installed, otherwise 'npy'.
+
+    Returns:
+        (str): export format.
+    """
+
+    return 'arrow' if pa is not None else 'npy'
+
+
+class _NpyColumnWriter:
+    """
+    This appends values to one .npy file.
+    The header is rewritten with the final shape when it is closed.
+    """
+
+    def __init__(self, path: str, column_type: str):
+        self.__typecode, self.__descr = _NUMERIC_TYPES[column_type]
+        self.__file = open(path, 'wb')
+        self.__file.write(b'\0' * _NPY_HEADER_SIZE)
+        self.__count = 0
+
+    def write(self, values):
+        data = values if isinstance(values, array) else array(self.__typecode, values)
+
+        # npy columns are little endian.
+        if sys.byteorder == 'big':
+            data.byteswap()
+
+        data.tofile(self.__file)
+        self.__count += len(data)
+
+    def close(self):
+        header = f"{{'descr': '{self.__descr}', 'fortran_order': False, 'shape': ({self.__count},), }}"
+        header = header.ljust(_NPY_HEADER_SIZE - 10 - 1) + '\n'
+
+        self.__file.seek(0)
+        self.__file.write(b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header.encode('latin1'))
+        self.__file.close()
+
+
+class _NpyTableWriter:
+    """
+    This writes a table as .npy columns in a directory.
+    A utf8 column is two files: {column}.data.npy (bytes) and {column}.offsets.npy (n + 1 offsets).
+    """
+
+    def __init__(self, directory: str, schema: Dict[str, str]):
+        os.makedirs(directory, exist_ok=True)
+
+        self.__schema = schema
+        self.__writers = {}
+        self.__offsets = {}
+        for name, column_type in schema.items():
+            if column_type == 'utf8':
+                self.__writers[name] = (
+                    _NpyColumnWriter(os.path.join(directory, f'{name}.data.npy'), 'uint8'),
+                    _NpyColumnWriter(os.path.join(directory, f'{name}.offsets.npy'), 'int64'),
+                )
+                self.__writers[name][1].write([0])
+                self.__offsets[name] = 0
+            else:
+                self.__writers[name] = _NpyColumnWriter(os.path.join(directory, f'{name}.npy'), column_type)
+
+    def write(self, columns: Dict[str, list]):
+        for name, column_type in self.__schema.items():
+            if column_type != 'utf8':
+                self.__writers[name].write(columns[name])
+                continue
+
+            data, offsets = array('B'), array('q')
+            end = self.__offsets[name]
+            for value in columns[name]:
+                encoded = value.encode('utf-8')
+                data.frombytes(encoded)
+                end += len(encoded)
+                offsets.append(end)
+
+            self.__offsets[name] = end
+            self.__writers[name][0].write(data)
+            self.__writers[name][1].write(offsets)
+
+    def close(self):
+        for writer in self.__writers.values():
+            if isinstance(writer, tuple):
+                for part in writer:
+                    part.close()
+            else:
+                writer.close()
+
+
+class _ArrowTableWriter:
+    """
+    This writes a table as one Arrow IPC file, one record batch per chunk.
+    """
+
+    def __init__(self, path: str, schema: Dict[str, str]):
+        self.__schema = pa.schema([
+            (name, pa.string() if column_type == 'utf8' else getattr(pa, column_type)())
+            for name, column_type in schema.items()
+        ])
+        self.__sink = pa.OSFile(path, 'wb')
+        self.__writer = pa.ipc.new_file(self.__sink, self.__schema)
+
+    def write(self, columns: Dict[str, list]):
+        self.__writer.write_batch(pa.record_batch(
+            [pa.array(columns[field.name], field.type) for field in self.__schema],
+            schema=self.__schema,
+        ))
+
+    def close(self):
+        self.__writer.close()
+        self.__sink.close()
+
+
+def _open_writer(directory: str, name: str, format: str):
+    if format == 'arrow':
+        if pa is None:
+            raise ImportError('pyarrow is required for arrow format.')
+        os.makedirs(directory, exist_ok=True)
+        return _ArrowTableWriter(os.path.join(directory, f'{name}.arrow'), SCHEMAS[name])
+
+    elif format == 'npy':
+        return _NpyTableWriter(os.path.join(directory, name), SCHEMAS[name])
+
+    raise ValueError("It must be 'arrow' or 'npy'.")
+
+
+def _write_chunks(writer, rows: Iterable[tuple], columns: List[str], chunk_size: int) -> int:
+    # rows are collected only up to chunk_size, so memory does not grow with the data.
+    count = 0
+    chunk = []
+    try:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                writer.write(dict(zip(columns, map(list, zip(*chunk)))))
+                count += len(chunk)
+                chunk = []
+
+        if chunk:
+            writer.write(dict(zip(columns, map(list, zip(*chunk)))))
+            count += len(chunk)
+    finally:
+        writer.close()
+
+    return count
+
+
+def export_patients(
+        patients: Iterable[PatientType],
+        directory: str,
+        chunk_size: int = 65536,
+        format: str = None
+) -> int:
+    """
+    Export patients and their attending physicians.
+
+    Args:
+        patients: (Iterable[PatientType]) patients. It can be a generator.
+        directory: (str) output directory.
+        chunk_size: (int) rows per chunk.
+        format: (str|None) 'arrow' or 'npy'. None is default_format().
+
+    Returns:
+        (int): number of exported patients.
+    """
+
+    format = format or default_format()
+
+    # doctors are numbered by first appearance. Keep them to make id() stable.
+    doctors = []
+    doctor_keys = {}
+
+    def rows():
+        for patient in patients:
+            doctor = patient.attending_physician
+            key = doctor_keys.get(id(doctor))
+            if key is None:
+                key = doctor_keys[id(doctor)] = len(doctors)
+                doctors.append(doctor)
+
+            discharged = patient.discharged_date
+            yield (
+                patient.id,
+                patient.first_name,
+                patient.last_name,
+                patient.age,
+                patient.birthday.toordinal(),
+                patient.admitted_date.toordinal(),
+                discharged.toordinal() if discharged is not None else -1,
+                key,
+            )
+
+    count = _write_chunks(
+        _open_writer(directory, 'patients', format), rows(), list(SCHEMAS['patients']), chunk_size
+    )
+    _write_chunks(
+        _open_writer(directory, 'doctors', format),
+        ((doctor.speciality, doctor.first_name, doctor.last_name) for doctor in doctors),
+        list(SCHEMAS['doctors']),
+        chunk_size,
+    )
+    return count
+
+
+def _category_code(code: int) -> int:
+    # category codes are int16.
+    if code > 0x7FFF:
+        raise ValueError('It has too many categories.')
+    return code
+
+
+def export_charges(
+        bills: Iterable[BillType],
+        directory: str,
+        chunk_size: int = 65536,
+        format: str = None
+) -> int:
+    """
+    Export charges of bills. Each bill is read from its snapshot.
+
+    Args:
+        bills: (Iterable[BillType]) bills. It can be a generator.
+        directory: (str) output directory.
+        chunk_size: (int) rows per chunk.
+        format: (str|None) 'arrow' or 'npy'. None is default_format().
+
+    Returns:
+        (int): number of exported charges.
+    """
+
+    format = format or default_format()
+    # the shared categories keep their codes; others, e.g. of a hospital's catalog, are added as they appear.
+    categories = list(ChargeHistoryItem.categories)
+    codes = {category: code for code, category in enumerate(categories)}
+
+    def rows():
+        for bill in bills:
+            snapshot = bill.snapshot()
+            bill_id = snapshot.patient.id
+            for charge in snapshot:
+                category = charge.category.lower()
+                code = codes.get(category)
+                if code is None:
+                    code = codes[category] = _category_code(len(categories))
+                    categories.append(category)
+                yield bill_id, charge.cost, code
+
+    count = _write_chunks(
+        _open_writer(directory, 'charges', format), rows(), list(SCHEMAS['charges']), chunk_size
+    )
+    _write_chunks(
+        _open_writer(directory, 'categories', format),
+        ((category,) for category in categories),
+        ['name'],
+        chunk_size,
+    )
+    return count
+
+
+class StringColumn:
+    """
+    This is a read-only utf8 column over data and offsets buffers.
+    Values are decoded only when they are accessed.
+    """
+
+    def __init__(self, data, offsets):
+        """
+        Initialize this class.
+
+        Args:
+            data: (memoryview|numpy.ndarray) utf8 bytes.
+            offsets: (memoryview|numpy.ndarray) n + 1 offsets into data.
+        """
+
+        self.__data = data
+        self.__offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('column index out of range')
+
+        start, end = int(self.__offsets[index]), int(self.__offsets[index + 1])
+        return bytes(self.__data[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def _map_npy(path: str):
+    # numpy maps the file itself.
+    if np is not None:
+        return np.load(path, mmap_mode='r')
+
+    with open(path, 'rb') as file:
+        if file.read(6) != b'\x93NUMPY':
+            raise ValueError(f'It is not npy file: {path}')
+
+        major = file.read(2)[0]
+        size = int.from_bytes(file.read(2 if major == 1 else 4), 'little')
+        header = ast.literal_eval(file.read(size).decode('latin1'))
+        offset = file.tell()
+
+        typecodes = {descr: typecode for typecode, descr in _NUMERIC_TYPES.values()}
+        if header['descr'] not in typecodes or sys.byteorder == 'big':
+            raise ValueError(f'Unsupported npy column: {header["descr"]}')
+
+        # an empty file cannot be mapped.
+        if header['shape'][0] == 0:
+            return memoryview(array(typecodes[header['descr']]))
+
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)[offset:].cast(typecodes[header['descr']])
+
+
+def read_table(directory: str, name: str):
+    """
+    Open an exported table without copying.
+
+    Args:
+        directory: (str) directory given to export.
+        name: (str) one of SCHEMAS.
+
+    Returns:
+        (pyarrow.Table|Dict): Arrow table for arrow format.
+        For npy format, a dict of column name to memoryview (or numpy memmap) or StringColumn.
+    """
+
+    arrow_path = os.path.join(directory, f'{name}.arrow')
+    if os.path.exists(arrow_path):
+        if pa is None:
+            raise ImportError('pyarrow is required for arrow format.')
+        return pa.ipc.open_file(pa.memory_map(arrow_path, 'r')).read_all()
+
+    table = {}
+    for column, column_type in SCHEMAS[name].items():
+        path = os.path.join(directory, name, column)
+        if column_type == 'utf8':
+            table[column] = StringColumn(_map_npy(f'{path}.data.npy'), _map_npy(f'{path}.offsets.npy'))
+        else:
+            table[column] = _map_npy(f'{path}.npy')
+    return table
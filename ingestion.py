@@ -0,0 +1,307 @@
+"""
+Admission ingestion for Hospital management system
+
+This module takes admissions from producers (e.g. the front end) into a bounded queue,
+and a pool of workers turns them into patients and bills in micro-batches.
+
+- backpressure: when the queue is full, submit waits up to timeout, or fails at once,
+  with Backpressure (overflow 'block' or 'error' of events.EventQueue), so producers can
+  shed or retry instead of timing out. pressure tells how full the queue is.
+- micro-batching: a worker takes every waiting admission up to batch_size, validates
+  them together (validate_names, validate_categories) and gives the bills to the sink at once.
+  With a hospital's catalog (see catalog.TenantCatalog), categories are validated with one
+  version of it for the whole batch, and new bills keep it as BillType.catalog.
+- workers: threads, or threads handing validation to processes.
+
+Every submit returns a Future of the bill. metrics() has queue depth, latency and throughput.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from main import PersonType, DoctorType, DateType, PatientType, ChargeHistoryItem, BillType
+from events import EventQueue
+
+
+class Admission(NamedTuple):
+    """
+    This is one admission request. charges are (cost, category, description) posted at admission.
+    """
+
+    first_name: str
+    last_name: str
+    age: int
+    birthday: DateType
+    attending_physician: DoctorType
+    admitted_date: DateType
+    charges: Tuple[Tuple[int, str, Optional[str]], ...] = ()
+
+
+def _check_fields(admission: Admission):
+    # when the value is not int.
+    if not isinstance(admission.age, int):
+        raise TypeError('It must be int.')
+
+    # when the value is not DateType.
+    if not isinstance(admission.birthday, DateType) or not isinstance(admission.admitted_date, DateType):
+        raise TypeError('It must be DateType.')
+
+    # when the value is not DoctorType.
+    if not isinstance(admission.attending_physician, DoctorType):
+        raise TypeError('It must be DoctorType.')
+
+
+def validate_batch(admissions: List[Admission], catalog=None) -> List[Optional[Exception]]:
+    """
+    Validate admissions with the same rules as the setters.
+    Names and categories of the batch are checked at once, and a batch with
+    a wrong one is checked again one by one to find it.
+
+    Args:
+        admissions: (List[Admission]) admissions.
+        catalog: (catalog.Catalog|catalog.TenantCatalog|None) catalog of the hospital.
+            None is ChargeHistoryItem.categories.
+
+    Returns:
+        (List[Exception|None]): error of each admission. None is valid.
+    """
+
+    # one version of the catalog for the whole batch.
+    validate_categories = (
+        catalog.snapshot().validate_categories if catalog is not None else ChargeHistoryItem.validate_categories
+    )
+
+    def check_all(admission: Admission):
+        PersonType.validate_names([admission.first_name, admission.last_name])
+        validate_categories([category for _, category, _ in admission.charges])
+        _check_fields(admission)
+
+    try:
+        PersonType.validate_names(name for admission in admissions for name in admission[:2])
+        validate_categories(category for admission in admissions for _, category, _ in admission.charges)
+        check = _check_fields
+    except (TypeError, ValueError):
+        check = check_all
+
+    errors = []
+    for admission in admissions:
+        try:
+            check(admission)
+            errors.append(None)
+        except (TypeError, ValueError) as error:
+            errors.append(error)
+    return errors
+
+
+def _build(admission: Admission, catalog=None) -> BillType:
+    # it is validated, so nothing is checked again.
+    patient = PatientType.from_trusted(
+        admission.first_name, admission.last_name, admission.age, admission.birthday,
+        admission.attending_physician, admission.admitted_date,
+    )
+    bill = BillType.from_trusted(patient, [
+        ChargeHistoryItem.from_trusted(cost, category, description, admission.admitted_date)
+        for cost, category, description in admission.charges
+    ])
+    if catalog is not None:
+        bill.catalog = catalog
+    return bill
+
+
+class IngestionPipeline:
+    """
+    This is the admission pipeline. Use it as a context manager, or call close().
+    """
+
+    modes = ('thread', 'process')
+
+    def __init__(
+            self,
+            sink: Callable[[List[BillType]], None] = None,
+            maxsize: int = 1024,
+            workers: int = 4,
+            batch_size: int = 64,
+            mode: str = 'thread',
+            overflow: str = 'block',
+            timeout: float = None,
+            window: int = 10000,
+            catalog=None,
+    ):
+        """
+        Initialize this class. Workers are started.
+
+        Args:
+            sink: (Callable[[List[BillType]], None]|None) it receives each batch of new bills,
+                e.g. to insert them into indexes. It is called from worker threads.
+            maxsize: (int) capacity of the queue.
+            workers: (int) number of worker threads.
+            batch_size: (int) max admissions of one batch.
+            mode: (str) one of modes. 'process' validates batches in worker processes;
+                categories added after the processes start are not seen by them.
+            overflow: (str) 'block' or 'error' when the queue is full.
+            timeout: (float|None) max seconds submit waits with 'block'. None is forever.
+            window: (int) number of recent latencies for percentiles.
+            catalog: (catalog.TenantCatalog|None) catalog of the hospital. None is ChargeHistoryItem.categories.
+                Worker processes get the version of each batch, so they see reloads.
+        """
+
+        if mode not in self.modes:
+            raise ValueError('It must be in modes;' + ', '.join(self.modes))
+
+        # a dropped admission would never answer its producer.
+        if overflow not in ('block', 'error'):
+            raise ValueError('It must be in overflows;block, error')
+
+        if workers < 1 or batch_size < 1:
+            raise ValueError('It must be positive.')
+
+        self.__sink = sink
+        self.__catalog = catalog
+        self.__maxsize = maxsize
+        self.__batch_size = batch_size
+        self.__queue = EventQueue(maxsize, overflow, timeout)
+        self.__executor = ProcessPoolExecutor(max_workers=workers) if mode == 'process' else None
+
+        self.__lock = threading.Lock()
+        self.__latencies = deque(maxlen=window)
+        self.__submitted = self.__completed = self.__failed = self.__rejected = 0
+        self.__batches = 0
+        self.__started = time.perf_counter()
+
+        self.__closed = threading.Event()
+        self.__workers = [
+            threading.Thread(target=self.__work, name=f'ingestion-{index}', daemon=True)
+            for index in range(workers)
+        ]
+        for worker in self.__workers:
+            worker.start()
+
+    def __enter__(self) -> 'IngestionPipeline':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pressure(self) -> float:
+        """
+        It returns how full the queue is. Producers can slow down before it reaches 1.
+
+        Returns:
+            (float): queue depth / capacity.
+        """
+        return len(self.__queue) / self.__maxsize
+
+    def submit(self, admission: Admission) -> Future:
+        """
+        Put an admission in the queue.
+
+        Args:
+            admission: (Admission) the admission.
+
+        Returns:
+            (Future): it gives the new BillType, or raises the validation error.
+        """
+
+        # when the pipeline does not take more admissions.
+        if self.__closed.is_set():
+            raise RuntimeError('It is closed.')
+
+        future = Future()
+        # it is counted first, so a worker never completes more than submitted.
+        with self.__lock:
+            self.__submitted += 1
+        try:
+            self.__queue.deliver((admission, future, time.perf_counter()))
+        except Exception:
+            with self.__lock:
+                self.__submitted -= 1
+                self.__rejected += 1
+            raise
+        return future
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        It returns counters and latencies. Latency is from submit until the bill is made.
+
+        Returns:
+            (Dict[str, float]): depth, submitted, completed, failed, rejected, batches,
+                throughput (admissions per second), p50 and p99 (seconds).
+        """
+
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+            elapsed = time.perf_counter() - self.__started
+            return {
+                'depth': len(self.__queue),
+                'submitted': self.__submitted,
+                'completed': self.__completed,
+                'failed': self.__failed,
+                'rejected': self.__rejected,
+                'batches': self.__batches,
+                'throughput': self.__completed / elapsed if elapsed > 0 else 0.0,
+                'p50': latencies[len(latencies) // 2] if latencies else 0.0,
+                'p99': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+            }
+
+    def close(self, wait: bool = True):
+        """
+        Stop taking admissions. Admissions in the queue are still made.
+
+        Args:
+            wait: (bool) wait until workers finish.
+        """
+
+        self.__closed.set()
+        if wait:
+            for worker in self.__workers:
+                worker.join()
+            if self.__executor is not None:
+                self.__executor.shutdown()
+
+    def __work(self):
+        while True:
+            batch = self.__queue.get_batch(self.__batch_size, timeout=0.05)
+            if not batch:
+                if self.__closed.is_set() and not len(self.__queue):
+                    return
+                continue
+            self.__process(batch)
+
+    def __process(self, batch: List[tuple]):
+        admissions = [admission for admission, _, _ in batch]
+        catalog = self.__catalog
+        try:
+            snapshot = catalog.snapshot() if catalog is not None else None
+            if self.__executor is not None:
+                errors = self.__executor.submit(validate_batch, admissions, snapshot).result()
+            else:
+                errors = validate_batch(admissions, snapshot)
+
+            bills = [
+                _build(admission, catalog) if error is None else None
+                for admission, error in zip(admissions, errors)
+            ]
+            if self.__sink is not None:
+                self.__sink([bill for bill in bills if bill is not None])
+        except Exception as error:
+            # a broken sink fails the whole batch, but the worker keeps going.
+            errors, bills = [error] * len(batch), [None] * len(batch)
+
+        finished = time.perf_counter()
+        latencies = [finished - enqueued for _, _, enqueued in batch]
+        with self.__lock:
+            self.__latencies.extend(latencies)
+            self.__batches += 1
+            failed = sum(1 for error in errors if error is not None)
+            self.__failed += failed
+            self.__completed += len(batch) - failed
+
+        for (_, future, _), bill, error in zip(batch, bills, errors):
+            if error is None:
+                future.set_result(bill)
+            else:
+                future.set_exception(error)
@@ -6,8 +6,204 @@ Writen by Donggyu Kim
 This module includes three classes and two subclasses for inheritance.
 """
 
+import itertools
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import timedelta
-from typing import Union, List, Optional
+from functools import lru_cache
+from typing import Union, Callable, Dict, List, Optional, Iterable
+
+from events import (
+    EventBus,
+    ChargeAdded,
+    ChargeRemoved,
+    DischargedDateChanged,
+    PhysicianChanged,
+)
+
+
+# versions of persons, bills and charges. They are unique over every object, so they can be cache keys.
+_next_version = itertools.count(1).__next__
+
+
+class _Revision:
+    # a bill's counter of in-place charge edits, and its catalog, shared with its charges.
+    __slots__ = ('value', 'catalog')
+
+    def __init__(self):
+        self.value = 0
+        self.catalog = None
+
+
+class RenderCache:
+    """
+    This is a bounded LRU cache of __str__ renderings, shared by every object.
+    A key has the versions of everything the text is made from, so a changed object
+    simply misses, and its old text is evicted in time.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        """
+        Initialize this class.
+
+        Args:
+            maxsize: (int) max number of renderings.
+        """
+
+        self.__maxsize = maxsize
+        self.__texts: 'OrderedDict[tuple, str]' = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.__texts)
+
+    @property
+    def maxsize(self) -> int:
+        """
+        It returns max number of renderings.
+
+        Returns:
+            (int): __maxsize
+        """
+        return self.__maxsize
+
+    @maxsize.setter
+    def maxsize(self, value: int):
+        """
+        Set __maxsize from the rvalue. Renderings over it are evicted.
+
+        Args:
+            value: (int) it is rvalue.
+        """
+
+        # when the value is not int.
+        if not isinstance(value, int):
+            raise TypeError('It must be int.')
+
+        with self.__lock:
+            self.__maxsize = value
+            while len(self.__texts) > max(value, 0):
+                self.__texts.popitem(last=False)
+
+    def render(self, key: tuple, make: Callable[[], str]) -> str:
+        """
+        It returns the cached text of the key, or makes and caches it.
+
+        Args:
+            key: (tuple) versions of everything the text is made from.
+            make: (Callable[[], str]) it makes the text.
+
+        Returns:
+            (str): the text.
+        """
+
+        with self.__lock:
+            text = self.__texts.get(key)
+            if text is not None:
+                self.__texts.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+
+        # it is made without the lock; two threads may make the same text.
+        text = make()
+        with self.__lock:
+            self.__texts[key] = text
+            if len(self.__texts) > self.__maxsize:
+                self.__texts.popitem(last=False)
+        return text
+
+    def clear(self):
+        """
+        Remove every rendering.
+        """
+
+        with self.__lock:
+            self.__texts.clear()
+
+
+render_cache = RenderCache()
+
+
+class NamePool:
+    """
+    This stores each distinct name once, and gives an int handle for it.
+    Names are never removed, because there are far fewer distinct names than people.
+    """
+
+    def __init__(self):
+        """
+        Initialize this class.
+        """
+
+        self.__names: List[str] = []
+        self.__handles: Dict[str, int] = {}
+        # case-folded name -> handles of every spelling
+        self.__folded: Dict[str, List[int]] = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def __getitem__(self, handle: int) -> str:
+        return self.__names[handle]
+
+    def intern(self, name: str) -> int:
+        """
+        It returns the handle of the name. A new name is added.
+
+        Args:
+            name: (str) the name.
+
+        Returns:
+            (int): handle of the name.
+        """
+
+        handle = self.__handles.get(name)
+        if handle is not None:
+            return handle
+
+        with self.__lock:
+            # another thread can add it while this one waits.
+            handle = self.__handles.get(name)
+            if handle is None:
+                handle = len(self.__names)
+                self.__names.append(name)
+                if isinstance(name, str):
+                    self.__folded.setdefault(name.casefold(), []).append(handle)
+                self.__handles[name] = handle
+            return handle
+
+    def handle(self, name: str) -> Optional[int]:
+        """
+        It returns the handle of the exact name without adding it.
+
+        Args:
+            name: (str) the name.
+
+        Returns:
+            (int|None): handle of the name. None when nobody has the name.
+        """
+        return self.__handles.get(name)
+
+    def lookup(self, name: str) -> frozenset:
+        """
+        It returns handles of the name in any case, e.g. 'smith' finds 'Smith' and 'SMITH'.
+
+        Args:
+            name: (str) the name.
+
+        Returns:
+            (frozenset): handles. Compare them with first_name_handle or last_name_handle.
+        """
+
+        # when the value is not str.
+        if not isinstance(name, str):
+            raise TypeError('It must be str.')
+
+        return frozenset(self.__folded.get(name.casefold(), ()))
 
 
 class PersonType:
@@ -15,8 +211,17 @@ class PersonType:
     This is base class for DoctorType, PatientType.
     It has first_name and last_name.
     Both attribute is required.
+
+    Names are kept in name_pool, and a person has only their handles.
     """
 
+    # one pool for every person; handles are not valid in another process.
+    name_pool = NamePool()
+
+    # it is not issued. A person gets its own version only when it is read (see version),
+    # so people who are never rendered keep no int of their own.
+    __version = 0
+
     def __init__(self, first_name: str, last_name: str):
         """
         Initializer for PersonType.
@@ -26,11 +231,87 @@ class PersonType:
             last_name: (str) it is last name of the person.
         """
 
-        self.__first_name = first_name
-        self.__last_name = last_name
+        self.__first_name = self.name_pool.intern(first_name)
+        self.__last_name = self.name_pool.intern(last_name)
 
     def __str__(self) -> str:
-        return f'First Name: {self.__first_name}\nLast Name: {self.__last_name}'
+        return f'First Name: {self.first_name}\nLast Name: {self.last_name}'
+
+    def __getstate__(self) -> dict:
+        # handles are replaced by names, so a pickled person can be loaded in another process.
+        state = self.__dict__.copy()
+        state['_PersonType__first_name'] = self.first_name
+        state['_PersonType__last_name'] = self.last_name
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.__first_name = self.name_pool.intern(state['_PersonType__first_name'])
+        self.__last_name = self.name_pool.intern(state['_PersonType__last_name'])
+        self._touch()
+
+    @property
+    def version(self) -> int:
+        """
+        It returns version. It is changed by every setter, and it is unique over every object,
+        so renderings can be cached by it.
+
+        Returns:
+            (int): __version
+        """
+
+        version = self.__version
+        # when it is not issued yet, or after a change.
+        if not version:
+            version = self.__version = _next_version()
+        return version
+
+    def _touch(self):
+        # a new version is issued when it is read next time.
+        self.__dict__.pop('_PersonType__version', None)
+
+    @staticmethod
+    def validate_names(values: Iterable[str]):
+        """
+        Validate a whole column of names at once.
+        It applies the same rules as the first_name/last_name setters,
+        but each distinct name is checked only once.
+
+        Args:
+            values: (Iterable[str]) names to validate.
+        """
+
+        checked = set()
+        for index, value in enumerate(values):
+            # when the value is not str.
+            if not isinstance(value, str):
+                raise TypeError(f'It must be str. (index: {index})')
+
+            # when the value does not consist of only alphabet.
+            if value not in checked:
+                if not value.isalpha():
+                    raise ValueError(f'It must consist of alphabet. (index: {index})')
+                checked.add(value)
+
+    @property
+    def first_name_handle(self) -> int:
+        """
+        It returns the handle of first name in name_pool.
+
+        Returns:
+            (int): handle of __first_name
+        """
+        return self.__first_name
+
+    @property
+    def last_name_handle(self) -> int:
+        """
+        It returns the handle of last name in name_pool.
+
+        Returns:
+            (int): handle of __last_name
+        """
+        return self.__last_name
 
     @property
     def first_name(self) -> str:
@@ -40,7 +321,7 @@ class PersonType:
         Returns:
             (str): __first_name
         """
-        return self.__first_name
+        return self.name_pool[self.__first_name]
 
     @first_name.setter
     def first_name(self, value: str):
@@ -60,7 +341,8 @@ class PersonType:
         elif not value.isalpha():
             raise ValueError('It must consist of alphabet.')
 
-        self.__first_name = value
+        self.__first_name = self.name_pool.intern(value)
+        self._touch()
 
     @property
     def last_name(self) -> str:
@@ -70,7 +352,7 @@ class PersonType:
         Returns:
             (str): __last_name
         """
-        return self.__last_name
+        return self.name_pool[self.__last_name]
 
     @last_name.setter
     def last_name(self, value: str):
@@ -90,7 +372,8 @@ class PersonType:
         elif not value.isalpha():
             raise ValueError('It must consist of alphabet.')
 
-        self.__last_name = value
+        self.__last_name = self.name_pool.intern(value)
+        self._touch()
 
 
 class DoctorType(PersonType):
@@ -98,8 +381,12 @@ class DoctorType(PersonType):
     This store the doctor's name and speciality.
     It has super class' attributes and speciality.
     All attribute is required.
+    Every doctor has its own id, because names and speciality can be the same.
     """
 
+    # the last issued doctor id.
+    _id = 0
+
     def __init__(self, speciality: str, first_name: str, last_name: str):
         """
         Initializer for DoctorType.
@@ -112,11 +399,74 @@ class DoctorType(PersonType):
 
         # call super class' initializer.
         super().__init__(first_name, last_name)
+        self.__id = self._issue_id()
         self.__speciality = speciality
 
     def __str__(self) -> str:
+        return render_cache.render(('doctor', self.version), self.__render)
+
+    def __render(self) -> str:
         return f'\t- Doctor -\n{super().__str__()}\nSpeciality: {self.__speciality}'
 
+    @classmethod
+    def _issue_id(cls, doctor_id: int = None) -> int:
+        """
+        Issue a new doctor id from the class counter, like PatientType._issue_id.
+        If doctor_id is given (e.g. restoring a snapshot), it is reused and the counter skips over it.
+
+        Args:
+            doctor_id: (int|None) already issued id.
+
+        Returns:
+            (int): the doctor id.
+        """
+
+        # the counter is shared by every DoctorType, so it must be changed on the class.
+        if doctor_id is None:
+            DoctorType._id += 1
+            return DoctorType._id
+
+        DoctorType._id = max(DoctorType._id, doctor_id)
+        return doctor_id
+
+    @classmethod
+    def from_trusted(
+            cls,
+            speciality: str,
+            first_name: str,
+            last_name: str,
+            doctor_id: int = None
+    ) -> 'DoctorType':
+        """
+        Create a doctor from values which are already validated.
+        It is for our own snapshots or batch-validated imports, so there is no check at all.
+
+        Args:
+            speciality: (str) it is the doctor's speciality.
+            first_name: (str) it is the doctor's first name.
+            last_name:  (str) it is the doctor's last name.
+            doctor_id: (int|None) id to restore. None issues a new one.
+
+        Returns:
+            (DoctorType): new doctor.
+        """
+
+        doctor = cls.__new__(cls)
+        PersonType.__init__(doctor, first_name, last_name)
+        doctor.__id = cls._issue_id(doctor_id)
+        doctor.__speciality = speciality
+        return doctor
+
+    @property
+    def id(self) -> int:
+        """
+        It returns id.
+
+        Returns:
+            (int): __id
+        """
+        return self.__id
+
     @property
     def speciality(self) -> str:
         """
@@ -145,6 +495,7 @@ class DoctorType(PersonType):
             raise ValueError('It must consist of alphabet.')
 
         self.__speciality = value
+        self._touch()
 
 
 class DateType:
@@ -185,10 +536,38 @@ class DateType:
     def day(self) -> int:
         return self.__day
 
-    def strftime(self, fstring: str) -> str:
+    def __hash__(self) -> int:
+        return hash((self.__year, self.__month, self.__day))
+
+    def toordinal(self) -> int:
+        """
+        It returns the proleptic Gregorian ordinal like datetime.date.toordinal.
+
+        Returns:
+            (int): ordinal of the date.
+        """
+
+        return _date_ordinal(self.__year, self.__month, self.__day)
+
+    @classmethod
+    def fromordinal(cls, ordinal: int) -> 'DateType':
+        """
+        Create a date from the proleptic Gregorian ordinal.
+
+        Args:
+            ordinal: (int) ordinal of the date.
+
+        Returns:
+            (DateType): the date.
+        """
         from datetime import date
 
-        return date(self.year, self.month, self.day).strftime(fstring)
+        the_date = date.fromordinal(ordinal)
+        return DateType(the_date.year, the_date.month, the_date.day)
+
+    def strftime(self, fstring: str) -> str:
+        # dates repeat a lot (same admitted days), so renderings are memoized.
+        return _format_date(self.__year, self.__month, self.__day, fstring)
 
     @classmethod
     def today(cls):
@@ -197,6 +576,91 @@ class DateType:
         the_date = date.today()
         return DateType(the_date.year, the_date.month, the_date.day)
 
+    @classmethod
+    def parse(cls, text: str) -> 'DateType':
+        """
+        Parse 'dd/mm/YYYY' or 'YYYY-mm-dd'.
+        Parsed dates are kept in a bounded LRU cache, so the same DateType is returned for the same text.
+        It is safe because DateType is read-only.
+
+        Args:
+            text: (str) date string.
+
+        Returns:
+            (DateType): parsed date.
+        """
+
+        # when the value is not str.
+        if not isinstance(text, str):
+            raise TypeError('It must be str.')
+
+        return _parse_date(text)
+
+    @classmethod
+    def parse_many(cls, texts: Iterable[str]) -> List['DateType']:
+        """
+        Parse a whole column of date strings.
+
+        Args:
+            texts: (Iterable[str]) date strings.
+
+        Returns:
+            (List[DateType]): parsed dates in the same order.
+        """
+
+        parse = cls.parse
+        return [parse(text) for text in texts]
+
+    @staticmethod
+    def clear_cache():
+        """
+        Clear the parsing cache and the formatting cache.
+        """
+
+        _parse_date.cache_clear()
+        _format_date.cache_clear()
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(text: str) -> DateType:
+    from datetime import date
+
+    # fast path: fixed width formats.
+    if len(text) == 10 and text[2] == '/' and text[5] == '/':
+        year, month, day = text[6:], text[3:5], text[:2]
+    elif len(text) == 10 and text[4] == '-' and text[7] == '-':
+        year, month, day = text[:4], text[5:7], text[8:]
+    else:
+        # slow path: surrounding spaces or single digit day/month.
+        stripped = text.strip()
+        if '/' in stripped:
+            day, month, year = stripped.split('/', 2)
+        elif '-' in stripped:
+            year, month, day = stripped.split('-', 2)
+        else:
+            raise ValueError(f'Unknown date format: {text!r}')
+
+    if not (year.isdigit() and month.isdigit() and day.isdigit()):
+        raise ValueError(f'Unknown date format: {text!r}')
+
+    # date() validates the calendar (e.g. 31/02/2022).
+    the_date = date(int(year), int(month), int(day))
+    return DateType(the_date.year, the_date.month, the_date.day)
+
+
+@lru_cache(maxsize=8192)
+def _date_ordinal(year: int, month: int, day: int) -> int:
+    from datetime import date
+
+    return date(year, month, day).toordinal()
+
+
+@lru_cache(maxsize=8192)
+def _format_date(year: int, month: int, day: int, fstring: str) -> str:
+    from datetime import date
+
+    return date(year, month, day).strftime(fstring)
+
 
 class PatientType(PersonType):
     """
@@ -207,6 +671,9 @@ class PatientType(PersonType):
 
     _id = 0
 
+    # opt-in change feed. If it is set, setters publish events.
+    event_bus: Optional[EventBus] = None
+
     def __init__(
             self,
             first_name: str,
@@ -233,11 +700,8 @@ class PatientType(PersonType):
         # call super class' initializer.
         super().__init__(first_name, last_name)
 
-        # increase __id automatically.
-        self._id += 1
-
-        # this __id is instance's attribute.
-        self.__id = self._id
+        # this __id is instance's attribute, and it is increased automatically.
+        self.__id = self._issue_id()
         self.__age = age
         self.__birthday = birthday
         self.__attending_physician = attending_physician
@@ -245,6 +709,14 @@ class PatientType(PersonType):
         self.__discharged_date = discharged_date
 
     def __str__(self) -> str:
+        return render_cache.render(self._render_key(), self.__render)
+
+    def _render_key(self) -> tuple:
+        # Duration of an open stay changes every day.
+        today = DateType.today().toordinal() if self.__discharged_date is None else None
+        return 'patient', self.version, self.__attending_physician.version, today
+
+    def __render(self) -> str:
         return f'''\t- Patient -
 ID: {self.__id}
 {super().__str__()}
@@ -258,6 +730,68 @@ Attending physician:
 {str(self.__attending_physician)}
 '''
 
+    @classmethod
+    def _issue_id(cls, patient_id: int = None) -> int:
+        """
+        Issue a new patient id from the class counter.
+        If patient_id is given (e.g. restoring a snapshot), it is reused and the counter skips over it.
+
+        Args:
+            patient_id: (int|None) already issued id.
+
+        Returns:
+            (int): the patient id.
+        """
+
+        # the counter is shared by every PatientType, so it must be changed on the class.
+        if patient_id is None:
+            PatientType._id += 1
+            return PatientType._id
+
+        PatientType._id = max(PatientType._id, patient_id)
+        return patient_id
+
+    @classmethod
+    def from_trusted(
+            cls,
+            first_name: str,
+            last_name: str,
+            age: int,
+            birthday: DateType,
+            attending_physician: DoctorType,
+            admitted_date: DateType,
+            discharged_date: DateType = None,
+            patient_id: int = None
+    ) -> 'PatientType':
+        """
+        Create a patient from values which are already validated.
+        It is for our own snapshots or imports which passed batch validation (see validate_names),
+        so it skips every per-field check and the initializer chain.
+
+        Args:
+            first_name: (str) first name of patient
+            last_name: (str) last name of patient
+            age: (int) age of patient
+            birthday: (DateType) patient's date of birth
+            attending_physician: (DoctorType) the attending physician for patient
+            admitted_date: (DateType) admitted date of patient
+            discharged_date: (DateType|None) discharged date of patient
+            patient_id: (int|None) id to restore. If it is None, a new id is issued.
+
+        Returns:
+            (PatientType): new patient.
+        """
+
+        patient = cls.__new__(cls)
+        PersonType.__init__(patient, first_name, last_name)
+        patient.__id = cls._issue_id(patient_id)
+        patient.__age = age
+        patient.__birthday = birthday
+        patient.__attending_physician = attending_physician
+        patient.__admitted_date = admitted_date
+        patient.__discharged_date = discharged_date
+        return patient
+
     @property
     def id(self) -> int:
         """
@@ -312,7 +846,11 @@ Attending physician:
         if not isinstance(value, DoctorType):
             raise TypeError('The value has to be only Doctor.')
 
-        self.__attending_physician = value
+        old, self.__attending_physician = self.__attending_physician, value
+        self._touch()
+
+        if self.event_bus is not None:
+            self.event_bus.publish(PhysicianChanged(self, old, value))
 
     @property
     def admitted_date(self) -> DateType:
@@ -353,7 +891,11 @@ Attending physician:
         elif (value - self.__admitted_date).days <= 0:
             raise ValueError('It must be future DateType.')
 
-        self.__discharged_date = value
+        old, self.__discharged_date = self.__discharged_date, value
+        self._touch()
+
+        if self.event_bus is not None:
+            self.event_bus.publish(DischargedDateChanged(self, old, value))
 
     @age.setter
     def age(self, value: int):
@@ -370,6 +912,7 @@ Attending physician:
             raise TypeError('It must be int.')
 
         self.__age = value
+        self._touch()
 
     @property
     def duration(self) -> timedelta:
@@ -392,7 +935,11 @@ Attending physician:
 
         There are no any Args and any Returns.
         """
-        self.__discharged_date = DateType.today()
+        old, self.__discharged_date = self.__discharged_date, DateType.today()
+        self._touch()
+
+        if self.event_bus is not None:
+            self.event_bus.publish(DischargedDateChanged(self, old, self.__discharged_date))
 
 
 class ChargeHistoryItem:
@@ -408,7 +955,18 @@ class ChargeHistoryItem:
     # For dynamic adding items or removing items, it is implemented as a list, not Enum.
     categories = ['medicine', 'doctor', 'room']
 
-    def __init__(self, cost: int, category: str, description: str = None):
+    # revisions of the bills having this charge; a _Revision, or a tuple of them for many bills.
+    # An edit in place changes only them (see BillType.revision).
+    __revisions = None
+
+    def __init__(
+            self,
+            cost: int,
+            category: str,
+            description: str = None,
+            posted_date: DateType = None,
+            catalog=None
+    ):
         """
         Initialize this class
 
@@ -416,10 +974,19 @@ class ChargeHistoryItem:
             cost: (int) cost for something.
             category: (str) type of cost.
             description: (str|None) additional field.
+            posted_date: (DateType|None) the date when the charge is posted.
+            catalog: (catalog.Catalog|catalog.TenantCatalog|None) catalog to check the category with.
+                None is categories.
         """
 
+        # when the posted date is not date.
+        if posted_date is not None and not isinstance(posted_date, DateType):
+            raise TypeError('It must be DateType.')
+
         # validate category, is it available category or not.
-        if not self.validation_category(category):
+        if catalog is not None:
+            catalog.validate(category)
+        elif not self.validation_category(category):
             raise ValueError(
                 'It must be in categories;' + ', '.join(self.categories)
             )
@@ -427,10 +994,65 @@ class ChargeHistoryItem:
         self.__cost = cost
         self.__category = category
         self.__description = description
+        self.__posted_date = posted_date
 
     def __str__(self) -> str:
         return f'{self.__category} | {self.__cost} | {self.__description}'
 
+    @classmethod
+    def from_trusted(
+            cls,
+            cost: int,
+            category: str,
+            description: str = None,
+            posted_date: DateType = None
+    ) -> 'ChargeHistoryItem':
+        """
+        Create a charge from values which are already validated.
+        The category is not checked, so validate the column with validate_categories first.
+
+        Args:
+            cost: (int) cost for something.
+            category: (str) type of cost.
+            description: (str|None) additional field.
+            posted_date: (DateType|None) the date when the charge is posted.
+
+        Returns:
+            (ChargeHistoryItem): new charge.
+        """
+
+        item = cls.__new__(cls)
+        item.__cost = cost
+        item.__category = category
+        item.__description = description
+        item.__posted_date = posted_date
+        return item
+
+    @classmethod
+    def validate_categories(cls, values: Iterable[str]):
+        """
+        Validate a whole column of categories at once.
+        Each distinct category is looked up only once.
+
+        Args:
+            values: (Iterable[str]) categories to validate.
+        """
+
+        available = set(cls.categories)
+        checked = set()
+        for index, value in enumerate(values):
+            # when the value is not str.
+            if not isinstance(value, str):
+                raise TypeError(f'It must be str. (index: {index})')
+
+            # when the value is not in available categories.
+            if value not in checked:
+                if value.lower() not in available:
+                    raise ValueError(
+                        f'It must be in categories;{", ".join(cls.categories)} (index: {index})'
+                    )
+                checked.add(value)
+
     # this is add-operator overriding functions.
     def __add__(self, other):
         if isinstance(other, ChargeHistoryItem):
@@ -474,6 +1096,16 @@ class ChargeHistoryItem:
         """
         return self.__description
 
+    @property
+    def posted_date(self) -> Optional[DateType]:
+        """
+        It returns the posted date.
+
+        Returns:
+            (DateType|None): __posted_date
+        """
+        return self.__posted_date
+
     @description.setter
     def description(self, value: str):
         """
@@ -484,12 +1116,14 @@ class ChargeHistoryItem:
         """
 
         self.__description = value
+        self.__edited()
 
     @category.setter
     def category(self, value: str):
         """
         Set __category from rvalue.
-        It must be str and available.
+        It must be str and available in the catalog of every bill having this charge
+        (see BillType.catalog), or in categories when no bill has a catalog.
 
         Args:
             value: (str) it is rvalue. It can be other types, but it is not allowed.
@@ -499,13 +1133,45 @@ class ChargeHistoryItem:
         if not isinstance(value, str):
             raise TypeError('It must be str.')
 
+        revisions = self.__revisions
+        if revisions is None:
+            revisions = ()
+        elif not isinstance(revisions, tuple):
+            revisions = (revisions,)
+        catalogs = [revision.catalog for revision in revisions if revision.catalog is not None]
+
         # when the value is not in available categories.
-        if not self.validation_category(value):
+        if catalogs:
+            for catalog in catalogs:
+                catalog.validate(value)
+        elif not self.validation_category(value):
             raise ValueError(
                 'It must be in categories;' + ', '.join(self.categories)
             )
 
         self.__category = value
+        self.__edited()
+
+    @staticmethod
+    def _attach(items: Iterable['ChargeHistoryItem'], revision: _Revision):
+        # it is called by BillType when charges are added.
+        for item in items:
+            revisions = item.__revisions
+            if revisions is None or revisions is revision:
+                item.__revisions = revision
+            elif isinstance(revisions, tuple):
+                if not any(other is revision for other in revisions):
+                    item.__revisions = revisions + (revision,)
+            else:
+                item.__revisions = (revisions, revision)
+
+    def __edited(self):
+        revisions = self.__revisions
+        if revisions is None:
+            return
+        value = _next_version()
+        for revision in revisions if isinstance(revisions, tuple) else (revisions,):
+            revision.value = value
 
     @classmethod
     def add_new_category(cls, category: str):
@@ -539,34 +1205,266 @@ class ChargeHistoryItem:
         return category.lower() in self.categories
 
 
-class BillType:
+class ChargeLedger:
     """
-    This is Bill type.
-    It has patient information and charge history.
+    This is an immutable charge history.
+    Charges are kept in small chunks, and append/pop return a new ledger
+    which shares every unchanged chunk with the old one (copy-on-write).
+    So a ledger can be read by many threads while a writer publishes new ones.
+
+    Every charge also gets a sequence number which never changes and never is reused,
+    so a position can be kept across appends and removals (see iter_after).
     """
 
-    def __init__(self, patient: PatientType):
+    # max number of charges in one chunk.
+    chunk_size = 64
+
+    def __init__(
+            self,
+            chunks: tuple = (),
+            offsets: tuple = (),
+            total: int = 0,
+            version: int = 0,
+            sequences: tuple = (),
+            last_sequence: int = 0
+    ):
+        """
+        Initialize this class.
+        Use ChargeLedger() for an empty ledger; other arguments are for append/pop.
+
+        Args:
+            chunks: (tuple) tuples of ChargeHistoryItem.
+            offsets: (tuple) index of the first charge in each chunk.
+            total: (int) sum of every cost.
+            version: (int) number of changes from the empty ledger.
+            sequences: (tuple) tuples of sequence numbers, same shape as chunks.
+            last_sequence: (int) the last given sequence number.
+        """
+
+        self.__chunks = chunks
+        self.__offsets = offsets
+        self.__total = total
+        self.__version = version
+        self.__sequences = sequences
+        self.__last_sequence = last_sequence
+        self.__length = offsets[-1] + len(chunks[-1]) if chunks else 0
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def __iter__(self):
+        for chunk in self.__chunks:
+            yield from chunk
+
+    def __getitem__(self, item) -> Union[ChargeHistoryItem, List[ChargeHistoryItem]]:
+        if isinstance(item, int):
+            chunk, position = self.__locate(item)
+            return self.__chunks[chunk][position]
+        elif isinstance(item, slice):
+            start, stop, step = item.indices(self.__length)
+
+            # forward slices walk only the needed chunks.
+            if step == 1:
+                return self.__range(start, stop)
+            elif step > 1:
+                return [self[index] for index in range(start, stop, step)]
+            return list(self)[item]
+        else:
+            raise TypeError('It must be [int] or [slice]')
+
+    def __range(self, start: int, stop: int) -> List[ChargeHistoryItem]:
+        result = []
+        if start >= stop:
+            return result
+
+        chunk, position = self.__locate(start)
+        while len(result) < stop - start:
+            result.extend(self.__chunks[chunk][position:position + stop - start - len(result)])
+            chunk, position = chunk + 1, 0
+        return result
+
+    def iter_after(self, sequence: int = 0):
+        """
+        Iterate charges whose sequence number is bigger than the given one.
+
+        Args:
+            sequence: (int) sequence number of the last seen charge. 0 is from the first.
+
+        Returns:
+            (Iterator[Tuple[int, ChargeHistoryItem]]): sequence number and charge.
+        """
+
+        # sequence numbers grow along the ledger, so the position is found by binary search.
+        chunk = bisect_right(self.__sequences, sequence, key=lambda sequences: sequences[-1])
+        if chunk == len(self.__chunks):
+            return
+
+        position = bisect_right(self.__sequences[chunk], sequence)
+        for sequences, items in zip(self.__sequences[chunk:], self.__chunks[chunk:]):
+            yield from zip(sequences[position:], items[position:])
+            position = 0
+
+    def __locate(self, index: int) -> tuple:
+        # negative index counts from the end like list.
+        if index < 0:
+            index += self.__length
+
+        if not 0 <= index < self.__length:
+            raise IndexError('ledger index out of range')
+
+        chunk = bisect_right(self.__offsets, index) - 1
+        return chunk, index - self.__offsets[chunk]
+
+    @property
+    def total(self) -> int:
+        """
+        It returns sum of every cost.
+
+        Returns:
+            (int): __total
+        """
+        return self.__total
+
+    @property
+    def version(self) -> int:
+        """
+        It returns number of changes from the empty ledger.
+
+        Returns:
+            (int): __version
+        """
+        return self.__version
+
+    def append(self, item: ChargeHistoryItem) -> 'ChargeLedger':
+        """
+        Make a new ledger with the item at the end.
+
+        Args:
+            item: (ChargeHistoryItem) new charge.
+
+        Returns:
+            (ChargeLedger): new ledger.
+        """
+
+        return self.extend((item,))
+
+    def extend(self, items: Iterable[ChargeHistoryItem]) -> 'ChargeLedger':
+        """
+        Make a new ledger with the items at the end.
+
+        Args:
+            items: (Iterable[ChargeHistoryItem]) new charges.
+
+        Returns:
+            (ChargeLedger): new ledger.
+        """
+
+        items = tuple(items)
+        if not items:
+            return self
+
+        total = self.__total + sum(item.cost for item in items)
+        last_sequence = self.__last_sequence + len(items)
+        new_sequences = tuple(range(self.__last_sequence + 1, last_sequence + 1))
+        chunks = list(self.__chunks)
+        sequences = list(self.__sequences)
+        offsets = list(self.__offsets)
+        length = self.__length
+
+        # fill the last chunk first. Only this chunk is copied.
+        if chunks and len(chunks[-1]) < self.chunk_size:
+            room = self.chunk_size - len(chunks[-1])
+            chunks[-1] = chunks[-1] + items[:room]
+            sequences[-1] = sequences[-1] + new_sequences[:room]
+            length += len(items[:room])
+            items, new_sequences = items[room:], new_sequences[room:]
+
+        for start in range(0, len(items), self.chunk_size):
+            chunk = items[start:start + self.chunk_size]
+            chunks.append(chunk)
+            sequences.append(new_sequences[start:start + self.chunk_size])
+            offsets.append(length)
+            length += len(chunk)
+
+        return ChargeLedger(
+            tuple(chunks), tuple(offsets), total, self.__version + 1, tuple(sequences), last_sequence
+        )
+
+    def pop(self, index: int = -1) -> tuple:
+        """
+        Make a new ledger without the charge at the index.
+
+        Args:
+            index: (int) the charge's index.
+
+        Returns:
+            (tuple): new ledger and the removed charge.
+        """
+
+        chunk, position = self.__locate(index)
+        old = self.__chunks[chunk]
+        item = old[position]
+        rest = old[:position] + old[position + 1:]
+        old_sequences = self.__sequences[chunk]
+        rest_sequences = old_sequences[:position] + old_sequences[position + 1:]
+
+        # following chunks start one index earlier.
+        shifted = tuple(offset - 1 for offset in self.__offsets[chunk + 1:])
+        if rest:
+            chunks = self.__chunks[:chunk] + (rest,) + self.__chunks[chunk + 1:]
+            sequences = self.__sequences[:chunk] + (rest_sequences,) + self.__sequences[chunk + 1:]
+            offsets = self.__offsets[:chunk + 1] + shifted
+        else:
+            chunks = self.__chunks[:chunk] + self.__chunks[chunk + 1:]
+            sequences = self.__sequences[:chunk] + self.__sequences[chunk + 1:]
+            offsets = self.__offsets[:chunk] + shifted
+
+        ledger = ChargeLedger(
+            chunks, offsets, self.__total - item.cost, self.__version + 1, sequences, self.__last_sequence
+        )
+        return ledger, item
+
+
+class BillSnapshot:
+    """
+    This is a read-only version of a bill, made by BillType.snapshot().
+    The charge history is frozen at that moment and never changes,
+    so it can be read without any lock while the bill is changed.
+    The patient and the charges themselves are shared with the bill.
+    """
+
+    def __init__(self, patient: PatientType, ledger: ChargeLedger):
         """
         Initialize this class.
-        patient is required.
 
         Args:
             patient: (PatientType) patient for bill.
+            ledger: (ChargeLedger) frozen charge history.
         """
 
         self.__patient = patient
-        self.__charge_history = []
+        self.__charge_history = ledger
 
     def __len__(self) -> int:
         return len(self.__charge_history)
 
+    def __iter__(self):
+        return iter(self.__charge_history)
+
     def __getitem__(self, item) -> Union[ChargeHistoryItem, List[ChargeHistoryItem]]:
-        if isinstance(item, int):
-            return self.__charge_history[item]
-        elif isinstance(item, slice):
-            return self.__charge_history[item.start:item.stop:item.step]
-        else:
-            raise TypeError('It must be [int] or [slice]')
+        return self.__charge_history[item]
+
+    def iter_after(self, sequence: int = 0):
+        """
+        Iterate charges after the sequence number (see ChargeLedger.iter_after).
+
+        Args:
+            sequence: (int) sequence number of the last seen charge. 0 is from the first.
+
+        Returns:
+            (Iterator[Tuple[int, ChargeHistoryItem]]): sequence number and charge.
+        """
+        return self.__charge_history.iter_after(sequence)
 
     def __str__(self) -> str:
         return f'''\t- bill -
@@ -578,6 +1476,111 @@ class BillType:
             list(map(lambda x: str(x), self.__charge_history))
         ) + f'\n\nTotal: {str(self.total_fee)}'
 
+    @property
+    def patient(self) -> PatientType:
+        """
+        It returns patient.
+
+        Returns:
+            (PatientType): __patient
+        """
+        return self.__patient
+
+    @property
+    def version(self) -> int:
+        """
+        It returns the bill's version when the snapshot was made.
+
+        Returns:
+            (int): version of the ledger.
+        """
+        return self.__charge_history.version
+
+    @property
+    def total_fee(self) -> int:
+        """
+        It returns total fee of the frozen charge history.
+
+        Returns:
+            (int): total fee.
+        """
+        return self.__charge_history.total
+
+    def show_bill(self):
+        """
+        Show itself using *print()*
+        """
+        print(self.__str__())
+
+
+class BillType:
+    """
+    This is Bill type.
+    It has patient information and charge history.
+
+    The charge history is a ChargeLedger which is replaced on every change.
+    Writers are serialized by a lock, but readers only read the current ledger
+    without any lock, so snapshot() and every read never wait for writers.
+    """
+
+    # opt-in change feed. If it is set, add_charge and remove_charge publish events.
+    # They are published under the write lock, in the order of the ledger, so a handler
+    # must not change the same bill; it can take events from a queue subscription instead.
+    event_bus: Optional[EventBus] = None
+
+    # opt-in revenue index (see revenue.RevenueIndex). It is kept up to date by add_charge and remove_charge.
+    revenue_index = None
+
+    def __init__(self, patient: PatientType):
+        """
+        Initialize this class.
+        patient is required.
+
+        Args:
+            patient: (PatientType) patient for bill.
+        """
+
+        self.__patient = patient
+        self.__charge_history = ChargeLedger()
+        self.__write_lock = threading.Lock()
+        # it is unique over every bill, for render_cache keys.
+        self.__token = _next_version()
+        self.__revision = _Revision()
+
+    @classmethod
+    def from_trusted(cls, patient: PatientType, items: Iterable[ChargeHistoryItem] = ()) -> 'BillType':
+        """
+        Create a bill with charges which are already validated, e.g. from our own snapshots.
+        It is a restore, not posting, so nothing is published to event_bus or revenue_index.
+
+        Args:
+            patient: (PatientType) patient for bill.
+            items: (Iterable[ChargeHistoryItem]) charges.
+
+        Returns:
+            (BillType): new bill.
+        """
+
+        bill = cls(patient)
+        items = tuple(items)
+        ChargeHistoryItem._attach(items, bill.__revision)
+        bill.__charge_history = bill.__charge_history.extend(items)
+        return bill
+
+    def __len__(self) -> int:
+        return len(self.__charge_history)
+
+    def __iter__(self):
+        return iter(self.__charge_history)
+
+    def __getitem__(self, item) -> Union[ChargeHistoryItem, List[ChargeHistoryItem]]:
+        return self.__charge_history[item]
+
+    def __str__(self) -> str:
+        snapshot = self.snapshot()
+        key = ('bill', self.__token, snapshot.version, self.__revision.value) + self.__patient._render_key()
+        return render_cache.render(key, snapshot.__str__)
+
     @property
     def patient(self) -> PatientType:
         """
@@ -589,16 +1592,74 @@ class BillType:
 
         return self.__patient
 
+    @property
+    def version(self) -> int:
+        """
+        It returns version. It is increased on every change of charge history.
+
+        Returns:
+            (int): version of the ledger.
+        """
+
+        return self.__charge_history.version
+
+    @property
+    def catalog(self):
+        """
+        It returns the opt-in catalog of the hospital (see catalog.TenantCatalog).
+        If it is set, add_charge and ChargeHistoryItem.category of the charges validate
+        categories with it instead of ChargeHistoryItem.categories.
+
+        Returns:
+            (catalog.Catalog|catalog.TenantCatalog|None): the catalog.
+        """
+
+        return self.__revision.catalog
+
+    @catalog.setter
+    def catalog(self, value):
+        """
+        Set the catalog. It is shared with the charges through the revision.
+
+        Args:
+            value: (catalog.Catalog|catalog.TenantCatalog|None) it is rvalue.
+        """
+
+        self.__revision.catalog = value
+
+    @property
+    def revision(self) -> int:
+        """
+        It returns revision. It is changed when a charge of this bill is changed in place,
+        e.g. its description, which does not change version.
+
+        Returns:
+            (int): revision.
+        """
+
+        return self.__revision.value
+
     @property
     def total_fee(self) -> int:
         """
-        It calculates total fee and returns the result.
+        It returns total fee. It is kept by the ledger, so nothing is calculated here.
+
+        Returns:
+            (int): total fee.
+        """
+
+        return self.__charge_history.total
+
+    def snapshot(self) -> BillSnapshot:
+        """
+        Make a read-only version of this bill.
+        It does not copy any charge, so it is cheap to call for every report.
 
         Returns:
-            (int): calculated result.
+            (BillSnapshot): the snapshot.
         """
 
-        return sum(self.__charge_history)
+        return BillSnapshot(self.__patient, self.__charge_history)
 
     def show_bill(self):
         """
@@ -606,7 +1667,7 @@ class BillType:
         """
         print(self.__str__())
 
-    def add_charge(self, cost: int, category: str, description: str = None):
+    def add_charge(self, cost: int, category: str, description: str = None, posted_date: DateType = None):
         """
         Add a new charge in __charge_history.
 
@@ -614,9 +1675,47 @@ class BillType:
             cost: (int) cost for something.
             category: (str) type of cost.
             description: (str|None) additional field.
+            posted_date: (DateType|None) the date when the charge is posted.
         """
 
-        self.__charge_history.append(ChargeHistoryItem(cost, category, description))
+        item = ChargeHistoryItem(cost, category, description, posted_date, self.__revision.catalog)
+        ChargeHistoryItem._attach((item,), self.__revision)
+
+        with self.__write_lock:
+            # publishing the new ledger is one assignment, so readers see old or new.
+            self.__charge_history = self.__charge_history.append(item)
+            index = len(self.__charge_history) - 1
+
+            # events are published under the lock, so they are in the order of the ledger.
+            if self.event_bus is not None:
+                self.event_bus.publish(ChargeAdded(self, index, item))
+
+        if self.revenue_index is not None:
+            self.revenue_index.add(item)
+
+    def add_charges(self, items: Iterable[ChargeHistoryItem]):
+        """
+        Add many charges at once. The ledger is replaced only once.
+        The items are not validated, so make them with ChargeHistoryItem(...) or validated from_trusted(...).
+
+        Args:
+            items: (Iterable[ChargeHistoryItem]) new charges.
+        """
+
+        items = tuple(items)
+        ChargeHistoryItem._attach(items, self.__revision)
+
+        with self.__write_lock:
+            first = len(self.__charge_history)
+            self.__charge_history = self.__charge_history.extend(items)
+
+            if self.event_bus is not None:
+                for index, item in enumerate(items, first):
+                    self.event_bus.publish(ChargeAdded(self, index, item))
+
+        if self.revenue_index is not None:
+            for item in items:
+                self.revenue_index.add(item)
 
     def remove_charge(self, index: int):
         """
@@ -626,4 +1725,17 @@ class BillType:
             index: (int) the charge's index.
         """
 
-        return self.__charge_history.pop(index)
+        with self.__write_lock:
+            self.__charge_history, item = self.__charge_history.pop(index)
+
+            # publish non-negative index to consumers.
+            if index < 0:
+                index += len(self.__charge_history) + 1
+
+            if self.event_bus is not None:
+                self.event_bus.publish(ChargeRemoved(self, index, item))
+
+        if self.revenue_index is not None:
+            self.revenue_index.remove(item)
+
+        return item
@@ -0,0 +1,182 @@
+"""
+Cursor pagination for Hospital management system
+
+This module serves charge histories and collections page by page.
+
+Cursors are opaque strings. A charge cursor keeps the sequence number of the last
+charge (see ChargeLedger.iter_after), so pages never skip or repeat charges when
+new charges are appended or old ones are removed between requests.
+Every page is read from one snapshot of the bill, so it is consistent by itself.
+"""
+
+import base64
+from bisect import bisect_right
+from itertools import islice
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Sequence
+
+from main import ChargeHistoryItem, BillType
+
+
+class Page(NamedTuple):
+    """
+    This is one page.
+    cursor is for the next page. It is given even if there is no more item now,
+    so a client can ask later for newly appended items.
+    """
+
+    items: List[Any]
+    cursor: str
+    has_more: bool
+
+
+def encode_cursor(kind: str, value: int) -> str:
+    """
+    Make an opaque cursor.
+
+    Args:
+        kind: (str) what the cursor is for.
+        value: (int) position.
+
+    Returns:
+        (str): url-safe cursor.
+    """
+
+    return base64.urlsafe_b64encode(f'{kind}:{value}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], kind: str) -> int:
+    """
+    Read a cursor made by encode_cursor.
+
+    Args:
+        cursor: (str|None) cursor. None is the first page.
+        kind: (str) expected kind.
+
+    Returns:
+        (int): position. 0 for None.
+    """
+
+    if cursor is None:
+        return 0
+
+    # when the value is not str.
+    if not isinstance(cursor, str):
+        raise TypeError('It must be str.')
+
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        cursor_kind, value = decoded.split(':')
+        position = int(value)
+    except ValueError:
+        raise ValueError('It is not a valid cursor.') from None
+
+    # when the cursor is made for another kind of page.
+    if cursor_kind != kind:
+        raise ValueError(f'It is not a cursor of {kind}.')
+
+    return position
+
+
+def iter_charges(bill: BillType, cursor: str = None) -> Iterator[ChargeHistoryItem]:
+    """
+    Iterate charges of one snapshot lazily, from the cursor.
+
+    Args:
+        bill: (BillType) the bill.
+        cursor: (str|None) cursor from page_charges. None is from the first.
+
+    Returns:
+        (Iterator[ChargeHistoryItem]): charges.
+    """
+
+    for _, item in bill.snapshot().iter_after(decode_cursor(cursor, 'charge')):
+        yield item
+
+
+def page_charges(bill: BillType, cursor: str = None, limit: int = 50) -> Page:
+    """
+    Get one page of charges.
+
+    Args:
+        bill: (BillType) the bill.
+        cursor: (str|None) cursor of the previous page. None is the first page.
+        limit: (int) max number of charges.
+
+    Returns:
+        (Page): charges and the next cursor.
+    """
+
+    if limit < 1:
+        raise ValueError('It must be positive.')
+
+    sequence = decode_cursor(cursor, 'charge')
+
+    # one more charge tells whether there is more.
+    rows = list(islice(bill.snapshot().iter_after(sequence), limit + 1))
+    items = [item for _, item in rows[:limit]]
+    if items:
+        sequence = rows[len(items) - 1][0]
+
+    return Page(items, encode_cursor('charge', sequence), len(rows) > limit)
+
+
+def _patient_id(item) -> int:
+    # patients have id, bills have patient.
+    return item.id if hasattr(item, 'id') else item.patient.id
+
+
+def iter_collection(
+        items: Sequence,
+        cursor: str = None,
+        key: Callable[[Any], int] = _patient_id
+) -> Iterator[Any]:
+    """
+    Iterate a collection lazily, from the cursor.
+
+    Args:
+        items: (Sequence) patients or bills sorted by key, e.g. a list in admission order.
+        cursor: (str|None) cursor from page_collection. None is from the first.
+        key: (Callable[[Any], int]) unique int key. Default is the patient id.
+
+    Returns:
+        (Iterator[Any]): items.
+    """
+
+    index = bisect_right(items, decode_cursor(cursor, 'item'), key=key)
+
+    # items appended while iterating are also visited.
+    while index < len(items):
+        yield items[index]
+        index += 1
+
+
+def page_collection(
+        items: Sequence,
+        cursor: str = None,
+        limit: int = 50,
+        key: Callable[[Any], int] = _patient_id
+) -> Page:
+    """
+    Get one page of a collection.
+    The position is found by binary search, and only the page is copied.
+
+    Args:
+        items: (Sequence) patients or bills sorted by key, e.g. a list in admission order.
+        cursor: (str|None) cursor of the previous page. None is the first page.
+        limit: (int) max number of items.
+        key: (Callable[[Any], int]) unique int key. Default is the patient id.
+
+    Returns:
+        (Page): items and the next cursor.
+    """
+
+    if limit < 1:
+        raise ValueError('It must be positive.')
+
+    position = decode_cursor(cursor, 'item')
+    index = bisect_right(items, position, key=key)
+    page = [items[i] for i in range(index, min(index + limit, len(items)))]
+    if page:
+        position = key(page[-1])
+
+    return Page(page, encode_cursor('item', position), index + len(page) < len(items))
@@ -0,0 +1,850 @@
+"""
+Query engine for Hospital management system
+
+This module filters bills by patient and charge attributes with a small DSL,
+instead of lambdas over full scans.
+
+    table = PatientTable(bills)
+    table.create_index('admitted_date')
+    query = table.where(
+        F('age').between(20, 40)
+        & (F('speciality') == 'Surgery')
+        & F('admitted_date').between(DateType(2022, 4, 1), DateType(2022, 4, 30))
+        & (F('open') == True)
+        & (F('total_fee') > 1000)
+    )
+    print(query.explain())
+    query.select('id', 'total_fee')
+
+A predicate is compiled into a plan. The most selective indexed condition is read from
+its index and the others filter the found rows; without a useful index, every condition
+is a column scan, vectorized with numpy when it is installed.
+Comparisons need parentheses, because & and | bind tighter than == and >.
+
+A table holds values of the bills when it is made; make a new one to see later changes.
+"""
+
+import operator
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from main import DateType, DoctorType, BillType
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FieldType(NamedTuple):
+    """
+    This is a queryable field.
+    kind is one of int, str, bool, date (stored as ordinal) and set (any of the values).
+    """
+
+    kind: str
+    get: Callable[[BillType], Any]
+
+
+FIELDS = {
+    'id': FieldType('int', lambda bill: bill.patient.id),
+    'first_name': FieldType('str', lambda bill: bill.patient.first_name),
+    'last_name': FieldType('str', lambda bill: bill.patient.last_name),
+    'age': FieldType('int', lambda bill: bill.patient.age),
+    'birthday': FieldType('date', lambda bill: bill.patient.birthday),
+    'admitted_date': FieldType('date', lambda bill: bill.patient.admitted_date),
+    'discharged_date': FieldType('date', lambda bill: bill.patient.discharged_date),
+    'open': FieldType('bool', lambda bill: bill.patient.discharged_date is None),
+    'speciality': FieldType('str', lambda bill: bill.patient.attending_physician.speciality),
+    # id of the doctor; a DoctorType can be given as the value.
+    'physician': FieldType('int', lambda bill: bill.patient.attending_physician.id),
+    'total_fee': FieldType('int', lambda bill: bill.total_fee),
+    'category': FieldType('set', lambda bill: frozenset(charge.category for charge in bill)),
+}
+
+_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+AGGREGATES = ('count', 'sum', 'min', 'max', 'mean')
+
+# an index is not used when it finds more than this part of the table.
+_INDEX_SELECTIVITY = 0.3
+
+
+def _check_field(name: str) -> FieldType:
+    # when the field is not available.
+    if name not in FIELDS:
+        raise ValueError('It must be in fields;' + ', '.join(FIELDS))
+    return FIELDS[name]
+
+
+def _key(name: str, value):
+    # dates are compared by ordinal.
+    if FIELDS[name].kind == 'date':
+        # when the value is not DateType.
+        if not isinstance(value, DateType):
+            raise TypeError('It must be DateType.')
+        return value.toordinal()
+    # doctors are compared by id.
+    if name == 'physician' and isinstance(value, DoctorType):
+        return value.id
+    return value
+
+
+def _show(value) -> str:
+    if isinstance(value, DateType):
+        return value.strftime('%Y-%m-%d')
+    return repr(value)
+
+
+# masks and row positions are numpy arrays with numpy, or lists without it.
+
+def _mask(values: Iterable[bool]):
+    if np is not None:
+        return np.fromiter(values, dtype=bool)
+    return list(values)
+
+
+def _and(left, right):
+    if np is not None:
+        return left & right
+    return [a and b for a, b in zip(left, right)]
+
+
+def _or(left, right):
+    if np is not None:
+        return left | right
+    return [a or b for a, b in zip(left, right)]
+
+
+def _not(mask):
+    if np is not None:
+        return ~mask
+    return [not a for a in mask]
+
+
+def _select(rows, mask):
+    if np is not None:
+        return rows[mask]
+    return [row for row, keep in zip(rows, mask) if keep]
+
+
+def _is_array(values) -> bool:
+    return np is not None and isinstance(values, np.ndarray)
+
+
+def _positions(rows: Iterable[int]):
+    if np is not None:
+        return np.unique(np.fromiter(rows, dtype=np.int64))
+    return sorted(set(rows))
+
+
+class Predicate:
+    """
+    This is the base of conditions. Combine them with &, | and ~.
+    """
+
+    def __and__(self, other: 'Predicate') -> 'Predicate':
+        return And(self, other)
+
+    def __or__(self, other: 'Predicate') -> 'Predicate':
+        return Or(self, other)
+
+    def __invert__(self) -> 'Predicate':
+        return Not(self)
+
+    def evaluate(self, table: 'PatientTable', rows):
+        """
+        Check the rows.
+
+        Args:
+            table: (PatientTable) the table.
+            rows: (ndarray|List[int]) row positions.
+
+        Returns:
+            (ndarray|List[bool]): mask of matched rows.
+        """
+        raise NotImplementedError
+
+    def ranges(self) -> Optional[List[tuple]]:
+        """
+        It returns key ranges for an index of the field.
+
+        Returns:
+            (List[tuple]|None): (low, high, low inclusive, high inclusive); None is unbounded.
+                None when an index cannot answer it.
+        """
+        return None
+
+
+class Compare(Predicate):
+    """
+    This is field <operator> value.
+    """
+
+    def __init__(self, field: str, op: str, value):
+        """
+        Initialize this class.
+
+        Args:
+            field: (str) field name.
+            op: (str) one of ==, !=, <, <=, >, >=.
+            value: (Any) value to compare.
+        """
+
+        # a set field has a value or not.
+        if _check_field(field).kind == 'set' and op != '==':
+            raise ValueError('It must be == or isin for a set field.')
+
+        self.field = field
+        self.op = op
+        self.value = value
+        self.key = _key(field, value)
+
+    def __str__(self) -> str:
+        return f'{self.field} {self.op} {_show(self.value)}'
+
+    def evaluate(self, table: 'PatientTable', rows):
+        values = table.column(self.field, rows)
+        if FIELDS[self.field].kind == 'set':
+            return _mask(self.key in value for value in values)
+
+        compare = _OPERATORS[self.op]
+        if _is_array(values):
+            # str columns are object arrays without null, so they are compared element-wise too.
+            mask = np.asarray(compare(values, self.key), dtype=bool)
+            nulls = table.nulls(self.field, rows)
+            return mask if nulls is None else mask & ~nulls
+        return _mask(value is not None and compare(value, self.key) for value in values)
+
+    def ranges(self) -> Optional[List[tuple]]:
+        key = self.key
+        return {
+            '==': [(key, key, True, True)],
+            '<': [(None, key, True, False)],
+            '<=': [(None, key, True, True)],
+            '>': [(key, None, False, True)],
+            '>=': [(key, None, True, True)],
+        }.get(self.op)
+
+
+class Between(Predicate):
+    """
+    This is low <= field <= high.
+    """
+
+    def __init__(self, field: str, low, high):
+        """
+        Initialize this class.
+
+        Args:
+            field: (str) field name.
+            low: (Any) lowest value.
+            high: (Any) highest value.
+        """
+
+        # when the field has no order.
+        if _check_field(field).kind == 'set':
+            raise ValueError('It must be == or isin for a set field.')
+
+        self.field = field
+        self.low, self.high = low, high
+        self.__keys = (_key(field, low), _key(field, high))
+
+    def __str__(self) -> str:
+        return f'{self.field} between {_show(self.low)} and {_show(self.high)}'
+
+    def evaluate(self, table: 'PatientTable', rows):
+        return _and(Compare(self.field, '>=', self.low).evaluate(table, rows),
+                    Compare(self.field, '<=', self.high).evaluate(table, rows))
+
+    def ranges(self) -> Optional[List[tuple]]:
+        low, high = self.__keys
+        return [(low, high, True, True)]
+
+
+class In(Predicate):
+    """
+    This is field in values. For a set field, it has any of the values.
+    """
+
+    def __init__(self, field: str, values: Iterable):
+        """
+        Initialize this class.
+
+        Args:
+            field: (str) field name.
+            values: (Iterable) values.
+        """
+
+        _check_field(field)
+        self.field = field
+        self.values = list(values)
+        self.__keys = frozenset(_key(field, value) for value in self.values)
+
+    def __str__(self) -> str:
+        return f'{self.field} in ({", ".join(_show(value) for value in self.values)})'
+
+    def evaluate(self, table: 'PatientTable', rows):
+        values = table.column(self.field, rows)
+        keys = self.__keys
+        if FIELDS[self.field].kind == 'set':
+            return _mask(not keys.isdisjoint(value) for value in values)
+
+        if _is_array(values) and values.dtype != object:
+            mask = np.isin(values, list(keys))
+            nulls = table.nulls(self.field, rows)
+            return mask if nulls is None else mask & ~nulls
+        return _mask(value in keys for value in values)
+
+    def ranges(self) -> Optional[List[tuple]]:
+        return [(key, key, True, True) for key in sorted(self.__keys)]
+
+
+class And(Predicate):
+    """
+    This is every condition.
+    """
+
+    def __init__(self, *predicates: Predicate):
+        self.predicates = []
+        # nested ones are flattened, so the planner sees every condition.
+        for predicate in predicates:
+            self.predicates.extend(predicate.predicates if isinstance(predicate, And) else [predicate])
+
+    def __str__(self) -> str:
+        return ' AND '.join(map(str, self.predicates))
+
+    def evaluate(self, table: 'PatientTable', rows):
+        mask = self.predicates[0].evaluate(table, rows)
+        for predicate in self.predicates[1:]:
+            mask = _and(mask, predicate.evaluate(table, rows))
+        return mask
+
+
+class Or(Predicate):
+    """
+    This is any condition.
+    """
+
+    def __init__(self, *predicates: Predicate):
+        self.predicates = []
+        for predicate in predicates:
+            self.predicates.extend(predicate.predicates if isinstance(predicate, Or) else [predicate])
+
+    def __str__(self) -> str:
+        return '(' + ' OR '.join(map(str, self.predicates)) + ')'
+
+    def evaluate(self, table: 'PatientTable', rows):
+        mask = self.predicates[0].evaluate(table, rows)
+        for predicate in self.predicates[1:]:
+            mask = _or(mask, predicate.evaluate(table, rows))
+        return mask
+
+
+class Not(Predicate):
+    """
+    This is not the condition.
+    """
+
+    def __init__(self, predicate: Predicate):
+        self.predicate = predicate
+
+    def __str__(self) -> str:
+        return f'NOT ({self.predicate})'
+
+    def evaluate(self, table: 'PatientTable', rows):
+        return _not(self.predicate.evaluate(table, rows))
+
+
+class F:
+    """
+    This is a field in a predicate, e.g. F('age') >= 65.
+    """
+
+    def __init__(self, name: str):
+        _check_field(name)
+        self.name = name
+
+    def __eq__(self, value) -> Predicate:
+        return Compare(self.name, '==', value)
+
+    def __ne__(self, value) -> Predicate:
+        return Compare(self.name, '!=', value)
+
+    def __lt__(self, value) -> Predicate:
+        return Compare(self.name, '<', value)
+
+    def __le__(self, value) -> Predicate:
+        return Compare(self.name, '<=', value)
+
+    def __gt__(self, value) -> Predicate:
+        return Compare(self.name, '>', value)
+
+    def __ge__(self, value) -> Predicate:
+        return Compare(self.name, '>=', value)
+
+    def between(self, low, high) -> Predicate:
+        return Between(self.name, low, high)
+
+    def isin(self, values: Iterable) -> Predicate:
+        return In(self.name, values)
+
+
+class SortedIndex:
+    """
+    This is a sorted index of a field. Null values are not in it.
+    A set field has one entry for each of its values.
+    """
+
+    def __init__(self, field: str, values: List):
+        """
+        Initialize this class.
+
+        Args:
+            field: (str) field name.
+            values: (List) column values by row.
+        """
+
+        if FIELDS[field].kind == 'set':
+            entries = sorted((key, row) for row, value in enumerate(values) for key in value)
+        else:
+            entries = sorted((value, row) for row, value in enumerate(values) if value is not None)
+
+        self.field = field
+        self.__keys = [key for key, _ in entries]
+        self.__rows = [row for _, row in entries]
+
+    def __bounds(self, ranges: List[tuple]):
+        keys = self.__keys
+        for low, high, low_inclusive, high_inclusive in ranges:
+            start = 0 if low is None else (bisect_left if low_inclusive else bisect_right)(keys, low)
+            stop = len(keys) if high is None else (bisect_right if high_inclusive else bisect_left)(keys, high)
+            if start < stop:
+                yield start, stop
+
+    def count(self, ranges: List[tuple]) -> int:
+        """
+        Count entries in the ranges without reading them.
+
+        Args:
+            ranges: (List[tuple]) from Predicate.ranges.
+
+        Returns:
+            (int): number of entries.
+        """
+        return sum(stop - start for start, stop in self.__bounds(ranges))
+
+    def lookup(self, ranges: List[tuple]):
+        """
+        Find rows in the ranges.
+
+        Args:
+            ranges: (List[tuple]) from Predicate.ranges.
+
+        Returns:
+            (ndarray|List[int]): sorted row positions.
+        """
+
+        rows = self.__rows
+        return _positions(row for start, stop in self.__bounds(ranges) for row in rows[start:stop])
+
+
+class IndexScan:
+    """
+    This is a plan reading rows from an index.
+    """
+
+    def __init__(self, predicate: Predicate, index: SortedIndex, estimate: int):
+        self.predicate = predicate
+        self.index = index
+        self.estimate = estimate
+
+    def rows(self, table: 'PatientTable'):
+        return self.index.lookup(self.predicate.ranges())
+
+    def explain(self, table: 'PatientTable') -> List[str]:
+        return [f'IndexScan: {self.predicate} (index {self.index.field}, about {self.estimate} of {len(table)} rows)']
+
+
+class IndexUnion:
+    """
+    This is a plan reading rows from indexes of every condition of OR.
+    """
+
+    def __init__(self, scans: List[IndexScan]):
+        self.scans = scans
+        self.estimate = sum(scan.estimate for scan in scans)
+
+    def rows(self, table: 'PatientTable'):
+        return _positions(row for scan in self.scans for row in scan.rows(table))
+
+    def explain(self, table: 'PatientTable') -> List[str]:
+        return ['IndexUnion'] + ['  ' + line for scan in self.scans for line in scan.explain(table)]
+
+
+class ColumnScan:
+    """
+    This is a plan checking every row.
+    """
+
+    def __init__(self, predicate: Optional[Predicate]):
+        self.predicate = predicate
+
+    def rows(self, table: 'PatientTable'):
+        rows = table.all_rows()
+        return rows if self.predicate is None else _select(rows, self.predicate.evaluate(table, rows))
+
+    def explain(self, table: 'PatientTable') -> List[str]:
+        engine = 'numpy' if np is not None else 'python'
+        return [f'ColumnScan: {self.predicate or "all"} ({len(table)} rows, {engine})']
+
+
+class Filter:
+    """
+    This is a plan checking rows found by another plan.
+    """
+
+    def __init__(self, child, predicate: Predicate):
+        self.child = child
+        self.predicate = predicate
+
+    def rows(self, table: 'PatientTable'):
+        rows = self.child.rows(table)
+        return _select(rows, self.predicate.evaluate(table, rows))
+
+    def explain(self, table: 'PatientTable') -> List[str]:
+        return [f'Filter: {self.predicate}'] + ['  ' + line for line in self.child.explain(table)]
+
+
+class PatientTable:
+    """
+    This is a table of bills, one row for each bill, with columns and indexes built on demand.
+    """
+
+    def __init__(self, bills: Iterable[BillType], indexes: Iterable[str] = ()):
+        """
+        Initialize this class.
+
+        Args:
+            bills: (Iterable[BillType]) bills.
+            indexes: (Iterable[str]) fields to index, e.g. id, admitted_date, physician, category.
+        """
+
+        self.__bills = list(bills)
+        self.__values: Dict[str, List] = {}
+        self.__columns: Dict[str, Any] = {}
+        self.__nulls: Dict[str, Any] = {}
+        self.__indexes: Dict[str, SortedIndex] = {}
+        for field in indexes:
+            self.create_index(field)
+
+    def __len__(self) -> int:
+        return len(self.__bills)
+
+    @property
+    def bills(self) -> List[BillType]:
+        """
+        It returns bills by row.
+
+        Returns:
+            (List[BillType]): bills.
+        """
+        return self.__bills
+
+    @property
+    def indexes(self) -> List[str]:
+        """
+        It returns indexed fields.
+
+        Returns:
+            (List[str]): field names.
+        """
+        return list(self.__indexes)
+
+    def create_index(self, field: str):
+        """
+        Build an index of the field.
+
+        Args:
+            field: (str) field name.
+        """
+
+        _check_field(field)
+        self.__indexes[field] = SortedIndex(field, self.__raw(field))
+
+    def index(self, field: str) -> Optional[SortedIndex]:
+        return self.__indexes.get(field)
+
+    def all_rows(self):
+        return np.arange(len(self.__bills)) if np is not None else list(range(len(self.__bills)))
+
+    def __raw(self, field: str) -> List:
+        # python values by row; dates are ordinals.
+        if field not in self.__values:
+            kind, get = FIELDS[field]
+            values = [get(bill) for bill in self.__bills]
+            if kind == 'date':
+                values = [value.toordinal() if value is not None else None for value in values]
+            self.__values[field] = values
+        return self.__values[field]
+
+    def column(self, field: str, rows=None):
+        """
+        It returns values of the field.
+        With numpy, int, bool and date fields are arrays and nulls are 0 (see nulls).
+
+        Args:
+            field: (str) field name.
+            rows: (ndarray|List[int]|None) row positions. None is every row.
+
+        Returns:
+            (ndarray|List): values.
+        """
+
+        if field not in self.__columns:
+            values = self.__raw(field)
+            kind = FIELDS[field].kind
+            if np is None or kind == 'set':
+                self.__columns[field] = values
+            elif kind == 'str':
+                self.__columns[field] = np.array(values, dtype=object)
+            else:
+                nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+                self.__nulls[field] = nulls if nulls.any() else None
+                self.__columns[field] = np.array(
+                    [0 if value is None else value for value in values],
+                    dtype=bool if kind == 'bool' else np.int64,
+                )
+
+        column = self.__columns[field]
+        if rows is None:
+            return column
+        if _is_array(column):
+            return column[rows]
+        return [column[row] for row in rows]
+
+    def nulls(self, field: str, rows=None):
+        """
+        It returns the null mask of a numpy column.
+
+        Args:
+            field: (str) field name.
+            rows: (ndarray|None) row positions. None is every row.
+
+        Returns:
+            (ndarray|None): True for null values. None when there is no null.
+        """
+
+        self.column(field)
+        nulls = self.__nulls.get(field)
+        if nulls is None or rows is None:
+            return nulls
+        return nulls[rows]
+
+    def where(self, predicate: Predicate = None) -> 'Query':
+        """
+        Make a query.
+
+        Args:
+            predicate: (Predicate|None) condition. None is every row.
+
+        Returns:
+            (Query): the query.
+        """
+        return Query(self, predicate)
+
+
+def _access(table: PatientTable, predicate: Predicate):
+    # the index plan of one condition, or None.
+    if isinstance(predicate, Or):
+        scans = [_access(table, child) for child in predicate.predicates]
+        if all(isinstance(scan, IndexScan) for scan in scans):
+            return IndexUnion(scans)
+        return None
+
+    index = table.index(getattr(predicate, 'field', None))
+    ranges = predicate.ranges()
+    if index is None or ranges is None:
+        return None
+    return IndexScan(predicate, index, index.count(ranges))
+
+
+def compile_plan(table: PatientTable, predicate: Optional[Predicate]):
+    """
+    Choose a plan for the predicate.
+
+    Args:
+        table: (PatientTable) the table.
+        predicate: (Predicate|None) condition. None is every row.
+
+    Returns:
+        (IndexScan|IndexUnion|ColumnScan|Filter): the plan.
+    """
+
+    if predicate is None:
+        return ColumnScan(None)
+
+    conditions = predicate.predicates if isinstance(predicate, And) else [predicate]
+    accesses = [(access, condition) for condition in conditions
+                for access in [_access(table, condition)] if access is not None]
+    if not accesses:
+        return ColumnScan(predicate)
+
+    access, condition = min(accesses, key=lambda pair: pair[0].estimate)
+    # reading most of the table through an index is slower than scanning columns.
+    if access.estimate > len(table) * _INDEX_SELECTIVITY:
+        return ColumnScan(predicate)
+
+    rest = [other for other in conditions if other is not condition]
+    if not rest:
+        return access
+    return Filter(access, rest[0] if len(rest) == 1 else And(*rest))
+
+
+class Query:
+    """
+    This is a compiled query of a table.
+    """
+
+    def __init__(self, table: PatientTable, predicate: Predicate = None):
+        """
+        Initialize this class. The plan is chosen here.
+
+        Args:
+            table: (PatientTable) the table.
+            predicate: (Predicate|None) condition. None is every row.
+        """
+
+        self.table = table
+        self.predicate = predicate
+        self.plan = compile_plan(table, predicate)
+        self.__rows = None
+
+    def explain(self) -> str:
+        """
+        It returns the plan as text.
+
+        Returns:
+            (str): the plan.
+        """
+        return '\n'.join(self.plan.explain(self.table))
+
+    def rows(self):
+        """
+        It returns matched row positions. They are computed once.
+
+        Returns:
+            (ndarray|List[int]): sorted row positions.
+        """
+
+        if self.__rows is None:
+            self.__rows = self.plan.rows(self.table)
+        return self.__rows
+
+    def bills(self) -> List[BillType]:
+        """
+        It returns matched bills.
+
+        Returns:
+            (List[BillType]): bills.
+        """
+
+        bills = self.table.bills
+        return [bills[row] for row in self.rows()]
+
+    def count(self) -> int:
+        return len(self.rows())
+
+    def select(self, *fields: str) -> List[Tuple]:
+        """
+        Project matched rows to the fields.
+
+        Args:
+            fields: (str) field names.
+
+        Returns:
+            (List[Tuple]): values of the fields for each row.
+        """
+
+        getters = [_check_field(field).get for field in fields]
+        return [tuple(get(bill) for get in getters) for bill in self.bills()]
+
+    def aggregate(self, function: str, field: str = None):
+        """
+        Aggregate a field over matched rows. Null values are skipped.
+
+        Args:
+            function: (str) one of count, sum, min, max, mean.
+            field: (str|None) field name. It is not needed for count.
+
+        Returns:
+            (Any): the result. min and max of a date field are DateType. None when nothing is aggregated.
+        """
+        return _aggregate(self.table, self.rows(), function, field)
+
+    def group_by(self, key: str, function: str = 'count', field: str = None) -> Dict[Any, Any]:
+        """
+        Aggregate matched rows by values of the key field.
+
+        Args:
+            key: (str) field name to group by.
+            function: (str) one of count, sum, min, max, mean.
+            field: (str|None) field name to aggregate. It is not needed for count.
+
+        Returns:
+            (Dict[Any, Any]): key value -> result.
+        """
+
+        # when rows cannot have one key.
+        if _check_field(key).kind == 'set':
+            raise ValueError('It must not be a set field.')
+
+        get = FIELDS[key].get
+        bills = self.table.bills
+        groups: Dict[Any, List[int]] = {}
+        for row in self.rows():
+            groups.setdefault(get(bills[row]), []).append(int(row))
+
+        return {value: _aggregate(self.table, rows, function, field) for value, rows in groups.items()}
+
+
+def _aggregate(table: PatientTable, rows, function: str, field: Optional[str]):
+    # when the function is not available.
+    if function not in AGGREGATES:
+        raise ValueError('It must be in aggregates;' + ', '.join(AGGREGATES))
+
+    if function == 'count':
+        return len(rows)
+
+    kind = _check_field(field).kind
+    # when the values cannot be added.
+    if function in ('sum', 'mean') and kind != 'int':
+        raise ValueError('It must be an int field.')
+    if kind in ('set', 'bool'):
+        raise ValueError('It must not be a set or bool field.')
+
+    values = table.column(field, rows)
+    if _is_array(values):
+        nulls = table.nulls(field, rows)
+        if nulls is not None:
+            values = values[~nulls]
+        if len(values) == 0:
+            return None
+        result = {'sum': values.sum, 'min': values.min, 'max': values.max, 'mean': values.mean}[function]()
+        result = result.item()
+    else:
+        values = [value for value in values if value is not None]
+        if not values:
+            return None
+        result = {'sum': sum, 'min': min, 'max': max, 'mean': lambda v: sum(v) / len(v)}[function](values)
+
+    if kind == 'date':
+        return DateType.fromordinal(result)
+    return result
@@ -0,0 +1,260 @@
+"""
+Bill reconciliation for Hospital management system
+
+This module compares our bills with another copy, e.g. the insurer's, every night.
+
+- digest: each bill has a digest of its charges which does not depend on their order.
+  Bills with the same digest on both sides are skipped without looking at charges.
+- diff: charges of other bills are matched by hashing, in linear time even if reordered.
+  A charge with the same category, description and posted date but another cost is changed.
+
+Bills differing are compared in worker processes.
+"""
+
+import os
+import weakref
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from main import DateType, ChargeHistoryItem, BillType
+
+# (cost, category, description, posted date ordinal)
+ChargeRecord = Tuple[int, str, Optional[str], Optional[int]]
+
+# sums of charge hashes are kept in this many bits.
+_DIGEST_BITS = 64
+
+
+class ChargeChange(NamedTuple):
+    """
+    This is a charge found on both sides with different costs.
+    """
+
+    category: str
+    description: Optional[str]
+    posted_date: Optional[int]  # ordinal
+    our_cost: int
+    their_cost: int
+
+
+class BillDiff(NamedTuple):
+    """
+    This is the difference of one bill. added is only in theirs, removed is only in ours.
+    """
+
+    patient_id: int
+    added: List[ChargeRecord]
+    removed: List[ChargeRecord]
+    changed: List[ChargeChange]
+
+
+class ReconciliationReport(NamedTuple):
+    """
+    This is the result of a reconciliation. Only bills with differences are in diffs.
+    """
+
+    bills: int
+    skipped: int
+    diffs: List[BillDiff]
+
+    def __str__(self) -> str:
+        lines = [f'{self.bills} bills: {self.skipped} unchanged, {len(self.diffs)} different']
+        for diff in self.diffs:
+            lines.append(f'patient {diff.patient_id}: +{len(diff.added)} -{len(diff.removed)} ~{len(diff.changed)}')
+            lines.extend(f'  + {_show(record)}' for record in diff.added)
+            lines.extend(f'  - {_show(record)}' for record in diff.removed)
+            lines.extend(
+                f'  ~ {_show((change.our_cost,) + change[:3])} -> {change.their_cost}'
+                for change in diff.changed
+            )
+        return '\n'.join(lines)
+
+    @property
+    def matched(self) -> bool:
+        return not self.diffs
+
+
+def _show(record: ChargeRecord) -> str:
+    cost, category, description, posted = record
+    text = f'{cost} {category}'
+    if description is not None:
+        text += f' "{description}"'
+    if posted is not None:
+        text += ' ' + DateType.fromordinal(posted).strftime('%d/%m/%Y')
+    return text
+
+
+def charge_record(charge: Union[ChargeHistoryItem, tuple]) -> ChargeRecord:
+    """
+    Make a plain record of a charge.
+
+    Args:
+        charge: (ChargeHistoryItem|tuple) a charge, or (cost, category, description, posted_date).
+
+    Returns:
+        (ChargeRecord): the record.
+    """
+
+    if isinstance(charge, ChargeHistoryItem):
+        cost, category, description, posted = charge.cost, charge.category, charge.description, charge.posted_date
+    else:
+        cost, category, description, posted = charge
+    return cost, category, description, posted.toordinal() if posted is not None else None
+
+
+def bill_digest(records: Iterable[ChargeRecord]) -> Tuple[int, int]:
+    """
+    Make the digest of charges. It is the same for the same charges in any order.
+    It uses hash(), which is salted per process, so compare digests made in one process only.
+
+    Args:
+        records: (Iterable[ChargeRecord]) charges.
+
+    Returns:
+        (Tuple[int, int]): number of charges and sum of their hashes.
+    """
+
+    records = records if isinstance(records, list) else list(records)
+    return len(records), sum(map(hash, records)) % (1 << _DIGEST_BITS)
+
+
+def diff_charges(patient_id: int, ours: List[ChargeRecord], theirs: List[ChargeRecord]) -> BillDiff:
+    """
+    Compare charges of one bill.
+
+    Args:
+        patient_id: (int) id of the patient.
+        ours: (List[ChargeRecord]) our charges.
+        theirs: (List[ChargeRecord]) their charges.
+
+    Returns:
+        (BillDiff): the difference.
+    """
+
+    # the same charges cancel out first, so order and duplicates do not matter.
+    our_counts, their_counts = Counter(ours), Counter(theirs)
+    only_ours, only_theirs = our_counts - their_counts, their_counts - our_counts
+
+    # what is left is paired by identity; a pair is a changed cost.
+    costs: Dict[tuple, List[int]] = {}
+    for (cost, *identity), count in only_ours.items():
+        costs.setdefault(tuple(identity), []).extend([cost] * count)
+    # costs are taken from the end, so in our order.
+    for pending in costs.values():
+        pending.reverse()
+
+    added, changed = [], []
+    for record, count in only_theirs.items():
+        cost, identity = record[0], record[1:]
+        for _ in range(count):
+            pending = costs.get(identity)
+            if pending:
+                changed.append(ChargeChange(*identity, pending.pop(), cost))
+            else:
+                added.append(record)
+
+    removed = [(cost,) + identity for identity, pending in costs.items() for cost in reversed(pending)]
+    return BillDiff(patient_id, added, removed, changed)
+
+
+def _diff_chunk(chunk: List[Tuple[int, List[ChargeRecord], List[ChargeRecord]]]) -> List[BillDiff]:
+    return [diff_charges(*item) for item in chunk]
+
+
+class Reconciler:
+    """
+    This reconciles two ledgers of bills, patient id -> charges.
+    Digests of BillType objects are kept until the bill's version changes, so a nightly run
+    hashes only bills changed since the last run. A charge edited in place (BillType.revision)
+    makes only the digests of its bills stale.
+    """
+
+    def __init__(self, workers: int = None, chunk_size: int = 256):
+        """
+        Initialize this class.
+
+        Args:
+            workers: (int|None) number of processes. None is cpu count, 1 compares in this process.
+            chunk_size: (int) bills per task.
+        """
+
+        self.__workers = workers or os.cpu_count() or 1
+        self.__chunk_size = chunk_size
+        # bill -> ((version, revision), records, digest)
+        self.__digests = weakref.WeakKeyDictionary()
+
+    def digest(self, charges: Iterable) -> Tuple[int, int]:
+        """
+        It returns the digest of a bill or of any charges.
+
+        Args:
+            charges: (BillType|Iterable) a bill, or charges and records.
+
+        Returns:
+            (Tuple[int, int]): the digest.
+        """
+        return self.__prepare(charges)[1]
+
+    def __prepare(self, charges) -> tuple:
+        if not isinstance(charges, BillType):
+            records = [charge_record(charge) for charge in charges]
+            return records, bill_digest(records)
+
+        cached = self.__digests.get(charges)
+        snapshot = charges.snapshot()
+        version = (snapshot.version, charges.revision)
+        if cached is None or cached[0] != version:
+            records = [
+                (charge.cost, charge.category, charge.description, posted.toordinal() if posted is not None else None)
+                for charge in snapshot for posted in (charge.posted_date,)
+            ]
+            cached = (version, records, bill_digest(records))
+            self.__digests[charges] = cached
+        return cached[1], cached[2]
+
+    def reconcile(self, ours: Mapping[int, Iterable], theirs: Mapping[int, Iterable]) -> ReconciliationReport:
+        """
+        Compare two ledgers. A bill missing on one side is compared with no charge.
+
+        Args:
+            ours: (Mapping[int, Iterable]) patient id -> our BillType or charges.
+            theirs: (Mapping[int, Iterable]) patient id -> their BillType or charges.
+
+        Returns:
+            (ReconciliationReport): the report.
+        """
+
+        patient_ids = list(ours)
+        patient_ids.extend(patient_id for patient_id in theirs if patient_id not in ours)
+
+        pending = []
+        for patient_id in patient_ids:
+            our_records, our_digest = self.__prepare(ours.get(patient_id, ()))
+            their_records, their_digest = self.__prepare(theirs.get(patient_id, ()))
+            if our_digest != their_digest:
+                pending.append((patient_id, our_records, their_records))
+
+        size = self.__chunk_size
+        chunks = [pending[start:start + size] for start in range(0, len(pending), size)]
+        if self.__workers == 1 or len(chunks) <= 1:
+            results = [_diff_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.__workers) as executor:
+                results = list(executor.map(_diff_chunk, chunks))
+
+        diffs = [diff for result in results for diff in result]
+        return ReconciliationReport(len(patient_ids), len(patient_ids) - len(pending), diffs)
+
+
+def ledger_of(bills: Iterable[BillType]) -> Dict[int, BillType]:
+    """
+    Make a ledger of bills.
+
+    Args:
+        bills: (Iterable[BillType]) bills.
+
+    Returns:
+        (Dict[int, BillType]): patient id -> bill.
+    """
+    return {bill.patient.id: bill for bill in bills}
@@ -0,0 +1,172 @@
+"""
+Revenue index for Hospital management system
+
+This module includes a time-bucketed revenue index.
+Charges with posted_date are summed by category into day, week and month buckets,
+so a range query costs the number of buckets, not the number of charges.
+
+    BillType.revenue_index = RevenueIndex()
+"""
+
+import threading
+import weakref
+from typing import Dict, List, Tuple
+
+from main import DateType, ChargeHistoryItem
+
+
+class RevenueIndex:
+    """
+    This stores category sums per day, week (starting Monday) and month.
+    Charges without posted_date are ignored.
+
+    The day, category and cost are read when the charge is added and kept for the charge,
+    so changing a posted charge does not move its revenue, and removing it takes back
+    exactly what was added.
+    """
+
+    # available granularities.
+    granularities = ('day', 'week', 'month')
+
+    def __init__(self):
+        """
+        Initialize this class.
+        """
+
+        # granularity -> bucket key -> category -> sum
+        self.__buckets = {granularity: {} for granularity in self.granularities}
+        # charge -> (ordinal, category, cost) of each time it was added
+        self.__entries = weakref.WeakKeyDictionary()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def bucket_key(ordinal: int, granularity: str) -> int:
+        """
+        Calculate the bucket key of the day.
+
+        Args:
+            ordinal: (int) ordinal of the day.
+            granularity: (str) one of granularities.
+
+        Returns:
+            (int): ordinal for day/week (Monday of the week), year * 12 + month - 1 for month.
+        """
+
+        if granularity == 'day':
+            return ordinal
+
+        elif granularity == 'week':
+            # ordinal 1 (0001-01-01) is Monday.
+            return ordinal - (ordinal - 1) % 7
+
+        elif granularity == 'month':
+            the_date = DateType.fromordinal(ordinal)
+            return the_date.year * 12 + the_date.month - 1
+
+        raise ValueError('It must be in granularities;' + ', '.join(RevenueIndex.granularities))
+
+    @staticmethod
+    def bucket_start(key: int, granularity: str) -> DateType:
+        """
+        It returns the first day of the bucket.
+
+        Args:
+            key: (int) bucket key.
+            granularity: (str) one of granularities.
+
+        Returns:
+            (DateType): first day of the bucket.
+        """
+
+        if granularity == 'month':
+            return DateType(key // 12, key % 12 + 1, 1)
+
+        return DateType.fromordinal(key)
+
+    def add(self, charge: ChargeHistoryItem):
+        """
+        Add the charge to every granularity.
+
+        Args:
+            charge: (ChargeHistoryItem) posted charge.
+        """
+
+        if charge.posted_date is None:
+            return
+
+        entry = (charge.posted_date.toordinal(), charge.category.lower(), charge.cost)
+        with self.__lock:
+            self.__entries.setdefault(charge, []).append(entry)
+            self.__update(*entry)
+
+    def remove(self, charge: ChargeHistoryItem):
+        """
+        Remove the charge from every granularity.
+
+        Args:
+            charge: (ChargeHistoryItem) posted charge.
+        """
+
+        with self.__lock:
+            entries = self.__entries.get(charge)
+            # when the charge was not added.
+            if not entries:
+                return
+
+            ordinal, category, cost = entries.pop()
+            if not entries:
+                del self.__entries[charge]
+            self.__update(ordinal, category, -cost)
+
+    def __update(self, ordinal: int, category: str, amount: int):
+        for granularity, buckets in self.__buckets.items():
+            sums = buckets.setdefault(self.bucket_key(ordinal, granularity), {})
+            sums[category] = sums.get(category, 0) + amount
+
+    def __keys(self, start: DateType, end: DateType, granularity: str) -> range:
+        first = self.bucket_key(start.toordinal(), granularity)
+        last = self.bucket_key(end.toordinal(), granularity)
+        return range(first, last + 1, 7 if granularity == 'week' else 1)
+
+    def revenue(self, start: DateType, end: DateType, granularity: str = 'day', category: str = None) -> int:
+        """
+        Sum revenue between start and end.
+        Whole buckets are summed, so with week or month the buckets containing start and end are included fully.
+
+        Args:
+            start: (DateType) first date (inclusive).
+            end: (DateType) last date (inclusive).
+            granularity: (str) one of granularities.
+            category: (str|None) only this category. None is every category.
+
+        Returns:
+            (int): revenue.
+        """
+
+        buckets = self.__buckets[granularity]
+        total = 0
+        for key in self.__keys(start, end, granularity):
+            sums = buckets.get(key)
+            if sums is None:
+                continue
+            total += sum(sums.values()) if category is None else sums.get(category.lower(), 0)
+        return total
+
+    def series(self, start: DateType, end: DateType, granularity: str = 'day') -> List[Tuple[DateType, Dict[str, int]]]:
+        """
+        It returns category sums for every bucket between start and end.
+
+        Args:
+            start: (DateType) first date (inclusive).
+            end: (DateType) last date (inclusive).
+            granularity: (str) one of granularities.
+
+        Returns:
+            (List[Tuple[DateType, Dict[str, int]]]): first day of bucket and its category sums.
+        """
+
+        buckets = self.__buckets[granularity]
+        return [
+            (self.bucket_start(key, granularity), dict(buckets.get(key, {})))
+            for key in self.__keys(start, end, granularity)
+        ]
@@ -0,0 +1,550 @@
+"""
+Sharding for Hospital management system
+
+This module partitions patients and their bills over local worker processes.
+
+A patient is owned by one shard, found by consistent hashing of the patient id,
+so adding a shard moves only about 1/N of the patients.
+- routed: add, get, add_charge and discharge go to the owner shard.
+- scatter-gather: total revenue and census ask every shard at once and sum the answers.
+
+Values are validated here and sent to workers as plain records (see tiering.bill_record),
+so workers build objects with from_trusted. Bills returned by get are copies.
+
+Bills live in the workers, so charges posted here are not published to
+BillType.event_bus or BillType.revenue_index of this process; use total_revenue.
+"""
+
+import hashlib
+import multiprocessing
+import threading
+from bisect import bisect_right, insort
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+from main import DateType, DoctorType, PatientType, ChargeHistoryItem, BillType
+from tiering import bill_record, rebuild_bill
+
+
+def _hash(value: str) -> int:
+    # Python hash() of str is salted per process, so it cannot be shared with workers.
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def _date(ordinal):
+    return DateType.fromordinal(ordinal) if ordinal is not None else None
+
+
+class HashRing:
+    """
+    This is a consistent hash ring with virtual nodes.
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), replicas: int = 64):
+        """
+        Initialize this class.
+
+        Args:
+            nodes: (Iterable[int]) node ids.
+            replicas: (int) virtual nodes of each node. More is more even.
+        """
+
+        self.__replicas = replicas
+        self.__points: List[int] = []
+        self.__owners: Dict[int, int] = {}
+        for node in nodes:
+            self.add(node)
+
+    def __contains__(self, node: int) -> bool:
+        return node in self.nodes
+
+    @property
+    def nodes(self) -> List[int]:
+        """
+        It returns node ids.
+
+        Returns:
+            (List[int]): sorted node ids.
+        """
+        return sorted(set(self.__owners.values()))
+
+    def add(self, node: int):
+        """
+        Add a node.
+
+        Args:
+            node: (int) node id.
+        """
+
+        # when the node is already on the ring.
+        if node in self:
+            raise ValueError(f'It is already added; {node}')
+
+        for replica in range(self.__replicas):
+            point = _hash(f'{node}:{replica}')
+            # a collision is very rare; the first node keeps the point.
+            if point not in self.__owners:
+                self.__owners[point] = node
+                insort(self.__points, point)
+
+    def remove(self, node: int):
+        """
+        Remove a node.
+
+        Args:
+            node: (int) node id.
+        """
+
+        points = [point for point, owner in self.__owners.items() if owner == node]
+        # when the node is not on the ring.
+        if not points:
+            raise ValueError(f'It is not added; {node}')
+
+        for point in points:
+            del self.__owners[point]
+        self.__points = sorted(self.__owners)
+
+    def owner(self, key: int) -> int:
+        """
+        Find the node of the key, the first point clockwise.
+
+        Args:
+            key: (int) e.g. patient id.
+
+        Returns:
+            (int): node id.
+        """
+
+        # when there is no node.
+        if not self.__points:
+            raise ValueError('It has no node.')
+
+        index = bisect_right(self.__points, _hash(str(key)))
+        return self.__owners[self.__points[index % len(self.__points)]]
+
+
+def _serve(connection):
+    """
+    Run one shard until 'close'. Every request is (operation, args) and
+    every reply is (True, result) or (False, exception).
+
+    Args:
+        connection: (Connection) pipe end to the coordinator.
+    """
+
+    bills: Dict[int, BillType] = {}
+    doctors = {}
+
+    def add(records):
+        for record in records:
+            bill = rebuild_bill(record, doctors)
+            bills[bill.patient.id] = bill
+        return len(records)
+
+    def get(patient_id):
+        bill = bills.get(patient_id)
+        return bill_record(bill) if bill is not None else None
+
+    def add_charges(charges):
+        for patient_id, items in charges:
+            bills[patient_id].add_charges([
+                ChargeHistoryItem.from_trusted(cost, category, description, _date(posted))
+                for cost, category, description, posted in items
+            ])
+        return len(charges)
+
+    def discharge(patient_id, ordinal):
+        bills[patient_id].patient.discharged_date = _date(ordinal)
+
+    def revenue():
+        return sum(bill.total_fee for bill in bills.values())
+
+    def census(today):
+        return sum(
+            1 for bill in bills.values()
+            if bill.patient.discharged_date is None or bill.patient.discharged_date.toordinal() > today
+        )
+
+    def migrate(ring, node):
+        # records of patients now owned by the node are handed over and forgotten here.
+        moving = [patient_id for patient_id in bills if ring.owner(patient_id) == node]
+        return [bill_record(bills.pop(patient_id)) for patient_id in moving]
+
+    operations = {
+        'add': add,
+        'get': get,
+        'add_charges': add_charges,
+        'discharge': discharge,
+        'revenue': revenue,
+        'census': census,
+        'migrate': migrate,
+        'size': lambda: len(bills),
+    }
+
+    while True:
+        operation, args = connection.recv()
+        if operation == 'close':
+            connection.close()
+            return
+        try:
+            connection.send((True, operations[operation](*args)))
+        except Exception as error:
+            connection.send((False, error))
+
+
+class _ReadWriteLock:
+    """
+    Many readers, or one writer. A waiting writer stops new readers, so it is not starved.
+    The writer can take the read side again; readers must not nest.
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__readers = 0
+        self.__writer = None
+        self.__waiting = 0
+
+    @contextmanager
+    def read(self):
+        if self.__writer == threading.get_ident():
+            yield
+            return
+
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__writer is None and not self.__waiting)
+            self.__readers += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.__condition:
+            self.__waiting += 1
+            self.__condition.wait_for(lambda: self.__writer is None and not self.__readers)
+            self.__waiting -= 1
+            self.__writer = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__writer = None
+                self.__condition.notify_all()
+
+
+class _Shard:
+    """
+    This is the coordinator side of one worker process.
+    """
+
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+
+    def send(self, operation: str, *args):
+        self.connection.send((operation, args))
+
+    def receive(self):
+        ok, result = self.connection.recv()
+        if not ok:
+            raise result
+        return result
+
+    def call(self, operation: str, *args):
+        with self.lock:
+            self.send(operation, *args)
+            return self.receive()
+
+
+class ShardedHospital:
+    """
+    This keeps bills in shard processes.
+    Patient ids are issued in this process, so they are unique over every shard.
+    """
+
+    def __init__(self, shards: int = 4, replicas: int = 64, start_method: str = None, catalog=None):
+        """
+        Initialize this class. Worker processes are started.
+
+        Args:
+            shards: (int) number of shards.
+            replicas: (int) virtual nodes of each shard.
+            start_method: (str|None) multiprocessing start method. None is the default.
+            catalog: (catalog.Catalog|catalog.TenantCatalog|None) catalog of the hospital.
+                Categories are checked with it here, and bills from get keep it as BillType.catalog.
+                None is ChargeHistoryItem.categories.
+        """
+
+        if shards < 1:
+            raise ValueError('It must be positive.')
+
+        self.__context = multiprocessing.get_context(start_method)
+        self.__replicas = replicas
+        self.__catalog = catalog
+        self.__shards: Dict[int, _Shard] = {}
+        self.__ring = HashRing(replicas=replicas)
+        # calls hold the read side and the lock of each shard they use, so calls to
+        # different shards run at the same time; add_shard and close hold the write side.
+        self.__topology = _ReadWriteLock()
+
+        for node in range(shards):
+            self.__shards[node] = _Shard(self.__context)
+            self.__ring.add(node)
+
+    def __len__(self) -> int:
+        with self.__topology.read():
+            return sum(self.__gather('size'))
+
+    def __enter__(self) -> 'ShardedHospital':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def shards(self) -> List[int]:
+        """
+        It returns shard ids.
+
+        Returns:
+            (List[int]): shard ids.
+        """
+        return self.__ring.nodes
+
+    def owner(self, patient_id: int) -> int:
+        """
+        Find the shard of the patient.
+
+        Args:
+            patient_id: (int) id of the patient.
+
+        Returns:
+            (int): shard id.
+        """
+        return self.__ring.owner(patient_id)
+
+    def sizes(self) -> Dict[int, int]:
+        """
+        It returns the number of bills in each shard.
+
+        Returns:
+            (Dict[int, int]): shard id -> number of bills.
+        """
+
+        with self.__topology.read():
+            nodes = list(self.__shards)
+            return dict(zip(nodes, self.__gather('size')))
+
+    def add(self, bill: BillType):
+        """
+        Add a bill, with its patient and charges, to the owner shard.
+
+        Args:
+            bill: (BillType) the bill.
+        """
+
+        self.__route(bill.patient.id, 'add', [bill_record(bill)])
+
+    def admit(
+            self,
+            first_name: str,
+            last_name: str,
+            age: int,
+            birthday: DateType,
+            attending_physician: DoctorType,
+            admitted_date: DateType
+    ) -> int:
+        """
+        Admit a new patient with an empty bill. Arguments are checked like PatientType.
+
+        Args:
+            first_name: (str) first name.
+            last_name: (str) last name.
+            age: (int) age.
+            birthday: (DateType) birthday.
+            attending_physician: (DoctorType) attending physician.
+            admitted_date: (DateType) admitted date.
+
+        Returns:
+            (int): id of the patient.
+        """
+
+        patient = PatientType(first_name, last_name, age, birthday, attending_physician, admitted_date)
+        self.add(BillType(patient))
+        return patient.id
+
+    def get(self, patient_id: int) -> BillType:
+        """
+        Get a copy of the bill from the owner shard.
+
+        Args:
+            patient_id: (int) id of the patient.
+
+        Returns:
+            (BillType|None): the bill.
+        """
+
+        record = self.__route(patient_id, 'get', patient_id)
+        if record is None:
+            return None
+
+        bill = rebuild_bill(record)
+        if self.__catalog is not None:
+            bill.catalog = self.__catalog
+        return bill
+
+    def add_charge(
+            self,
+            patient_id: int,
+            cost: int,
+            category: str,
+            description: str = None,
+            posted_date: DateType = None
+    ):
+        """
+        Add a charge to the bill in the owner shard.
+
+        Args:
+            patient_id: (int) id of the patient.
+            cost: (int) cost.
+            category: (str) category. It is checked with the catalog of the hospital, in this process.
+            description: (str|None) description.
+            posted_date: (DateType|None) posted date.
+        """
+
+        item = ChargeHistoryItem(cost, category, description, posted_date, self.__catalog)
+        self.add_charges([(patient_id, item)])
+
+    def add_charges(self, charges: Iterable[Tuple[int, ChargeHistoryItem]]):
+        """
+        Add many charges. They are grouped by shard, and shards work at the same time.
+        They are not published to BillType.event_bus or BillType.revenue_index (see the module).
+
+        Args:
+            charges: (Iterable[Tuple[int, ChargeHistoryItem]]) patient id and charge.
+        """
+
+        with self.__topology.read():
+            groups: Dict[int, Dict[int, list]] = {}
+            for patient_id, charge in charges:
+                items = groups.setdefault(self.__ring.owner(patient_id), {}).setdefault(patient_id, [])
+                posted = charge.posted_date
+                items.append((
+                    charge.cost, charge.category, charge.description,
+                    posted.toordinal() if posted is not None else None,
+                ))
+
+            self.__scatter({node: ('add_charges', list(group.items())) for node, group in groups.items()})
+
+    def discharge(self, patient_id: int, discharged_date: DateType = None):
+        """
+        Set discharged_date of the patient in the owner shard.
+
+        Args:
+            patient_id: (int) id of the patient.
+            discharged_date: (DateType|None) discharged date. None is today.
+        """
+
+        discharged_date = discharged_date or DateType.today()
+        # when the value is not DateType.
+        if not isinstance(discharged_date, DateType):
+            raise TypeError('It must be DateType.')
+
+        self.__route(patient_id, 'discharge', patient_id, discharged_date.toordinal())
+
+    def total_revenue(self) -> int:
+        """
+        It returns total fee of every bill.
+
+        Returns:
+            (int): total revenue.
+        """
+        with self.__topology.read():
+            return sum(self.__gather('revenue'))
+
+    def census(self, today: DateType = None) -> int:
+        """
+        It returns the number of patients in hospital.
+
+        Args:
+            today: (DateType|None) patients not discharged on or before it are counted. None is today.
+
+        Returns:
+            (int): number of inpatients.
+        """
+        today = (today or DateType.today()).toordinal()
+        with self.__topology.read():
+            return sum(self.__gather('census', today))
+
+    def add_shard(self) -> int:
+        """
+        Start a new shard and move the patients it owns now into it.
+        Other calls wait until moving ends.
+
+        Returns:
+            (int): id of the new shard.
+        """
+
+        with self.__topology.write():
+            node = max(self.__shards) + 1
+            ring = HashRing(list(self.__shards) + [node], replicas=self.__replicas)
+
+            shard = _Shard(self.__context)
+            moved = self.__gather('migrate', ring, node)
+            shard.call('add', [record for records in moved for record in records])
+
+            self.__shards[node] = shard
+            self.__ring = ring
+            return node
+
+    def close(self):
+        """
+        Stop every shard. Bills in shards are lost.
+        """
+
+        with self.__topology.write():
+            for shard in self.__shards.values():
+                with shard.lock:
+                    shard.connection.send(('close', ()))
+                    shard.connection.close()
+                shard.process.join()
+            self.__shards.clear()
+
+    def __route(self, patient_id: int, operation: str, *args):
+        with self.__topology.read():
+            return self.__shards[self.__ring.owner(patient_id)].call(operation, *args)
+
+    def __scatter(self, requests: Dict[int, tuple]) -> Dict[int, object]:
+        # the caller holds the topology lock.
+        # every request is sent before any reply is read, so shards work in parallel.
+        # shard locks are taken in order of shard ids, so two scatters never wait for each other.
+        shards = [(node, self.__shards[node]) for node in sorted(requests)]
+        for node, shard in shards:
+            shard.lock.acquire()
+        try:
+            for node, shard in shards:
+                shard.send(*requests[node])
+            results, error = {}, None
+            for node, shard in shards:
+                # every reply is read, so no pipe is left with an unread reply.
+                try:
+                    results[node] = shard.receive()
+                except Exception as exc:
+                    error = error or exc
+            if error is not None:
+                raise error
+            return results
+        finally:
+            for node, shard in shards:
+                shard.lock.release()
+
+    def __gather(self, operation: str, *args) -> List:
+        # the caller holds the topology lock.
+        return list(self.__scatter({node: (operation, *args) for node in self.__shards}).values())
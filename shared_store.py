@@ -0,0 +1,474 @@
+"""
+Shared-memory store for Hospital management system
+
+This module lets many reporting processes read the same patients and charges
+without each loading its own copy.
+
+One writer publishes versions. Each version is one shared memory segment with a fixed layout:
+
+    header | patients | doctors | categories | charge costs | charge categories | strings
+
+A small control segment keeps the current version. Readers attach to it and map
+the current version without copying; refresh() moves to a newer version.
+An old version is unlinked when a new one is published, but readers which still
+map it keep working until they refresh.
+"""
+
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from main import DateType, ChargeHistoryItem, BillType
+
+_MAGIC = b'HMS1'
+
+# magic, version, patients, doctors, categories, charges, strings size
+_HEADER = struct.Struct('<4sqqqqqq')
+
+# id, total_fee, first charge, charge count, first name (offset, length), last name (offset, length),
+# age, birthday, admitted date, discharged date (-1 is None), physician
+_PATIENT = struct.Struct('<qqqqqiqiiiiii')
+
+# speciality, first name, last name as (offset, length)
+_DOCTOR = struct.Struct('<qiqiqi')
+
+# name as (offset, length)
+_CATEGORY = struct.Struct('<qi')
+
+# control segment: current version
+_CONTROL = struct.Struct('<q')
+
+
+def _segment_name(name: str, version: int) -> str:
+    return f'{name}_v{version}'
+
+
+# segments created by writers in this process. They stay tracked when a reader here attaches them.
+_created = set()
+_created_lock = threading.Lock()
+
+
+def _create(name: str, size: int) -> shared_memory.SharedMemory:
+    segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+    with _created_lock:
+        _created.add(segment._name)
+    return segment
+
+
+def _unlink(segment: shared_memory.SharedMemory):
+    segment.close()
+    segment.unlink()
+    with _created_lock:
+        _created.discard(segment._name)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # a reader must not be tracked, otherwise segments of the writer are unlinked when it exits.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    segment = shared_memory.SharedMemory(name=name)
+    # the tracker keeps a set of names, so unregistering a segment of a writer
+    # in this process would drop the writer's registration too.
+    with _created_lock:
+        if segment._name not in _created:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+class _Layout:
+    # offsets of each part of a version segment.
+
+    def __init__(self, patients: int, doctors: int, categories: int, charges: int, strings: int):
+        self.patients = _HEADER.size
+        self.doctors = self.patients + patients * _PATIENT.size
+        self.categories = self.doctors + doctors * _DOCTOR.size
+        self.costs = self.categories + categories * _CATEGORY.size
+        # costs are int64, so they are aligned to 8 bytes.
+        self.costs += -self.costs % 8
+        self.charge_categories = self.costs + charges * 8
+        self.strings = self.charge_categories + charges * 2
+        self.size = self.strings + strings
+
+
+class SharedStoreWriter:
+    """
+    This publishes versions of bills to shared memory.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize this class. The control segment is created.
+
+        Args:
+            name: (str) name of the store. Readers use the same name.
+        """
+
+        self.__name = name
+        self.__control = _create(name, _CONTROL.size)
+        _CONTROL.pack_into(self.__control.buf, 0, 0)
+        self.__current = None
+        self.__version = 0
+
+    @property
+    def version(self) -> int:
+        """
+        It returns the last published version.
+
+        Returns:
+            (int): __version
+        """
+        return self.__version
+
+    def publish(self, bills: Iterable[BillType]) -> int:
+        """
+        Write a new version from bills and make it current.
+        Each bill is read from its snapshot.
+
+        Args:
+            bills: (Iterable[BillType]) bills with patients.
+
+        Returns:
+            (int): the new version.
+        """
+
+        snapshots = sorted((bill.snapshot() for bill in bills), key=lambda snapshot: snapshot.patient.id)
+
+        strings = bytearray()
+        string_offsets = {}
+
+        def intern(text: str) -> Tuple[int, int]:
+            # same strings are stored once.
+            if text not in string_offsets:
+                encoded = text.encode('utf-8')
+                string_offsets[text] = (len(strings), len(encoded))
+                strings.extend(encoded)
+            return string_offsets[text]
+
+        doctors, doctor_keys = [], {}
+        categories = list(ChargeHistoryItem.categories)
+        category_codes = {category: code for code, category in enumerate(categories)}
+        patients = []
+        costs, codes = [], []
+
+        for snapshot in snapshots:
+            patient = snapshot.patient
+            doctor = patient.attending_physician
+            if id(doctor) not in doctor_keys:
+                doctor_keys[id(doctor)] = len(doctors)
+                doctors.append(doctor)
+
+            first = len(costs)
+            for charge in snapshot:
+                category = charge.category.lower()
+                code = category_codes.get(category)
+                if code is None:
+                    # categories of a hospital's catalog are added as they appear; codes are int16.
+                    if len(categories) > 0x7FFF:
+                        raise ValueError('It has too many categories.')
+                    code = category_codes[category] = len(categories)
+                    categories.append(category)
+                costs.append(charge.cost)
+                codes.append(code)
+
+            discharged = patient.discharged_date
+            patients.append((
+                patient.id, snapshot.total_fee, first, len(costs) - first,
+                *intern(patient.first_name), *intern(patient.last_name),
+                patient.age,
+                patient.birthday.toordinal(),
+                patient.admitted_date.toordinal(),
+                discharged.toordinal() if discharged is not None else -1,
+                doctor_keys[id(doctor)],
+            ))
+
+        doctors = [
+            (*intern(doctor.speciality), *intern(doctor.first_name), *intern(doctor.last_name))
+            for doctor in doctors
+        ]
+        categories = [intern(category) for category in categories]
+
+        layout = _Layout(len(patients), len(doctors), len(categories), len(costs), len(strings))
+        version = self.__version + 1
+        segment = _create(_segment_name(self.__name, version), max(layout.size, 1))
+        buffer = segment.buf
+
+        _HEADER.pack_into(
+            buffer, 0, _MAGIC, version, len(patients), len(doctors), len(categories), len(costs), len(strings)
+        )
+        for index, row in enumerate(patients):
+            _PATIENT.pack_into(buffer, layout.patients + index * _PATIENT.size, *row)
+        for index, row in enumerate(doctors):
+            _DOCTOR.pack_into(buffer, layout.doctors + index * _DOCTOR.size, *row)
+        for index, row in enumerate(categories):
+            _CATEGORY.pack_into(buffer, layout.categories + index * _CATEGORY.size, *row)
+        # charge columns are in native byte order, like the readers on the same machine.
+        buffer[layout.costs:layout.charge_categories] = array('q', costs).tobytes()
+        buffer[layout.charge_categories:layout.strings] = array('h', codes).tobytes()
+        buffer[layout.strings:layout.strings + len(strings)] = strings
+
+        # switching the version is one aligned 8 bytes write.
+        _CONTROL.pack_into(self.__control.buf, 0, version)
+        self.__version = version
+
+        # readers mapping the old version keep it until they refresh.
+        if self.__current is not None:
+            _unlink(self.__current)
+        self.__current = segment
+
+        return version
+
+    def close(self):
+        """
+        Unlink every segment. Readers cannot attach any more.
+        """
+
+        if self.__current is not None:
+            _unlink(self.__current)
+            self.__current = None
+
+        _unlink(self.__control)
+
+
+class _Version:
+    # one mapped version segment.
+
+    def __init__(self, segment: shared_memory.SharedMemory):
+        magic, self.version, *counts = _HEADER.unpack_from(segment.buf, 0)
+        if magic != _MAGIC:
+            segment.close()
+            raise ValueError(f'It is not a store segment: {segment.name}')
+
+        self.counts = counts
+        self.layout = _Layout(*counts)
+        self.segment = segment
+        self.buffer = segment.buf
+        self.costs = segment.buf[self.layout.costs:self.layout.charge_categories].cast('q')
+        self.codes = segment.buf[self.layout.charge_categories:self.layout.strings].cast('h')
+
+    def patient_row(self, index: int) -> tuple:
+        return _PATIENT.unpack_from(self.buffer, self.layout.patients + index * _PATIENT.size)
+
+    def doctor_row(self, index: int) -> tuple:
+        return _DOCTOR.unpack_from(self.buffer, self.layout.doctors + index * _DOCTOR.size)
+
+    def category(self, code: int) -> str:
+        return self.string(*_CATEGORY.unpack_from(self.buffer, self.layout.categories + code * _CATEGORY.size))
+
+    def charge(self, index: int) -> Tuple[int, str]:
+        return self.costs[index], self.category(self.codes[index])
+
+    def string(self, offset: int, length: int) -> str:
+        start = self.layout.strings + offset
+        return str(self.buffer[start:start + length], 'utf-8')
+
+    def close(self):
+        # views must be released before the segment is closed.
+        self.costs.release()
+        self.codes.release()
+        self.buffer.release()
+        self.segment.close()
+
+
+class SharedDoctor:
+    """
+    This is a read-only doctor in shared memory. It has the same properties as DoctorType.
+    """
+
+    def __init__(self, version: '_Version', index: int):
+        self.__version = version
+        self.__row = version.doctor_row(index)
+
+    @property
+    def speciality(self) -> str:
+        return self.__version.string(self.__row[0], self.__row[1])
+
+    @property
+    def first_name(self) -> str:
+        return self.__version.string(self.__row[2], self.__row[3])
+
+    @property
+    def last_name(self) -> str:
+        return self.__version.string(self.__row[4], self.__row[5])
+
+
+class SharedPatient:
+    """
+    This is a read-only patient and its bill in shared memory.
+    It has the same properties as PatientType, and total_fee/len/indexing of BillType.
+    Values are read from shared memory when they are accessed,
+    so it is valid until the reader refreshes or closes.
+    """
+
+    def __init__(self, version: '_Version', index: int):
+        self.__version = version
+        self.__row = version.patient_row(index)
+
+    def __len__(self) -> int:
+        return self.__row[3]
+
+    def __getitem__(self, index: int) -> ChargeHistoryItem:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('charge index out of range')
+
+        cost, category = self.__version.charge(self.__row[2] + index)
+        return ChargeHistoryItem.from_trusted(cost, category)
+
+    @property
+    def id(self) -> int:
+        return self.__row[0]
+
+    @property
+    def total_fee(self) -> int:
+        return self.__row[1]
+
+    @property
+    def first_name(self) -> str:
+        return self.__version.string(self.__row[4], self.__row[5])
+
+    @property
+    def last_name(self) -> str:
+        return self.__version.string(self.__row[6], self.__row[7])
+
+    @property
+    def age(self) -> int:
+        return self.__row[8]
+
+    @property
+    def birthday(self) -> DateType:
+        return DateType.fromordinal(self.__row[9])
+
+    @property
+    def admitted_date(self) -> DateType:
+        return DateType.fromordinal(self.__row[10])
+
+    @property
+    def discharged_date(self) -> Optional[DateType]:
+        return DateType.fromordinal(self.__row[11]) if self.__row[11] >= 0 else None
+
+    @property
+    def attending_physician(self) -> SharedDoctor:
+        return SharedDoctor(self.__version, self.__row[12])
+
+    @property
+    def duration(self) -> timedelta:
+        end = self.__row[11] if self.__row[11] >= 0 else DateType.today().toordinal()
+        return timedelta(days=end - self.__row[10])
+
+
+class SharedStoreReader:
+    """
+    This maps the current version of a store without copying.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize this class and attach the current version.
+
+        Args:
+            name: (str) name of the store.
+        """
+
+        self.__name = name
+        self.__control = _attach(name)
+        self.__current = None
+        if not self.refresh():
+            self.__control.close()
+            raise LookupError(f'Nothing is published in {name}.')
+
+    def __len__(self) -> int:
+        return self.__current.counts[0]
+
+    def __iter__(self) -> Iterator[SharedPatient]:
+        current = self.__current
+        for index in range(current.counts[0]):
+            yield SharedPatient(current, index)
+
+    def __getitem__(self, index: int) -> SharedPatient:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('patient index out of range')
+        return SharedPatient(self.__current, index)
+
+    @property
+    def version(self) -> int:
+        """
+        It returns the mapped version.
+
+        Returns:
+            (int): mapped version.
+        """
+        return self.__current.version
+
+    def refresh(self) -> bool:
+        """
+        Map the current version if it is newer.
+        Patients taken from the old version must not be used after it.
+
+        Returns:
+            (bool): True if a new version is mapped.
+        """
+
+        while True:
+            version = _CONTROL.unpack_from(self.__control.buf, 0)[0]
+            if version == 0 or (self.__current is not None and version == self.__current.version):
+                return False
+
+            try:
+                segment = _attach(_segment_name(self.__name, version))
+            except FileNotFoundError:
+                # it was replaced while attaching. Read the control again.
+                continue
+
+            current = _Version(segment)
+            if self.__current is not None:
+                self.__current.close()
+            self.__current = current
+            return True
+
+    def get(self, patient_id: int) -> Optional[SharedPatient]:
+        """
+        Find a patient by id with binary search.
+
+        Args:
+            patient_id: (int) id of the patient.
+
+        Returns:
+            (SharedPatient|None): the patient.
+        """
+
+        current = self.__current
+        count = current.counts[0]
+        index = bisect_left(range(count), patient_id, key=lambda i: current.patient_row(i)[0])
+        if index < count and current.patient_row(index)[0] == patient_id:
+            return SharedPatient(current, index)
+        return None
+
+    def categories(self) -> List[str]:
+        """
+        It returns categories of this version.
+
+        Returns:
+            (List[str]): categories.
+        """
+
+        current = self.__current
+        return [current.category(code) for code in range(current.counts[2])]
+
+    def close(self):
+        """
+        Detach from the store.
+        """
+
+        if self.__current is not None:
+            self.__current.close()
+            self.__current = None
+        self.__control.close()
@@ -0,0 +1,327 @@
+"""
+Bed capacity simulation for Hospital management system
+
+This module includes a discrete-event simulation of admissions and discharges.
+Stays come from real patients (admitted_date, duration) or from synthetic
+arrival and length-of-stay distributions, and are replayed against bed and doctor capacity.
+
+Time is measured in days from the first arrival.
+"""
+
+import heapq
+import math
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple
+
+from main import PatientType
+
+# event kinds. The order breaks ties at the same time: discharges free beds first.
+DISCHARGE, ARRIVAL, RENEGE = 0, 1, 2
+
+
+class Stay(NamedTuple):
+    """
+    This is one stay to simulate.
+    """
+
+    arrival: float  # days
+    length: float  # days
+    speciality: str = ''
+
+
+class SimulationResult(NamedTuple):
+    """
+    This is the report of one simulation run.
+    """
+
+    days: float
+    arrivals: int
+    admitted: int
+    overflowed: int  # patients who gave up waiting or found the queue full
+    mean_occupancy: float  # time-weighted occupied beds
+    peak_occupancy: int
+    waited: int  # admitted patients who waited in the queue
+    mean_wait: float  # days, over every admitted patient
+    max_wait: float  # days
+    peak_queue: int
+
+
+def stays_from_patients(patients: Iterable[PatientType]) -> List[Stay]:
+    """
+    Make stays from patients, in arrival order.
+    A patient still in hospital stays until today (see PatientType.duration).
+
+    Args:
+        patients: (Iterable[PatientType]) patients.
+
+    Returns:
+        (List[Stay]): stays. Arrival 0 is the first admitted date.
+    """
+
+    rows = sorted(
+        (patient.admitted_date.toordinal(), patient.duration.days, patient.attending_physician.speciality)
+        for patient in patients
+    )
+    if not rows:
+        return []
+
+    first = rows[0][0]
+    return [Stay(float(admitted - first), float(length), speciality) for admitted, length, speciality in rows]
+
+
+def synthetic_stays(
+        days: float,
+        arrivals_per_day: float,
+        mean_length: float,
+        sigma: float = 0.8,
+        specialities: Dict[str, float] = None,
+        seed: int = None
+) -> Iterator[Stay]:
+    """
+    Generate stays with Poisson arrivals and log-normal lengths of stay.
+
+    Args:
+        days: (float) simulated period.
+        arrivals_per_day: (float) mean arrivals per day.
+        mean_length: (float) mean length of stay in days.
+        sigma: (float) sigma of log-normal length.
+        specialities: (Dict[str, float]|None) speciality -> weight. None is one speciality ''.
+        seed: (int|None) random seed.
+
+    Returns:
+        (Iterator[Stay]): stays in arrival order.
+    """
+
+    rng = random.Random(seed)
+    names = list(specialities or {'': 1.0})
+    weights = [specialities[name] for name in names] if specialities else None
+
+    # mean of log-normal is exp(mu + sigma^2 / 2).
+    mu = math.log(mean_length) - sigma * sigma / 2
+
+    now = 0.0
+    while True:
+        now += rng.expovariate(arrivals_per_day)
+        if now >= days:
+            return
+        speciality = rng.choices(names, weights)[0] if weights else names[0]
+        yield Stay(now, rng.lognormvariate(mu, sigma), speciality)
+
+
+class _Waiting:
+    # a patient in the queue. gone is set when it is admitted or gives up.
+    __slots__ = ('stay', 'gone')
+
+    def __init__(self, stay: Stay):
+        self.stay = stay
+        self.gone = False
+
+
+class BedSimulation:
+    """
+    This replays stays against capacity.
+
+    A patient needs a free bed and a free slot of a doctor with the speciality.
+    Otherwise the patient waits in a FIFO queue of the speciality,
+    and overflows (goes to another hospital) after max_wait days or if the queue is full.
+    """
+
+    def __init__(
+            self,
+            beds: int,
+            doctors: Dict[str, int] = None,
+            patients_per_doctor: int = 10,
+            max_wait: float = 1.0,
+            max_queue: int = None
+    ):
+        """
+        Initialize this class.
+
+        Args:
+            beds: (int) number of beds.
+            doctors: (Dict[str, int]|None) speciality -> number of doctors. None is no doctor constraint.
+            patients_per_doctor: (int) max patients of one doctor at the same time.
+            max_wait: (float) days a patient waits before overflow.
+            max_queue: (int|None) max waiting patients. None is unlimited.
+        """
+
+        self.__beds = beds
+        self.__slots = (
+            {speciality: count * patients_per_doctor for speciality, count in doctors.items()}
+            if doctors is not None else None
+        )
+        self.__max_wait = max_wait
+        self.__max_queue = max_queue
+
+    def run(self, stays: Iterable[Stay]) -> SimulationResult:
+        """
+        Run the simulation.
+
+        Args:
+            stays: (Iterable[Stay]) stays in arrival order. It can be a generator.
+
+        Returns:
+            (SimulationResult): the report.
+        """
+
+        stays = iter(stays)
+        free_beds = self.__beds
+        free_slots = dict(self.__slots) if self.__slots is not None else None
+        queues: Dict[str, deque] = {}
+        waiting = 0
+
+        # only the next arrival is in the heap, so memory follows occupancy, not history.
+        events = []
+        sequence = 0
+
+        def push(time, kind, payload):
+            nonlocal sequence
+            heapq.heappush(events, (time, kind, sequence, payload))
+            sequence += 1
+
+        def next_arrival():
+            stay = next(stays, None)
+            if stay is not None:
+                push(stay.arrival, ARRIVAL, stay)
+
+        def can_admit(speciality):
+            if free_beds <= 0:
+                return False
+            return free_slots is None or free_slots.get(speciality, 0) > 0
+
+        def admit(stay, now):
+            nonlocal free_beds, admitted, waited, wait_sum, max_wait, occupied, peak
+            free_beds -= 1
+            if free_slots is not None:
+                free_slots[stay.speciality] -= 1
+
+            wait = now - stay.arrival
+            admitted += 1
+            wait_sum += wait
+            if wait > 0:
+                waited += 1
+                max_wait = max(max_wait, wait)
+
+            occupied += 1
+            peak = max(peak, occupied)
+            push(now + stay.length, DISCHARGE, stay)
+
+        def admit_waiting(now):
+            nonlocal waiting
+            # the longest waiting patient among queue heads which can be admitted goes first.
+            while free_beds > 0:
+                best = None
+                for speciality, queue in queues.items():
+                    while queue and queue[0].gone:
+                        queue.popleft()
+                    if queue and can_admit(speciality) and (best is None or queue[0].stay.arrival < best[0].stay.arrival):
+                        best = queue[0], queue
+                if best is None:
+                    return
+
+                entry, queue = best
+                queue.popleft()
+                entry.gone = True
+                waiting -= 1
+                admit(entry.stay, now)
+
+        arrivals = admitted = overflowed = waited = occupied = peak = peak_queue = 0
+        wait_sum = max_wait = area = 0.0
+        first = last = None
+
+        next_arrival()
+        while events:
+            now, kind, _, payload = heapq.heappop(events)
+            if first is None:
+                first = now
+            if last is not None:
+                area += occupied * (now - last)
+            last = now
+
+            if kind == ARRIVAL:
+                arrivals += 1
+                next_arrival()
+
+                if can_admit(payload.speciality) and not queues.get(payload.speciality):
+                    admit(payload, now)
+                elif self.__max_queue is not None and waiting >= self.__max_queue:
+                    overflowed += 1
+                else:
+                    entry = _Waiting(payload)
+                    queues.setdefault(payload.speciality, deque()).append(entry)
+                    waiting += 1
+                    peak_queue = max(peak_queue, waiting)
+                    push(now + self.__max_wait, RENEGE, entry)
+
+            elif kind == DISCHARGE:
+                occupied -= 1
+                free_beds += 1
+                if free_slots is not None:
+                    free_slots[payload.speciality] += 1
+                admit_waiting(now)
+
+            elif not payload.gone:
+                # RENEGE: the patient is still waiting after max_wait.
+                payload.gone = True
+                waiting -= 1
+                overflowed += 1
+
+        days = (last - first) if first is not None else 0.0
+        return SimulationResult(
+            days=days,
+            arrivals=arrivals,
+            admitted=admitted,
+            overflowed=overflowed,
+            mean_occupancy=area / days if days else 0.0,
+            peak_occupancy=peak,
+            waited=waited,
+            mean_wait=wait_sum / admitted if admitted else 0.0,
+            max_wait=max_wait,
+            peak_queue=peak_queue,
+        )
+
+
+def _run_replication(arguments: tuple) -> SimulationResult:
+    simulation, synthetic, seed = arguments
+    return BedSimulation(**simulation).run(synthetic_stays(seed=seed, **synthetic))
+
+
+def replicate(simulation: dict, synthetic: dict, seeds: Iterable[int], processes: int = None) -> List[SimulationResult]:
+    """
+    Run independent replications of a synthetic scenario across processes.
+
+    Args:
+        simulation: (dict) arguments of BedSimulation.
+        synthetic: (dict) arguments of synthetic_stays except seed.
+        seeds: (Iterable[int]) one seed per replication.
+        processes: (int|None) number of processes. None is cpu count, 1 runs in this process.
+
+    Returns:
+        (List[SimulationResult]): results in the order of seeds.
+    """
+
+    arguments = [(simulation, synthetic, seed) for seed in seeds]
+    if processes == 1:
+        return [_run_replication(argument) for argument in arguments]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_run_replication, arguments))
+
+
+def summarize(results: List[SimulationResult]) -> Dict[str, float]:
+    """
+    Average results of replications.
+
+    Args:
+        results: (List[SimulationResult]) results.
+
+    Returns:
+        (Dict[str, float]): field -> mean.
+    """
+
+    return {
+        field: sum(getattr(result, field) for result in results) / len(results)
+        for field in SimulationResult._fields
+    }
@@ -7,6 +7,9 @@ This module includes a lot of test classes.
 Because it is not a library to use other modules, there is no type hinting.
 """
 
+import sys
+import threading
+import time
 from datetime import timedelta
 
 import pytest
@@ -19,7 +22,36 @@ from main import (
     PatientType,
     ChargeHistoryItem,
     BillType,
+    ChargeLedger,
+    NamePool,
+    render_cache,
 )
+from events import (
+    EventBus,
+    Backpressure,
+    ChargeAdded,
+    ChargeRemoved,
+    DischargedDateChanged,
+    PhysicianChanged,
+)
+from revenue import RevenueIndex
+import export
+import dedup
+import simulation
+from accrual import RoomAccrual
+import pagination
+import shared_store
+from tiering import TieredStore
+from sharding import HashRing, ShardedHospital
+import query
+from query import F, PatientTable
+import reconcile
+from reconcile import Reconciler, ChargeChange, ledger_of
+import ages
+from ages import AgeIndex, age_on
+from ingestion import Admission, IngestionPipeline, validate_batch
+from discharge_planning import DischargePlanner
+from catalog import Catalog, CatalogRegistry
 
 
 class TestEncapsulation:
@@ -526,3 +558,1625 @@ class TestUseCases:
 
         # get total fee.
         assert self.bills[0].total_fee == 278
+
+
+class TestTrustedConstruction:
+    """
+    This class test from_trusted constructors and batch validators.
+    - Trusted constructors build the same objects without any check.
+    - Batch validators raise the same exceptions as setters.
+    """
+
+    # test cases
+    doctor = DoctorType.from_trusted('S', 'F', 'L')
+
+    def test_doctor_from_trusted(self):
+        assert self.doctor.speciality == 'S'
+        assert self.doctor.first_name == 'F'
+
+    def test_patient_from_trusted(self):
+        patient = PatientType.from_trusted(
+            'F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 13)
+        )
+
+        assert patient.attending_physician is self.doctor
+        assert patient.discharged_date is None
+        str(patient)
+
+    def test_patient_from_trusted_with_id(self):
+        # restored id is kept, and the next id does not collide with it.
+        restored = PatientType.from_trusted(
+            'F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 13), patient_id=10000
+        )
+        patient = PatientType('F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 13))
+
+        assert restored.id == 10000
+        assert patient.id == 10001
+
+    def test_charge_history_item_from_trusted(self):
+        item = ChargeHistoryItem.from_trusted(32, 'medicine', 'aspirin')
+
+        assert str(item) == str(ChargeHistoryItem(32, 'medicine', 'aspirin'))
+
+    def test_validate_names(self):
+        PersonType.validate_names(['F', 'L', 'F'])
+
+        with pytest.raises(TypeError):
+            PersonType.validate_names(['F', 1])
+
+        with pytest.raises(ValueError):
+            PersonType.validate_names(['F', '1'])
+
+    def test_validate_categories(self):
+        ChargeHistoryItem.validate_categories(['medicine', 'Room', 'medicine'])
+
+        with pytest.raises(TypeError):
+            ChargeHistoryItem.validate_categories(['medicine', None])
+
+        with pytest.raises(ValueError):
+            ChargeHistoryItem.validate_categories(['medicine', 'unknown'])
+
+
+class TestDateParsing:
+    """
+    This class test DateType parsing and formatting caches.
+    - Both formats are parsed, wrong text raises an Exception.
+    - The same text returns the cached DateType.
+    """
+
+    def test_parse_both_formats(self):
+        assert DateType.parse('13/04/2022') == DateType(2022, 4, 13)
+        assert DateType.parse('2022-04-13') == DateType(2022, 4, 13)
+        assert DateType.parse(' 3/4/2022') == DateType(2022, 4, 3)
+
+    def test_parse_returns_cached_instance(self):
+        assert DateType.parse('13/04/2022') is DateType.parse('13/04/2022')
+
+    def test_parse_wrong_text(self):
+        with pytest.raises(TypeError):
+            DateType.parse(20220413)
+
+        with pytest.raises(ValueError):
+            DateType.parse('2022.04.13')
+
+        with pytest.raises(ValueError):
+            DateType.parse('31/02/2022')
+
+    def test_parse_many(self):
+        dates = DateType.parse_many(['13/04/2022', '2022-04-14'])
+
+        assert [d.day for d in dates] == [13, 14]
+
+    def test_strftime_and_hash(self):
+        assert DateType(2022, 4, 13).strftime('%d/%m/%Y') == '13/04/2022'
+        assert len({DateType(2022, 4, 13), DateType(2022, 4, 13)}) == 1
+
+
+class TestEventBus:
+    """
+    This class test the change feed.
+    - Mutations publish typed events only when event_bus is set.
+    - Batched subscribers and bounded queues work like what I designed.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+    patient = PatientType('F', 'L', 32, DateType(2011, 1, 1), doctor, DateType(2022, 4, 13))
+    bill = BillType(patient)
+
+    def test_no_event_without_bus(self):
+        # nothing happens when event_bus is not set.
+        self.bill.add_charge(10, 'room')
+        self.bill.remove_charge(-1)
+
+    @freeze_time('2022-04-22')
+    def test_mutations_publish_events(self):
+        bus = EventBus()
+        batches = []
+        bus.subscribe(batches.append, batch_size=2)
+
+        PatientType.event_bus = bus
+        BillType.event_bus = bus
+        try:
+            self.bill.add_charge(10, 'room')
+            self.bill.add_charge(20, 'doctor')
+            self.bill.remove_charge(-1)
+            self.patient.attending_physician = DoctorType('SS', 'FF', 'LL')
+            self.patient.discharged_date = DateType(2022, 4, 20)
+            self.patient.update_discharged_date_as_today()
+            bus.flush()
+        finally:
+            PatientType.event_bus = None
+            BillType.event_bus = None
+
+        events = [event for batch in batches for event in batch]
+        assert [len(batch) for batch in batches] == [2, 2, 2]
+        assert [type(event) for event in events] == [
+            ChargeAdded, ChargeAdded, ChargeRemoved,
+            PhysicianChanged, DischargedDateChanged, DischargedDateChanged,
+        ]
+        assert events[2].index == 1 and events[2].charge.cost == 20
+        assert events[5].old == DateType(2022, 4, 20)
+
+    def test_bounded_queue_overflow(self):
+        bus = EventBus()
+        dropping = bus.subscribe_queue(maxsize=2, overflow='drop')
+        strict = bus.subscribe_queue(maxsize=2, overflow='error')
+
+        bus.publish(1)
+        bus.publish(2)
+
+        # the full strict queue rejects the event, but the publisher is not failed.
+        bus.publish(3)
+
+        assert bus.failed == 1 and isinstance(bus.failures[0][2], Backpressure)
+        assert bus.failures[0][:2] == (strict, 3)
+        assert dropping.dropped == 1
+        # both queues lost an event, so their consumers must rebuild.
+        assert strict.needs_resync and dropping.needs_resync
+        assert strict.get_batch(max_items=10) == [1, 2]
+        assert strict.get_batch(timeout=0) == []
+        strict.resynced()
+        bus.publish(4)
+        assert not strict.needs_resync
+
+    def test_blocking_queue_timeout(self):
+        bus = EventBus()
+        blocking = bus.subscribe_queue(maxsize=1, overflow='block', timeout=0.01)
+
+        bus.publish(1)
+        bus.publish(2)
+
+        assert bus.failed == 1 and isinstance(bus.failures[0][2], Backpressure)
+        assert blocking.drain() == [1]
+
+    def test_events_follow_ledger_order(self):
+        bus = EventBus()
+        queue = bus.subscribe_queue(maxsize=100000)
+        bill = BillType(self.patient)
+
+        def add():
+            for cost in range(5000):
+                bill.add_charge(cost, 'room')
+
+        def remove():
+            removed = 0
+            while removed < 4000:
+                try:
+                    bill.remove_charge(0)
+                    removed += 1
+                except IndexError:
+                    pass
+
+        # threads switch often, so a writer is often stopped between its change and its event.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        BillType.event_bus = bus
+        try:
+            threads = [threading.Thread(target=add), threading.Thread(target=remove)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            BillType.event_bus = None
+            sys.setswitchinterval(interval)
+
+        # a view rebuilt from events is the same as the ledger.
+        view = []
+        for event in queue.drain():
+            if isinstance(event, ChargeAdded):
+                assert event.index == len(view)
+                view.append(event.charge)
+            else:
+                assert view.pop(event.index) is event.charge
+        assert view == list(bill)
+
+    def test_rejected_publish_is_not_raised_to_writer(self):
+        bus = EventBus()
+        bus.subscribe_queue(maxsize=1, overflow='error')
+        handled = []
+
+        def broken(batch):
+            handled.extend(batch)
+            raise RuntimeError('broken handler')
+
+        bus.subscribe(broken)
+        bill = BillType(self.patient)
+
+        BillType.event_bus = bus
+        try:
+            bill.add_charge(10, 'room')
+            # the queue is full now; the charge is posted once and the writer sees no error to retry.
+            bill.add_charge(20, 'doctor')
+        finally:
+            BillType.event_bus = None
+
+        assert len(bill) == 2 and bill.total_fee == 30
+        assert [event.charge.cost for event in handled] == [10, 20]
+        assert bus.failed == 3
+        assert [type(error) for _, _, error in bus.failures] == [RuntimeError, Backpressure, RuntimeError]
+        assert all(subscriber.needs_resync for subscriber, _, _ in bus.failures)
+
+
+class TestRevenueIndex:
+    """
+    This class test the time-bucketed revenue index.
+    - add_charge and remove_charge keep the buckets up to date.
+    - Range queries return sums by day, week and month.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+    patient = PatientType('F', 'L', 32, DateType(2011, 1, 1), doctor, DateType(2022, 4, 13))
+
+    def test_charge_posted_date(self):
+        item = ChargeHistoryItem(10, 'room', posted_date=DateType(2022, 4, 13))
+
+        assert item.posted_date == DateType(2022, 4, 13)
+
+        with pytest.raises(TypeError):
+            ChargeHistoryItem(10, 'room', posted_date='2022-04-13')
+
+    def test_revenue_index(self):
+        index = RevenueIndex()
+        bill = BillType(self.patient)
+
+        BillType.revenue_index = index
+        try:
+            bill.add_charge(10, 'room', posted_date=DateType(2022, 4, 13))  # Wednesday
+            bill.add_charge(20, 'doctor', posted_date=DateType(2022, 4, 14))
+            bill.add_charge(30, 'room', posted_date=DateType(2022, 4, 18))  # next Monday
+            bill.add_charge(40, 'room', posted_date=DateType(2022, 5, 1))
+            bill.add_charge(50, 'room')  # not posted, ignored
+            bill.remove_charge(1)
+        finally:
+            BillType.revenue_index = None
+
+        assert index.revenue(DateType(2022, 4, 13), DateType(2022, 4, 18)) == 40
+        assert index.revenue(DateType(2022, 4, 13), DateType(2022, 4, 13), 'week') == 10
+        assert index.revenue(DateType(2022, 4, 1), DateType(2022, 4, 30), 'month', 'room') == 40
+        assert index.revenue(DateType(2022, 4, 1), DateType(2022, 5, 31), 'month', 'doctor') == 0
+
+        series = index.series(DateType(2022, 4, 13), DateType(2022, 4, 18), 'week')
+        assert [(start.day, sums) for start, sums in series] == [(11, {'room': 10, 'doctor': 0}), (18, {'room': 30})]
+
+    def test_edited_charge_removed(self):
+        index = RevenueIndex()
+        bill = BillType(self.patient)
+
+        BillType.revenue_index = index
+        try:
+            bill.add_charge(100, 'room', posted_date=DateType(2022, 4, 13))
+            bill[0].category = 'medicine'
+            bill.remove_charge(0)
+        finally:
+            BillType.revenue_index = None
+
+        assert index.series(DateType(2022, 4, 13), DateType(2022, 4, 13)) == [(DateType(2022, 4, 13), {'room': 0})]
+
+
+class TestBillSnapshot:
+    """
+    This class test copy-on-write charge ledger and bill snapshots.
+    - A snapshot never changes after the bill is changed.
+    - The ledger works like a list.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+    patient = PatientType('F', 'L', 32, DateType(2011, 1, 1), doctor, DateType(2022, 4, 13))
+
+    def test_ledger_works_like_list(self):
+        items = [ChargeHistoryItem(cost, 'room') for cost in range(200)]
+        expected = list(items)
+
+        ledger = ChargeLedger().extend(items[:100])
+        for item in items[100:]:
+            ledger = ledger.append(item)
+
+        for index in (150, 0, -1, 64, 63):
+            ledger, removed = ledger.pop(index)
+            assert removed is expected.pop(index)
+
+        assert list(ledger) == expected
+        assert [ledger[i] for i in range(len(ledger))] == expected
+        assert ledger[-3:] == expected[-3:]
+        assert ledger.total == sum(item.cost for item in expected)
+
+        with pytest.raises(IndexError):
+            ledger[len(expected)]
+
+    def test_snapshot_is_frozen(self):
+        bill = BillType(self.patient)
+        bill.add_charge(10, 'room')
+        snapshot = bill.snapshot()
+
+        bill.add_charge(20, 'doctor')
+        bill.remove_charge(0)
+
+        assert len(snapshot) == 1 and snapshot.total_fee == 10
+        assert snapshot[0].cost == 10
+        assert snapshot.version == 1
+        assert bill.version == 3 and bill.total_fee == 20
+        assert 'Total: 10' in str(snapshot)
+
+    def test_concurrent_readers(self):
+        import threading
+
+        bill = BillType(self.patient)
+        errors = []
+
+        def read():
+            for _ in range(200):
+                snapshot = bill.snapshot()
+                # a snapshot is always consistent with itself.
+                if sum(item.cost for item in snapshot) != snapshot.total_fee:
+                    errors.append(snapshot.version)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for _ in range(500):
+            bill.add_charge(1, 'room')
+        for reader in readers:
+            reader.join()
+
+        assert not errors
+        assert bill.total_fee == 500
+
+
+class TestColumnarExport:
+    """
+    This class test columnar export and zero-copy reader.
+    - Exported columns have the same values as objects.
+    - npy columns can be read with or without numpy.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+    patients = [
+        PatientType('Ann', 'Lee', 30, DateType(2000, 1, 1), doctor, DateType(2022, 4, 1)),
+        PatientType('Bob', 'Kim', 40, DateType(1990, 1, 1), doctor, DateType(2022, 4, 1), DateType(2022, 4, 5)),
+        PatientType('Cho', 'Park', 50, DateType(1980, 1, 1), DoctorType('T', 'G', 'H'), DateType(2022, 4, 2)),
+    ]
+    bills = [BillType(patient) for patient in patients]
+    for bill in bills:
+        bill.add_charge(10, 'room')
+        bill.add_charge(20, 'doctor')
+
+    def export(self, directory, format):
+        assert export.export_patients(self.patients, str(directory), chunk_size=2, format=format) == 3
+        assert export.export_charges(self.bills, str(directory), chunk_size=4, format=format) == 6
+
+    def check(self, directory):
+        patients = export.read_table(str(directory), 'patients')
+        assert list(patients['id']) == [patient.id for patient in self.patients]
+        assert list(patients['last_name']) == ['Lee', 'Kim', 'Park']
+        assert list(patients['discharged_date']) == [-1, DateType(2022, 4, 5).toordinal(), -1]
+        assert list(patients['physician']) == [0, 0, 1]
+        assert list(export.read_table(str(directory), 'doctors')['speciality']) == ['S', 'T']
+
+        charges = export.read_table(str(directory), 'charges')
+        categories = list(export.read_table(str(directory), 'categories')['name'])
+        assert sum(charges['cost']) == 90
+        assert [categories[code] for code in charges['category']][:2] == ['room', 'doctor']
+
+    def test_npy_export(self, tmp_path):
+        self.export(tmp_path, 'npy')
+        self.check(tmp_path)
+
+    def test_npy_reader_without_numpy(self, tmp_path, monkeypatch):
+        self.export(tmp_path, 'npy')
+        monkeypatch.setattr(export, 'np', None)
+
+        assert isinstance(export.read_table(str(tmp_path), 'charges')['cost'], memoryview)
+        self.check(tmp_path)
+
+    def test_arrow_export(self, tmp_path):
+        pytest.importorskip('pyarrow')
+
+        self.export(tmp_path, 'arrow')
+        table = export.read_table(str(tmp_path), 'patients')
+        assert table.column('last_name').to_pylist() == ['Lee', 'Kim', 'Park']
+        assert sum(export.read_table(str(tmp_path), 'charges').column('cost').to_pylist()) == 90
+
+
+class TestDuplicateDetection:
+    """
+    This class test duplicate patient detection.
+    - Phonetic codes and similarity work like the references.
+    - Similar patients are found, and different patients are not.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+    robert = PatientType('Robert', 'Smith', 30, DateType(1992, 5, 1), doctor, DateType(2022, 4, 1))
+    rupert = PatientType('Rupert', 'Smyth', 30, DateType(1992, 5, 1), doctor, DateType(2022, 4, 2))
+    swapped = PatientType('Smith', 'Robert', 30, DateType(1992, 5, 1), doctor, DateType(2022, 4, 3))
+    typo = PatientType('Robert', 'Smith', 30, DateType(1992, 5, 10), doctor, DateType(2022, 4, 4))
+    other = PatientType('Alice', 'Smith', 30, DateType(1992, 5, 1), doctor, DateType(2022, 4, 5))
+
+    def test_soundex_and_jaro_winkler(self):
+        assert dedup.soundex('robert') == dedup.soundex('rupert') == 'R163'
+        assert dedup.soundex('ashcraft') == 'A261'
+        assert dedup.normalize_name("O'Brien") == 'obrien'
+        assert round(dedup.jaro_winkler('martha', 'marhta'), 3) == 0.961
+
+    def test_index_match(self):
+        index = dedup.DuplicateIndex([self.robert, self.swapped, self.typo, self.other])
+
+        assert self.robert.id in index.candidates(self.rupert)
+        matched = [patient_id for _, patient_id in index.match(self.rupert, threshold=0.85)]
+        assert matched[0] in (self.robert.id, self.swapped.id)
+        assert self.other.id not in matched
+
+        index.remove(self.robert.id)
+        assert self.robert.id not in index.candidates(self.rupert)
+
+    def test_deduplicate(self):
+        groups = dedup.deduplicate(
+            [self.robert, self.rupert, self.swapped, self.typo, self.other], threshold=0.85, workers=1
+        )
+
+        assert groups == [sorted([self.robert.id, self.rupert.id, self.swapped.id, self.typo.id])]
+
+    def test_deduplicate_with_workers(self):
+        groups = dedup.deduplicate([self.robert, self.typo, self.other], threshold=0.85, workers=2, chunk_size=1)
+
+        assert groups == [sorted([self.robert.id, self.typo.id])]
+
+
+class TestBedSimulation:
+    """
+    This class test the bed capacity simulation.
+    - Stays are made from patients.
+    - Capacity makes patients wait or overflow.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+
+    def test_stays_from_patients(self):
+        patients = [
+            PatientType('F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 15), DateType(2022, 4, 18)),
+            PatientType('F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 13), DateType(2022, 4, 14)),
+        ]
+
+        assert simulation.stays_from_patients(patients) == [
+            simulation.Stay(0.0, 1.0, 'S'),
+            simulation.Stay(2.0, 3.0, 'S'),
+        ]
+
+    def test_wait_and_overflow(self):
+        stays = [
+            simulation.Stay(0.0, 2.0),
+            simulation.Stay(0.5, 1.0),  # waits 1.5 days for the only bed
+            simulation.Stay(0.9, 1.0),  # gives up after 1 day
+        ]
+        result = simulation.BedSimulation(beds=1, max_wait=1.6).run(stays[:2])
+        assert result.admitted == 2 and result.waited == 1 and result.max_wait == 1.5
+
+        result = simulation.BedSimulation(beds=1, max_wait=1.0).run(stays)
+        assert result.admitted == 1 and result.overflowed == 2
+        assert result.peak_occupancy == 1
+
+    def test_doctor_capacity(self):
+        stays = [simulation.Stay(0.0, 1.0, 'a'), simulation.Stay(0.0, 1.0, 'a'), simulation.Stay(0.0, 1.0, 'b')]
+        result = simulation.BedSimulation(beds=10, doctors={'a': 1, 'b': 1}, patients_per_doctor=1, max_wait=5).run(stays)
+
+        assert result.admitted == 3 and result.waited == 1
+
+    def test_replicate(self):
+        results = simulation.replicate(
+            {'beds': 5}, {'days': 30, 'arrivals_per_day': 2, 'mean_length': 2}, seeds=[1, 1, 2], processes=1
+        )
+
+        assert results[0] == results[1]
+        assert 0 < simulation.summarize(results)['mean_occupancy'] <= 5
+
+
+class TestRoomAccrual:
+    """
+    This class test nightly room charge accrual.
+    - Unbilled nights match the duration.
+    - Running again never bills a night twice.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+
+    def test_bill_add_charges(self):
+        bill = BillType(PatientType('F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 13)))
+        bill.add_charges([ChargeHistoryItem(10, 'room'), ChargeHistoryItem(20, 'doctor')])
+
+        assert len(bill) == 2 and bill.total_fee == 30
+
+    @freeze_time('2022-04-22')
+    def test_accrual_is_idempotent(self):
+        staying = BillType(PatientType('F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 14)))
+        discharged = BillType(PatientType(
+            'F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 18), DateType(2022, 4, 20)
+        ))
+        accrual = RoomAccrual(22)
+
+        assert len(accrual.unbilled_nights(staying)) == staying.patient.duration.days == 8
+        assert accrual.run([staying, discharged]) == 10
+        assert accrual.run([staying, discharged]) == 0
+        assert staying.total_fee == 8 * 22
+        assert staying[0].posted_date == DateType(2022, 4, 14)
+        assert discharged[-1].posted_date == DateType(2022, 4, 19)
+
+        # the next night, only one night is posted, also by a new engine.
+        accrual = RoomAccrual(22)
+        assert accrual.run([staying, discharged], today=DateType(2022, 4, 23)) == 1
+        assert len(staying) == 9
+
+    def test_rerun_with_new_engine(self):
+        bill = BillType(PatientType('F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 1)))
+        bill.add_charge(50, 'room', 'upgrade', DateType(2022, 4, 5))
+
+        assert RoomAccrual(100).run([bill], today=DateType(2022, 4, 10)) == 9
+        # a restarted job has no state; the bill tells what is billed.
+        assert RoomAccrual(100).run([bill], today=DateType(2022, 4, 10)) == 0
+        assert RoomAccrual(100).run([bill], today=DateType(2022, 4, 11)) == 1
+        assert len(bill) == 11 and bill.total_fee == 1050
+
+        # a charge of another description is billed by its own engine.
+        assert RoomAccrual(30, description='tv').run([bill], today=DateType(2022, 4, 11)) == 10
+
+    def test_scheduled_discharge(self):
+        bill = BillType(PatientType(
+            'F', 'L', 32, DateType(2011, 1, 1), self.doctor, DateType(2022, 4, 1), DateType(2022, 4, 30)
+        ))
+        accrual = RoomAccrual(100)
+
+        # nights after today are not billed yet.
+        assert accrual.run([bill], today=DateType(2022, 4, 10)) == 9 and bill.total_fee == 900
+        assert accrual.run([bill], today=DateType(2022, 5, 10)) == 20
+        assert bill[-1].posted_date == DateType(2022, 4, 29)
+
+    def test_accrual_wrong_category(self):
+        with pytest.raises(ValueError):
+            RoomAccrual(22, 'unknown')
+
+
+class TestPagination:
+    """
+    This class test cursor pagination.
+    - Pages never skip or repeat charges while the bill is changed.
+    - Wrong cursors raise an Exception.
+    """
+
+    # test cases
+    doctor = DoctorType('S', 'F', 'L')
+    patients = []
+    for _ in range(5):
+        patients.append(PatientType('F', 'L', 32, DateType(2011, 1, 1), doctor, DateType(2022, 4, 13)))
+
+    def test_ledger_iter_after(self):
+        ledger = ChargeLedger().extend(ChargeHistoryItem(cost, 'room') for cost in range(150))
+        ledger, _ = ledger.pop(70)
+
+        assert [item.cost for _, item in ledger.iter_after(69)] == [69] + list(range(71, 150))
+        assert [sequence for sequence, _ in ledger.iter_after(148)] == [149, 150]
+        assert list(ledger.iter_after(150)) == []
+        assert [item.cost for item in ledger[60:66]] == list(range(60, 66))
+
+    def test_page_charges_while_changing(self):
+        bill = BillType(self.patients[0])
+        for cost in range(5):
+            bill.add_charge(cost, 'room')
+
+        first = pagination.page_charges(bill, limit=3)
+        assert [item.cost for item in first.items] == [0, 1, 2] and first.has_more
+
+        # changes between pages.
+        bill.remove_charge(0)
+        bill.add_charge(5, 'room')
+
+        second = pagination.page_charges(bill, first.cursor, limit=3)
+        assert [item.cost for item in second.items] == [3, 4, 5] and not second.has_more
+
+        # nothing now, but the cursor still works for later charges.
+        assert pagination.page_charges(bill, second.cursor).items == []
+        bill.add_charge(6, 'room')
+        assert [item.cost for item in pagination.iter_charges(bill, second.cursor)] == [6]
+
+    def test_page_collection(self):
+        first = pagination.page_collection(self.patients, limit=2)
+        rest = list(pagination.iter_collection(self.patients, first.cursor))
+
+        assert first.items + rest == self.patients
+        assert first.has_more
+
+        bills = [BillType(patient) for patient in self.patients]
+        last = pagination.page_collection(bills, pagination.page_collection(bills, limit=4).cursor, limit=4)
+        assert last.items == bills[4:] and not last.has_more
+
+    def test_wrong_cursor(self):
+        bill = BillType(self.patients[0])
+        with pytest.raises(ValueError):
+            pagination.page_charges(bill, 'wrong')
+
+        with pytest.raises(ValueError):
+            pagination.page_charges(bill, pagination.page_collection(self.patients).cursor)
+
+
+def read_shared_store(name, patient_id, results):
+    # it runs in another process.
+    reader = shared_store.SharedStoreReader(name)
+    patient = reader.get(patient_id)
+    results.put((patient.first_name, patient.total_fee))
+    reader.close()
+
+
+class TestSharedStore:
+    """
+    This class test the shared-memory store.
+    - Readers see the same values as objects.
+    - Readers move to a new version only when they refresh.
+    """
+
+    # test cases
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    patients = [
+        PatientType('Chis', 'A', 18, DateType(2011, 3, 13), doctor, DateType(2022, 4, 14)),
+        PatientType('Sasara', 'Satou', 21, DateType(2010, 4, 1), doctor, DateType(2022, 4, 14), DateType(2022, 4, 20)),
+    ]
+    bills = [BillType(patient) for patient in patients]
+    bills[0].add_charge(20, 'doctor')
+    bills[0].add_charge(42, 'medicine')
+
+    def test_read_same_values(self):
+        import os
+
+        writer = shared_store.SharedStoreWriter(f'hms_test_{os.getpid()}')
+        try:
+            writer.publish(self.bills)
+            reader = shared_store.SharedStoreReader(f'hms_test_{os.getpid()}')
+
+            patient = reader.get(self.patients[1].id)
+            assert patient.first_name == 'Sasara' and patient.last_name == 'Satou'
+            assert patient.birthday == DateType(2010, 4, 1)
+            assert patient.duration == self.patients[1].duration
+            assert patient.attending_physician.speciality == 'Surgery'
+
+            patient = reader.get(self.patients[0].id)
+            assert patient.discharged_date is None
+            assert patient.total_fee == 62 and len(patient) == 2
+            assert str(patient[1]) == str(self.bills[0][1])
+            assert reader.get(-1) is None
+
+            # a new version is seen after refresh.
+            self.bills[1].add_charge(10, 'room')
+            writer.publish(self.bills)
+            assert reader.get(self.patients[1].id).total_fee == 0
+            assert reader.refresh() and reader.version == 2
+            assert reader.get(self.patients[1].id).total_fee == 10
+            assert not reader.refresh()
+            reader.close()
+        finally:
+            writer.close()
+
+    def test_read_in_other_process(self):
+        import multiprocessing
+        import os
+
+        writer = shared_store.SharedStoreWriter(f'hms_test_mp_{os.getpid()}')
+        try:
+            writer.publish(self.bills)
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=read_shared_store, args=(f'hms_test_mp_{os.getpid()}', self.patients[0].id, results)
+            )
+            process.start()
+            assert results.get(timeout=30) == ('Chis', 62)
+            process.join()
+        finally:
+            writer.close()
+
+    @pytest.mark.skipif(sys.version_info >= (3, 13), reason='readers attach with track=False')
+    def test_attach_keeps_tracker(self, monkeypatch):
+        import os
+        from multiprocessing import resource_tracker, shared_memory
+
+        register, unregister = resource_tracker.register, resource_tracker.unregister
+        unregistered = []
+
+        def record(name, rtype):
+            unregistered.append(name)
+            unregister(name, rtype)
+
+        # a segment of another process is untracked by the reader; one of a writer here stays tracked.
+        other = shared_memory.SharedMemory(create=True, size=8)
+        writer = shared_store.SharedStoreWriter(f'hms_test_track_{os.getpid()}')
+        try:
+            with monkeypatch.context() as patch:
+                patch.setattr(resource_tracker, 'unregister', record)
+                shared_store._attach(other.name).close()
+                shared_store._attach(f'hms_test_track_{os.getpid()}').close()
+            assert unregistered == [other._name]
+            # it stands in for the other process, which would keep its own registration.
+            resource_tracker.register(other._name, 'shared_memory')
+            assert resource_tracker.register is register
+        finally:
+            writer.close()
+            other.close()
+            other.unlink()
+
+
+class TestTieredStore:
+    """
+    This class test tiered storage.
+    - Discharged patients move to the archive, and reads are the same.
+    - The hot cache counts hits, misses and evictions.
+    """
+
+    # test cases
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+
+    def make_bill(self, discharged):
+        bill = BillType(PatientType('Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14), discharged))
+        bill.add_charge(20, 'doctor', 'meeting', DateType(2022, 4, 14))
+        bill.add_charge(42, 'medicine')
+        return bill
+
+    @pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+    def test_archive_and_read(self, tmp_path, codec):
+        staying = self.make_bill(None)
+        discharged = [self.make_bill(DateType(2022, 4, 20)) for _ in range(3)]
+        store = TieredStore(str(tmp_path / 'archive.bin'), codec=codec, chunk_records=2, cache_size=1)
+        for bill in [staying] + discharged:
+            store.add(bill)
+
+        assert store.archive_discharged(DateType(2022, 4, 22)) == 3
+        assert store.metrics['live'] == 1 and store.metrics['archived'] == 3
+        assert store[staying.patient.id] is staying
+
+        restored = store[discharged[2].patient.id]
+        assert str(restored) == str(discharged[2])
+        assert restored[0].posted_date == DateType(2022, 4, 14)
+
+        store.get(discharged[2].patient.id)  # hit
+        store.get(discharged[0].patient.id)  # miss, evicts the other
+        assert store.metrics == {'hits': 1, 'misses': 2, 'evictions': 1, 'live': 1, 'archived': 3, 'hot': 1}
+        assert store.get(-1) is None
+
+    def test_doctor_id_kept(self, tmp_path):
+        namesake = DoctorType('Surgery', 'Thomas', 'Edison')
+        bills = [self.make_bill(DateType(2022, 4, 20)) for _ in range(2)]
+        bills[1].patient.attending_physician = namesake
+        store = TieredStore(str(tmp_path / 'archive.bin'), cache_size=0)
+        for bill in bills:
+            store.add(bill)
+        store.archive_discharged(DateType(2022, 4, 22))
+
+        restored = [store[bill.patient.id] for bill in bills]
+        assert [bill.patient.attending_physician.id for bill in restored] == [self.doctor.id, namesake.id]
+        assert PatientTable(restored).where(F('physician') == namesake).bills() == [restored[1]]
+
+        # the counter skips restored ids.
+        doctor = DoctorType.from_trusted('Surgery', 'Ann', 'Lee', doctor_id=DoctorType._id + 10)
+        assert DoctorType('Surgery', 'Ann', 'Lee').id == doctor.id + 1
+
+    def test_restore(self, tmp_path):
+        bill = self.make_bill(DateType(2022, 4, 20))
+        store = TieredStore(str(tmp_path / 'archive.bin'))
+        store.add(bill)
+        store.archive_discharged(DateType(2022, 4, 22))
+
+        live = store.restore(bill.patient.id)
+        live.add_charge(10, 'room')
+        assert store.metrics['live'] == 1 and store.metrics['archived'] == 0
+        assert store[bill.patient.id].total_fee == 72
+
+    def test_bill_from_trusted_does_not_publish(self):
+        patient = self.make_bill(None).patient
+        bus = EventBus()
+        events = bus.subscribe_queue()
+        BillType.event_bus = bus
+        try:
+            bill = BillType.from_trusted(patient, [ChargeHistoryItem.from_trusted(1, 'room')])
+        finally:
+            BillType.event_bus = None
+
+        assert len(bill) == 1 and events.drain() == []
+
+
+class TestSharding:
+    """
+    This class test sharding over worker processes.
+    - The hash ring moves only keys of a new node.
+    - Routed calls and scatter-gather give the same answers before and after add_shard.
+    """
+
+    # test cases
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+
+    def test_hash_ring(self):
+        ring = HashRing([0, 1, 2])
+        before = {key: ring.owner(key) for key in range(3000)}
+        ring.add(3)
+        after = {key: ring.owner(key) for key in range(3000)}
+
+        moved = [key for key in before if before[key] != after[key]]
+        assert all(after[key] == 3 for key in moved)
+        assert 300 < len(moved) < 1200
+        with pytest.raises(ValueError):
+            ring.add(3)
+        with pytest.raises(ValueError):
+            HashRing().owner(1)
+
+    def test_topology_lock(self):
+        import sharding
+
+        lock = sharding._ReadWriteLock()
+        inside, release = threading.Barrier(3), threading.Event()
+        order = []
+
+        def read():
+            with lock.read():
+                # both readers are inside at once.
+                inside.wait(timeout=5)
+                release.wait(timeout=5)
+                order.append('read')
+
+        def write():
+            with lock.write():
+                with lock.read():
+                    order.append('write')
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        inside.wait(timeout=5)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        assert order == []
+        release.set()
+        for thread in readers + [writer]:
+            thread.join(timeout=5)
+        assert order == ['read', 'read', 'write']
+
+    def test_routed_and_gathered(self):
+        with ShardedHospital(shards=2) as hospital:
+            ids = [
+                hospital.admit('Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14))
+                for _ in range(40)
+            ]
+            for patient_id in ids:
+                hospital.add_charge(patient_id, 10, 'doctor', 'meeting', DateType(2022, 4, 14))
+            hospital.add_charges([(ids[0], ChargeHistoryItem(5, 'room'))])
+            hospital.discharge(ids[1], DateType(2022, 4, 20))
+
+            assert len(hospital) == 40 and hospital.total_revenue() == 405
+            assert hospital.census(DateType(2022, 4, 25)) == 39
+
+            node = hospital.add_shard()
+            assert hospital.shards == [0, 1, 2] and hospital.sizes()[node] > 0
+            assert len(hospital) == 40 and hospital.total_revenue() == 405
+
+            bill = hospital.get(ids[0])
+            assert bill.patient.id == ids[0] and bill.total_fee == 15
+            assert PatientTable([bill]).where(F('physician') == self.doctor).count() == 1
+            assert bill[0].posted_date == DateType(2022, 4, 14)
+            assert hospital.get(ids[1]).patient.discharged_date == DateType(2022, 4, 20)
+            assert hospital.get(-1) is None
+
+            # errors in a shard are raised here.
+            with pytest.raises(KeyError):
+                hospital.add_charge(-1, 10, 'room')
+            with pytest.raises(ValueError):
+                hospital.add_charge(ids[0], 10, 'unknown')
+
+
+class TestQuery:
+    """
+    This class test the query engine.
+    - Plans use an index for selective conditions, and column scans otherwise.
+    - Results are the same with and without numpy, and the same as a lambda over a full scan.
+    """
+
+    # test cases
+    surgeon = DoctorType('Surgery', 'Thomas', 'Edison')
+    pediatrician = DoctorType('Pediatrics', 'Ann', 'Lee')
+
+    @pytest.fixture(params=['numpy', 'python'])
+    def table(self, request, monkeypatch):
+        if request.param == 'python':
+            monkeypatch.setattr(query, 'np', None)
+
+        bills = []
+        for i in range(100):
+            discharged = DateType(2022, 5, 1) if i % 3 == 0 else None
+            doctor = self.surgeon if i % 2 else self.pediatrician
+            bill = BillType(PatientType('Chis', 'A', i % 90, DateType(2000, 1, 1), doctor, DateType(2022, 4, 1 + i % 28), discharged))
+            bill.add_charge(i * 10, 'room' if i % 4 else 'doctor')
+            bills.append(bill)
+        return PatientTable(bills)
+
+    def test_physician(self, table):
+        # a doctor with the same names and speciality is another physician.
+        namesake = DoctorType('Surgery', 'Thomas', 'Edison')
+        table.bills[1].patient.attending_physician = namesake
+        table = PatientTable(table.bills)
+        expected = [bill for bill in table.bills if bill.patient.attending_physician is self.surgeon]
+
+        assert table.where(F('physician') == self.surgeon).bills() == expected
+        assert table.where(F('physician') == self.surgeon.id).count() == 49
+        assert table.where(F('physician').isin([namesake])).bills() == [table.bills[1]]
+
+        table.create_index('physician')
+        assert table.where(F('physician') == namesake.id).bills() == [table.bills[1]]
+
+    def test_plan_and_result(self, table):
+        predicate = (
+            F('age').between(20, 40)
+            & (F('speciality') == 'Surgery')
+            & F('admitted_date').between(DateType(2022, 4, 1), DateType(2022, 4, 5))
+            & (F('open') == True)
+            & (F('total_fee') > 100)
+        )
+        expected = [
+            bill for bill in table.bills
+            if 20 <= bill.patient.age <= 40 and bill.patient.attending_physician.speciality == 'Surgery'
+            and 1 <= bill.patient.admitted_date.day <= 5 and bill.patient.admitted_date.month == 4
+            and bill.patient.discharged_date is None and bill.total_fee > 100
+        ]
+
+        scan = table.where(predicate)
+        assert scan.explain().startswith('ColumnScan')
+        assert scan.bills() == expected
+
+        table.create_index('admitted_date')
+        indexed = table.where(predicate)
+        assert indexed.explain().splitlines()[1].strip().startswith('IndexScan: admitted_date')
+        assert indexed.bills() == expected
+        assert indexed.select('age', 'total_fee') == [(bill.patient.age, bill.total_fee) for bill in expected]
+
+    def test_or_not_and_nulls(self, table):
+        table.create_index('category')
+        table.create_index('id')
+        ids = [bill.patient.id for bill in table.bills]
+
+        union = table.where((F('category') == 'doctor') | (F('id') < ids[2]))
+        assert union.explain().startswith('IndexUnion')
+        assert union.count() == 25 + 1
+
+        assert table.where(~(F('open') == True)).count() == 34
+        assert table.where(F('discharged_date') <= DateType(2022, 5, 1)).count() == 34
+        assert table.where(F('category').isin(['doctor', 'room'])).count() == 100
+        # an index finding most rows is not used.
+        assert table.where(F('id') > 0).explain().startswith('ColumnScan')
+
+    def test_aggregate(self, table):
+        every = table.where()
+        assert every.aggregate('count') == 100
+        assert every.aggregate('sum', 'total_fee') == 49500
+        assert every.aggregate('max', 'admitted_date') == DateType(2022, 4, 28)
+        assert every.aggregate('min', 'discharged_date') == DateType(2022, 5, 1)
+        assert every.group_by('speciality', 'sum', 'total_fee') == {'Pediatrics': 24500, 'Surgery': 25000}
+        assert table.where(F('age') > 100).aggregate('mean', 'age') is None
+
+        with pytest.raises(ValueError):
+            every.aggregate('sum', 'speciality')
+        with pytest.raises(ValueError):
+            F('unknown')
+        with pytest.raises(TypeError):
+            F('admitted_date') > '2022-04-01'
+
+
+class TestReconcile:
+    """
+    This class test reconciliation of bills.
+    - Bills with the same charges in any order are skipped by their digests.
+    - Added, removed and changed charges are found in reordered bills.
+    """
+
+    # test cases
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+
+    def make_bills(self, count):
+        bills = []
+        for i in range(count):
+            bill = BillType(PatientType('Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14)))
+            bill.add_charge(20, 'doctor', 'meeting', DateType(2022, 4, 14))
+            bill.add_charge(22, 'room', posted_date=DateType(2022, 4, 14))
+            bill.add_charge(22, 'room', posted_date=DateType(2022, 4, 15))
+            bills.append(bill)
+        return bills
+
+    def test_digest_ignores_order(self):
+        reconciler = Reconciler(workers=1)
+        bill = self.make_bills(1)[0]
+        records = [(charge.cost, charge.category, charge.description, charge.posted_date) for charge in bill]
+        assert reconciler.digest(bill) == reconciler.digest(records[::-1])
+        assert reconciler.digest(bill) != reconciler.digest(records[:2])
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_reconcile(self, workers):
+        ours = self.make_bills(6)
+        theirs = {}
+        for bill in ours:
+            theirs[bill.patient.id] = [
+                (charge.cost, charge.category, charge.description, charge.posted_date) for charge in bill
+            ][::-1]
+
+        first, second = ours[0].patient.id, ours[1].patient.id
+        theirs[first][0] = (30, 'room', None, DateType(2022, 4, 15))
+        theirs[first].append((5, 'medicine', None, None))
+        del theirs[second][1]
+        ours[2].remove_charge(0)
+        third = ours[2].patient.id
+
+        report = Reconciler(workers=workers, chunk_size=1).reconcile(ledger_of(ours), theirs)
+        assert (report.bills, report.skipped) == (6, 3)
+        diffs = {diff.patient_id: diff for diff in report.diffs}
+        assert diffs[first].changed == [ChargeChange('room', None, DateType(2022, 4, 15).toordinal(), 22, 30)]
+        assert diffs[first].added == [(5, 'medicine', None, None)]
+        assert diffs[second].removed == [(22, 'room', None, DateType(2022, 4, 14).toordinal())]
+        assert diffs[third].added == [(20, 'doctor', 'meeting', DateType(2022, 4, 14).toordinal())]
+        assert 'patient' in str(report) and not report.matched
+
+    def test_cached_digest_follows_version(self):
+        reconciler = Reconciler(workers=1)
+        bills = self.make_bills(2)
+        theirs = {bill.patient.id: list(bill) for bill in bills}
+        assert reconciler.reconcile(ledger_of(bills), theirs).matched
+
+        bills[0].add_charge(5, 'medicine')
+        report = reconciler.reconcile(ledger_of(bills), theirs)
+        assert [diff.patient_id for diff in report.diffs] == [bills[0].patient.id]
+        assert report.diffs[0].removed == [(5, 'medicine', None, None)]
+
+    def test_edit_in_place_stales_only_its_bill(self, monkeypatch):
+        reconciler = Reconciler(workers=1)
+        bills = self.make_bills(3)
+        theirs = {bill.patient.id: list(bill) for bill in bills}
+        reconciler.reconcile(ledger_of(bills), theirs)
+
+        hashed = []
+        digest = reconcile.bill_digest
+        monkeypatch.setattr(reconcile, 'bill_digest', lambda records: hashed.append(records) or digest(records))
+
+        revision = bills[1].revision
+        bills[0][0].description = 'edited'
+        assert bills[1].revision == revision and bills[0].revision != revision
+
+        reconciler.reconcile(ledger_of(bills), theirs)
+        # our side: only the edited bill is hashed again; their side is plain lists.
+        assert len(hashed) == 1 + len(bills)
+
+
+class TestNamePool:
+    """
+    This class test interned names of persons.
+    - The same name has one handle and one str object.
+    - Lookup ignores case, and name properties and setters work as before.
+    """
+
+    def test_intern(self):
+        pool = NamePool()
+        first = pool.intern('Smith')
+        assert pool.intern(''.join(['Sm', 'ith'])) == first
+        assert pool[first] == 'Smith' and len(pool) == 1
+        assert pool.intern('SMITH') != first
+        assert pool.lookup('smith') == {first, pool.handle('SMITH')}
+        assert pool.lookup('jones') == frozenset() and pool.handle('Jones') is None
+        with pytest.raises(TypeError):
+            pool.lookup(1)
+
+    def test_person_names(self):
+        a = PatientType(''.join(['Ch', 'is']), 'A', 18, DateType(2011, 3, 13), DoctorType('Surgery', 'Thomas', 'Edison'), DateType(2022, 4, 14))
+        b = PersonType('Chis', 'B')
+        assert a.first_name is b.first_name
+        assert a.first_name_handle == b.first_name_handle
+        assert a.first_name_handle in PersonType.name_pool.lookup('CHIS')
+
+        b.last_name = 'Lee'
+        assert b.last_name == 'Lee' and str(b) == 'First Name: Chis\nLast Name: Lee'
+        with pytest.raises(ValueError):
+            b.last_name = 'Lee2'
+        assert b.last_name == 'Lee'
+
+    def test_pickle_keeps_names(self):
+        import pickle
+        doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+        state = pickle.dumps(doctor)
+        # the pickle has names, not handles of this process.
+        assert b'Edison' in state
+        copied = pickle.loads(state)
+        assert (copied.first_name, copied.last_name, copied.speciality) == ('Thomas', 'Edison', 'Surgery')
+
+
+class TestAgeIndex:
+    """
+    This class test ages derived from birthday.
+    - Rollover updates only patients whose birthday passed.
+    - Full recompute gives the same ages with and without numpy.
+    """
+
+    # test cases
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+
+    def make_patient(self, birthday):
+        return PatientType('Chis', 'A', 0, birthday, self.doctor, DateType(2022, 4, 14))
+
+    def test_age_on(self):
+        assert age_on(DateType(2000, 4, 15), DateType(2022, 4, 14)) == 21
+        assert age_on(DateType(2000, 4, 15), DateType(2022, 4, 15)) == 22
+        # 29 Feb is counted on 1 Mar in common years.
+        assert age_on(DateType(2000, 2, 29), DateType(2023, 2, 28)) == 22
+        assert age_on(DateType(2000, 2, 29), DateType(2023, 3, 1)) == 23
+
+    def test_rollover(self):
+        leap = self.make_patient(DateType(2000, 2, 29))
+        spring = self.make_patient(DateType(2000, 3, 2))
+        others = [self.make_patient(DateType(2000, 6, 1)) for _ in range(10)]
+        index = AgeIndex([leap, spring] + others, today=DateType(2023, 2, 27))
+        assert (leap.age, spring.age, others[0].age) == (22, 22, 22)
+
+        assert index.rollover(DateType(2023, 2, 28)) == 0
+        assert index.rollover(DateType(2023, 3, 2)) == 2
+        assert (leap.age, spring.age, others[0].age) == (23, 23, 22)
+
+        index.remove(spring)
+        assert len(index) == 11
+        # a manual age is kept until the birthday passes.
+        others[0].age = 1
+        assert index.rollover(DateType(2023, 5, 31)) == 0 and others[0].age == 1
+        assert index.rollover(DateType(2023, 6, 1)) == 10 and others[0].age == 23
+
+    @freeze_time('2024-01-10')
+    def test_long_gap_and_today(self):
+        patient = self.make_patient(DateType(2000, 6, 1))
+        index = AgeIndex([patient], today=DateType(2021, 1, 1))
+        assert patient.age == 20
+
+        assert index.rollover() == 1
+        assert patient.age == 23 and index.today == DateType(2024, 1, 10)
+
+    @pytest.mark.parametrize('vectorized', [True, False])
+    def test_recompute_all(self, monkeypatch, vectorized):
+        if not vectorized:
+            monkeypatch.setattr(ages, 'np', None)
+
+        patients = [self.make_patient(DateType(1950 + i % 50, 1 + i % 12, 1 + i % 28)) for i in range(100)]
+        index = AgeIndex(today=DateType(2022, 7, 15))
+        for patient in patients:
+            index.add(patient)
+            patient.age = 0
+
+        assert index.recompute_all() == 100
+        assert all(patient.age == age_on(patient.birthday, DateType(2022, 7, 15)) for patient in patients)
+
+
+class TestIngestion:
+    """
+    This class test the admission pipeline.
+    - Admissions become bills in batches, and wrong ones fail alone.
+    - A full queue raises Backpressure to the producer.
+    """
+
+    # test cases
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+    admission = Admission('Chis', 'A', 18, DateType(2011, 3, 13), doctor, DateType(2022, 4, 14), ((22, 'room', None),))
+
+    def test_validate_batch(self):
+        wrong_name = self.admission._replace(first_name='Chis2')
+        wrong_category = self.admission._replace(charges=((1, 'unknown', None),))
+        wrong_date = self.admission._replace(birthday='2011-03-13')
+
+        errors = validate_batch([self.admission, wrong_name, wrong_category, wrong_date])
+        assert errors[0] is None
+        assert isinstance(errors[1], ValueError) and isinstance(errors[2], ValueError)
+        assert isinstance(errors[3], TypeError)
+
+    @pytest.mark.parametrize('mode', ['thread', 'process'])
+    def test_pipeline(self, mode):
+        batches = []
+        with IngestionPipeline(sink=batches.append, workers=2, batch_size=8, mode=mode) as pipeline:
+            futures = [pipeline.submit(self.admission) for _ in range(50)]
+            wrong = pipeline.submit(self.admission._replace(last_name='A1'))
+            bills = [future.result(timeout=10) for future in futures]
+            with pytest.raises(ValueError):
+                wrong.result(timeout=10)
+
+        assert len({bill.patient.id for bill in bills}) == 50
+        assert bills[0].total_fee == 22 and bills[0][0].posted_date == DateType(2022, 4, 14)
+        assert sum(len(batch) for batch in batches) == 50
+        assert all(len(batch) <= 8 for batch in batches)
+
+        metrics = pipeline.metrics()
+        assert (metrics['submitted'], metrics['completed'], metrics['failed']) == (51, 50, 1)
+        assert metrics['depth'] == 0 and 0 < metrics['p50'] <= metrics['p99']
+        with pytest.raises(RuntimeError):
+            pipeline.submit(self.admission)
+
+    def test_backpressure(self):
+        release = threading.Event()
+        pipeline = IngestionPipeline(sink=lambda bills: release.wait(), maxsize=2, workers=1, batch_size=1, overflow='error')
+        try:
+            futures = [pipeline.submit(self.admission)]
+            # the worker holds one; then the queue fills up.
+            while pipeline.metrics()['depth']:
+                time.sleep(0.01)
+            futures += [pipeline.submit(self.admission) for _ in range(2)]
+            assert pipeline.pressure == 1.0
+            with pytest.raises(Backpressure):
+                pipeline.submit(self.admission)
+            assert pipeline.metrics()['rejected'] == 1
+        finally:
+            release.set()
+            pipeline.close()
+        assert all(future.result().patient.first_name == 'Chis' for future in futures)
+
+
+class TestDischargePlanner:
+    """
+    This class test the expected discharge queue.
+    - next_k and overdue are the same as sorting every patient.
+    - Events keep it up to date.
+    """
+
+    # test cases
+    surgeon = DoctorType('Surgery', 'Thomas', 'Edison')
+    pediatrician = DoctorType('Pediatrics', 'Ann', 'Lee')
+
+    def make_patients(self, count):
+        return [
+            PatientType('Chis', 'A', 18, DateType(2011, 3, 13), self.surgeon if i % 3 else self.pediatrician,
+                        DateType.fromordinal(DateType(2022, 4, 1).toordinal() + (i * 7) % 30))
+            for i in range(count)
+        ]
+
+    def test_queries(self):
+        planner = DischargePlanner({'Surgery': 5, 'Pediatrics': 2})
+        patients = self.make_patients(200)
+        for patient in patients:
+            planner.add(patient)
+
+        def expected(patient):
+            return patient.admitted_date.toordinal() + (5 if patient.attending_physician is self.surgeon else 2)
+
+        ordered = sorted(patients, key=lambda patient: (expected(patient), patient.id))
+        assert [item.patient for item in planner.next_k(15)] == ordered[:15]
+
+        today = DateType(2022, 4, 12)
+        overdue = [patient for patient in ordered if expected(patient) < today.toordinal()]
+        assert [item.patient for item in planner.overdue(today)] == overdue
+        assert planner.expected(patients[1]) == DateType.fromordinal(expected(patients[1]))
+
+        planner.set_expected_stay('Pediatrics', 40)
+        assert all(item.patient.attending_physician is self.surgeon for item in planner.overdue(today))
+
+        for patient in patients[::2]:
+            planner.remove(patient)
+        assert len(planner) == 100 and patients[0] not in planner
+        left = sorted(patients[1::2], key=lambda patient: (planner.expected(patient).toordinal(), patient.id))
+        assert [item.patient for item in planner.next_k(200)] == left
+
+    def test_events(self):
+        bus = EventBus()
+        planner = DischargePlanner({'Surgery': 5, 'Pediatrics': 2})
+        planner.subscribe(bus)
+        patients = self.make_patients(3)
+        for patient in patients:
+            planner.add(patient)
+
+        PatientType.event_bus = bus
+        try:
+            patients[1].attending_physician = self.pediatrician
+            patients[2].discharged_date = DateType(2022, 5, 30)
+        finally:
+            PatientType.event_bus = None
+
+        assert planner.expected(patients[1]) == DateType.fromordinal(patients[1].admitted_date.toordinal() + 2)
+        assert patients[2] not in planner and len(planner) == 2
+
+    @freeze_time('2022-04-10')
+    def test_scheduled_discharge(self):
+        bus = EventBus()
+        planner = DischargePlanner({'Surgery': 30, 'Pediatrics': 30})
+        planner.subscribe(bus)
+        patients = self.make_patients(3)
+        for patient in patients:
+            planner.add(patient)
+
+        PatientType.event_bus = bus
+        try:
+            # scheduled after today: still in hospital, and first to leave.
+            patients[1].discharged_date = DateType(2022, 4, 12)
+        finally:
+            PatientType.event_bus = None
+
+        assert patients[1] in planner and planner.expected(patients[1]) == DateType(2022, 4, 12)
+        assert planner.next_k(1)[0].patient is patients[1]
+        assert patients[1] not in [item.patient for item in planner.overdue(DateType(2022, 6, 1))]
+
+        # the day comes.
+        assert planner.next_k(3, DateType(2022, 4, 12))[0].patient is not patients[1]
+        assert planner.release(DateType(2022, 4, 11)) == 0
+        assert planner.release(DateType(2022, 4, 12)) == 1
+        assert patients[1] not in planner and len(planner) == 2
+
+        planner.add(patients[1])
+        assert patients[1] in planner
+        planner.add(patients[1], today=DateType(2022, 4, 12))
+        assert patients[1] not in planner
+
+
+class TestRenderCache:
+    """
+    This class test cached renderings.
+    - A rendering is reused until a setter, a charge change or a new day.
+    - The cache is bounded.
+    """
+
+    # test cases
+    def make_bill(self):
+        doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+        bill = BillType(PatientType('Chis', 'A', 18, DateType(2011, 3, 13), doctor, DateType(2022, 4, 14)))
+        bill.add_charge(20, 'doctor', 'meeting')
+        return bill
+
+    @freeze_time('2022-04-20')
+    def test_reuse_and_invalidation(self):
+        bill = self.make_bill()
+        patient = bill.patient
+
+        text = str(bill)
+        hits = render_cache.hits
+        assert str(bill) is text and render_cache.hits == hits + 1
+
+        patient.age = 19
+        assert 'Age: 19' in str(patient) and 'Age: 19' in str(bill)
+
+        patient.attending_physician.speciality = 'Pediatrics'
+        assert 'Speciality: Pediatrics' in str(bill)
+
+        bill.add_charge(42, 'medicine')
+        assert 'Total: 62' in str(bill)
+
+        bill[0].description = 'visit'
+        assert 'doctor | 20 | visit' in str(bill)
+
+        bill.remove_charge(1)
+        assert 'Total: 20' in str(bill)
+
+        # an edit of another bill's charge keeps this rendering.
+        other = self.make_bill()
+        text = str(bill)
+        other[0].description = 'call'
+        assert str(bill) is text and 'doctor | 20 | call' in str(other)
+
+    def test_lazy_version(self):
+        a, b = PersonType('Chis', 'A'), PersonType('Chis', 'A')
+        # a person has no version of its own until it is read.
+        assert '_PersonType__version' not in vars(a)
+        version = a.version
+        assert version == a.version and b.version not in (0, version)
+
+        a.first_name = 'Alan'
+        assert '_PersonType__version' not in vars(a)
+        assert a.version > version and a.version != b.version
+
+    def test_new_day(self):
+        bill = self.make_bill()
+        with freeze_time('2022-04-20'):
+            assert 'Duration: 6 days' in str(bill.patient)
+        with freeze_time('2022-04-21'):
+            assert 'Duration: 7 days' in str(bill)
+            bill.patient.update_discharged_date_as_today()
+        assert 'Discharged date: 21/04/2022' in str(bill.patient)
+
+    def test_bounded(self):
+        maxsize = render_cache.maxsize
+        try:
+            render_cache.maxsize = 5
+            for _ in range(10):
+                str(self.make_bill())
+            assert len(render_cache) == 5
+        finally:
+            render_cache.maxsize = maxsize
+
+
+class TestCatalog:
+    """
+    This class test catalogs of hospitals.
+    - Each tenant has its own categories and prices.
+    - A reload makes a new version, and old snapshots do not change.
+    - A bill with a catalog validates categories with it.
+    """
+
+    # test cases
+    catalogs = {
+        'north': {'room': 220, 'Medicine': None, 'doctor': 80},
+        'south': {'room': 180, 'therapy': 60},
+    }
+    doctor = DoctorType('Surgery', 'Thomas', 'Edison')
+
+    def test_validate(self):
+        registry = CatalogRegistry(self.catalogs)
+        north, south = registry['north'], registry['south']
+
+        north.validate('ROOM')
+        assert 'medicine' in north and 'therapy' not in north and 'therapy' in south
+        assert north.price('doctor') == 80 and north.price('medicine') is None
+        with pytest.raises(ValueError):
+            north.validate('therapy')
+        with pytest.raises(TypeError):
+            south.validate(1)
+        with pytest.raises(ValueError):
+            Catalog('east', {'x-ray': 10})
+
+    def test_reload(self):
+        registry = CatalogRegistry(self.catalogs)
+        old = registry['north']
+
+        registry.bulk_reload({'north': {'room': 250}, 'east': {'dental': 90}})
+        assert registry['north'].version == 2 and registry['north'].price('room') == 250
+        assert registry['east'].version == 1 and registry['south'] is not None
+        assert old.version == 1 and old.price('room') == 220 and 'doctor' in old
+
+        registry.add_category('south', 'Dental', 70)
+        assert registry['south'].price('dental') == 70 and 'dental' not in registry['north']
+        assert 'dental' not in ChargeHistoryItem.categories
+
+        registry.remove('east')
+        assert 'east' not in registry and len(registry) == 2
+        with pytest.raises(KeyError):
+            registry.tenant('east')
+
+    def test_bill(self):
+        registry = CatalogRegistry(self.catalogs)
+        bill = BillType(PatientType('Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14)))
+        bill.catalog = registry.tenant('south')
+
+        bill.add_charge(60, 'therapy')
+        with pytest.raises(ValueError):
+            bill.add_charge(30, 'medicine')
+        with pytest.raises(TypeError):
+            bill.add_charge(30, 'room', posted_date='2022-04-14')
+
+        registry.add_category('south', 'dental', 70)
+        bill.add_charge(70, 'dental')
+        assert bill.total_fee == 130 and len(bill) == 2
+
+    def test_concurrent_reload(self):
+        registry = CatalogRegistry(self.catalogs)
+        view = registry.tenant('north')
+        stop = threading.Event()
+
+        def reload():
+            price = 0
+            while not stop.is_set():
+                price += 1
+                registry.bulk_reload({'north': {'room': price, 'doctor': price}, 'south': {'room': price}})
+
+        reloader = threading.Thread(target=reload)
+        reloader.start()
+        try:
+            for _ in range(2000):
+                snapshot = view.snapshot()
+                # both prices of one version are always the same.
+                assert snapshot.price('room') == snapshot.price('doctor') or snapshot.version == 1
+                view.validate('room')
+        finally:
+            stop.set()
+            reloader.join()
+
+    def test_concurrent_writers(self):
+        registry = CatalogRegistry(self.catalogs)
+
+        def reload(tenant):
+            for price in range(200):
+                registry.reload(tenant, {'room': price})
+
+        def add():
+            for index in range(200):
+                registry.add_category('south', 'dental' + 'x' * index, index)
+
+        threads = [threading.Thread(target=reload, args=('north',)), threading.Thread(target=add)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # catalogs built outside the lock are swapped in only over the one they were built from.
+        assert registry['north'].version == 201 and registry['north'].price('room') == 199
+        assert registry['south'].version == 201 and len(registry['south']) == 202
+
+    def test_tenant_category_across_modules(self, tmp_path):
+        import os
+        from accrual import RoomAccrual
+
+        registry = CatalogRegistry({'north': {'icu': 900, 'room': 220}})
+        north = registry.tenant('north')
+        assert 'icu' not in ChargeHistoryItem.categories
+
+        # admitted with a tenant-only category; the bill keeps the catalog.
+        admission = Admission(
+            'Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14), ((900, 'icu', 'bed'),)
+        )
+        assert validate_batch([admission])[0] is not None
+        assert validate_batch([admission], north) == [None]
+        with IngestionPipeline(workers=1, catalog=north) as pipeline:
+            bill = pipeline.submit(admission).result(timeout=10)
+        assert bill.catalog is north
+
+        bill.add_charge(900, 'ICU')
+        with pytest.raises(ValueError):
+            RoomAccrual(100, 'icu')
+        assert RoomAccrual(900, 'icu', 'night', catalog=north).run([bill], today=DateType(2022, 4, 16)) == 2
+        with pytest.raises(ValueError):
+            RoomAccrual(10, 'medicine').run([bill], today=DateType(2022, 4, 17))
+
+        export.export_charges([bill], str(tmp_path), format='npy')
+        charges = export.read_table(str(tmp_path), 'charges')
+        categories = list(export.read_table(str(tmp_path), 'categories')['name'])
+        assert [categories[code] for code in charges['category']] == ['icu'] * 4
+        assert categories[:3] == ChargeHistoryItem.categories[:3]
+
+        writer = shared_store.SharedStoreWriter(f'hms_test_catalog_{os.getpid()}')
+        try:
+            writer.publish([bill])
+            reader = shared_store.SharedStoreReader(f'hms_test_catalog_{os.getpid()}')
+            shared = reader.get(bill.patient.id)
+            categories, total = [charge.category for charge in shared], shared.total_fee
+            reader.close()
+            assert categories == ['icu'] * 4 and total == 3600
+        finally:
+            writer.close()
+
+    def test_edit_tenant_category(self):
+        registry = CatalogRegistry({'north': {'icu': 900, 'ward': 300}})
+        bill = BillType(PatientType('Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14)))
+        bill.catalog = registry.tenant('north')
+        bill.add_charge(900, 'icu')
+
+        # re-categorized with the catalog of the bill, not ChargeHistoryItem.categories.
+        bill[0].category = 'ward'
+        assert bill[0].category == 'ward'
+        with pytest.raises(ValueError):
+            bill[0].category = 'medicine'
+        with pytest.raises(TypeError):
+            bill[0].category = 1
+
+        # the catalog is read when the charge is edited, so a bill given one later uses it too.
+        other = BillType.from_trusted(bill.patient, [ChargeHistoryItem.from_trusted(900, 'icu')])
+        with pytest.raises(ValueError):
+            other[0].category = 'ward'
+        other.catalog = registry.tenant('north')
+        other[0].category = 'ward'
+
+        with pytest.raises(ValueError):
+            ChargeHistoryItem(900, 'icu')
+        assert ChargeHistoryItem(900, 'ICU', catalog=registry['north']).category == 'ICU'
+
+    def test_sharding(self):
+        from sharding import ShardedHospital
+
+        registry = CatalogRegistry({'north': {'icu': 900, 'room': 220}})
+        with ShardedHospital(shards=2, catalog=registry.tenant('north')) as hospital:
+            patient_id = hospital.admit(
+                'Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14)
+            )
+            hospital.add_charge(patient_id, 900, 'icu', 'bed', DateType(2022, 4, 14))
+            with pytest.raises(ValueError):
+                hospital.add_charge(patient_id, 10, 'medicine')
+
+            bill = hospital.get(patient_id)
+            assert bill.total_fee == 900 and bill[0].category == 'icu'
+            assert bill.catalog.tenant == 'north'
+            bill.add_charge(220, 'room')
+
+        with ShardedHospital(shards=1) as hospital:
+            patient_id = hospital.admit(
+                'Chis', 'A', 18, DateType(2011, 3, 13), self.doctor, DateType(2022, 4, 14)
+            )
+            with pytest.raises(ValueError):
+                hospital.add_charge(patient_id, 900, 'icu')
@@ -0,0 +1,290 @@
+"""
+Tiered storage for Hospital management system
+
+This module moves discharged patients and their bills out of live memory
+into a compressed archive file, and keeps recently read ones in an LRU hot cache.
+
+- live: bills of patients in hospital, kept as objects.
+- archive: records of discharged patients, compressed in chunks (zlib or lzma).
+- hot cache: archived bills rebuilt on read, bounded by cache_size.
+
+Reads are the same for every tier: store[patient_id] returns a BillType.
+An archived bill returned from a read is a copy; use restore() to change it.
+The archive file is written and read only by this module, so it is trusted (pickle).
+"""
+
+import lzma
+import os
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from main import DateType, DoctorType, PatientType, ChargeHistoryItem, BillType
+
+# codec name -> (compress, decompress)
+CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+def _date_ordinal(value: Optional[DateType]) -> Optional[int]:
+    return value.toordinal() if value is not None else None
+
+
+def _date(ordinal: Optional[int]) -> Optional[DateType]:
+    return DateType.fromordinal(ordinal) if ordinal is not None else None
+
+
+def bill_record(bill: BillType) -> tuple:
+    """
+    Make a plain record of the bill and its patient. It is picklable and small.
+
+    Args:
+        bill: (BillType) the bill.
+
+    Returns:
+        (tuple): the record.
+    """
+
+    patient = bill.patient
+    doctor = patient.attending_physician
+    return (
+        patient.id,
+        patient.first_name,
+        patient.last_name,
+        patient.age,
+        _date_ordinal(patient.birthday),
+        _date_ordinal(patient.admitted_date),
+        _date_ordinal(patient.discharged_date),
+        (doctor.id, doctor.speciality, doctor.first_name, doctor.last_name),
+        [
+            (charge.cost, charge.category, charge.description, _date_ordinal(charge.posted_date))
+            for charge in bill.snapshot()
+        ],
+    )
+
+
+def rebuild_bill(record: tuple, doctors: Dict[int, DoctorType] = None) -> BillType:
+    """
+    Make the bill of a record from bill_record again, with the same patient id and doctor id.
+
+    Args:
+        record: (tuple) the record.
+        doctors: (Dict[int, DoctorType]|None) rebuilt doctors to share, by their ids.
+
+    Returns:
+        (BillType): the bill.
+    """
+
+    patient_id, first_name, last_name, age, birthday, admitted, discharged, doctor, charges = record
+
+    doctor_id, speciality, doctor_first_name, doctor_last_name = doctor
+    doctors = {} if doctors is None else doctors
+    if doctor_id not in doctors:
+        doctors[doctor_id] = DoctorType.from_trusted(speciality, doctor_first_name, doctor_last_name, doctor_id)
+
+    # the record was valid when it was made, so nothing is checked again.
+    patient = PatientType.from_trusted(
+        first_name, last_name, age, _date(birthday), doctors[doctor_id],
+        _date(admitted), _date(discharged), patient_id=patient_id,
+    )
+    return BillType.from_trusted(patient, (
+        ChargeHistoryItem.from_trusted(cost, category, description, _date(posted))
+        for cost, category, description, posted in charges
+    ))
+
+
+class TieredStore:
+    """
+    This keeps bills in live, archive and hot cache tiers.
+    """
+
+    def __init__(self, path: str, codec: str = 'zlib', chunk_records: int = 256, cache_size: int = 1024):
+        """
+        Initialize this class. The archive file is created (or truncated).
+
+        Args:
+            path: (str) archive file path.
+            codec: (str) one of CODECS.
+            chunk_records: (int) records compressed together.
+            cache_size: (int) max bills in the hot cache.
+        """
+
+        if codec not in CODECS:
+            raise ValueError('It must be in codecs;' + ', '.join(CODECS))
+
+        self.__path = path
+        self.__compress, self.__decompress = CODECS[codec]
+        self.__chunk_records = chunk_records
+        self.__cache_size = cache_size
+
+        self.__live: Dict[int, BillType] = {}
+        # patient id -> (chunk offset, chunk length, position in chunk)
+        self.__index: Dict[int, Tuple[int, int, int]] = {}
+        self.__cache: 'OrderedDict[int, BillType]' = OrderedDict()
+        # rebuilt doctors are shared by their ids.
+        self.__doctors: Dict[int, DoctorType] = {}
+
+        self.__hits = self.__misses = self.__evictions = 0
+        self.__lock = threading.RLock()
+
+        with open(path, 'wb'):
+            pass
+
+    def __len__(self) -> int:
+        return len(self.__live) + len(self.__index)
+
+    def __contains__(self, patient_id: int) -> bool:
+        return patient_id in self.__live or patient_id in self.__index
+
+    def __getitem__(self, patient_id: int) -> BillType:
+        bill = self.get(patient_id)
+        if bill is None:
+            raise KeyError(patient_id)
+        return bill
+
+    @property
+    def metrics(self) -> Dict[str, int]:
+        """
+        It returns counters of the store.
+        hits/misses count reads of archived bills (live reads are not counted).
+
+        Returns:
+            (Dict[str, int]): hits, misses, evictions, live, archived, hot.
+        """
+
+        return {
+            'hits': self.__hits,
+            'misses': self.__misses,
+            'evictions': self.__evictions,
+            'live': len(self.__live),
+            'archived': len(self.__index),
+            'hot': len(self.__cache),
+        }
+
+    def add(self, bill: BillType):
+        """
+        Add a bill to the live tier.
+
+        Args:
+            bill: (BillType) the bill.
+        """
+
+        with self.__lock:
+            patient_id = bill.patient.id
+            self.__index.pop(patient_id, None)
+            self.__cache.pop(patient_id, None)
+            self.__live[patient_id] = bill
+
+    def get(self, patient_id: int) -> Optional[BillType]:
+        """
+        Get a bill from any tier.
+
+        Args:
+            patient_id: (int) id of the patient.
+
+        Returns:
+            (BillType|None): the bill. An archived bill is a rebuilt copy.
+        """
+
+        with self.__lock:
+            bill = self.__live.get(patient_id)
+            if bill is not None:
+                return bill
+
+            bill = self.__cache.get(patient_id)
+            if bill is not None:
+                self.__hits += 1
+                self.__cache.move_to_end(patient_id)
+                return bill
+
+            location = self.__index.get(patient_id)
+            if location is None:
+                return None
+
+            self.__misses += 1
+            bill = self.__load(*location)
+            self.__cache[patient_id] = bill
+            if len(self.__cache) > self.__cache_size:
+                self.__cache.popitem(last=False)
+                self.__evictions += 1
+            return bill
+
+    def archive_discharged(self, today: DateType = None) -> int:
+        """
+        Move bills of patients discharged until today into the archive.
+
+        Args:
+            today: (DateType|None) patients discharged on or before it are moved. None is today.
+
+        Returns:
+            (int): number of archived bills.
+        """
+
+        today = (today or DateType.today()).toordinal()
+
+        with self.__lock:
+            closed = [
+                bill for bill in self.__live.values()
+                if bill.patient.discharged_date is not None and bill.patient.discharged_date.toordinal() <= today
+            ]
+
+            for start in range(0, len(closed), self.__chunk_records):
+                self.__write_chunk(closed[start:start + self.__chunk_records])
+
+            for bill in closed:
+                del self.__live[bill.patient.id]
+
+            return len(closed)
+
+    def restore(self, patient_id: int) -> BillType:
+        """
+        Move an archived bill back to the live tier, e.g. for a late charge or readmission.
+        The old record stays in the archive file as garbage.
+
+        Args:
+            patient_id: (int) id of the patient.
+
+        Returns:
+            (BillType): the live bill.
+        """
+
+        with self.__lock:
+            bill = self[patient_id]
+            self.add(bill)
+            return bill
+
+    def __write_chunk(self, bills: List[BillType]):
+        records = [bill_record(bill) for bill in bills]
+        data = self.__compress(pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL))
+
+        with open(self.__path, 'ab') as archive:
+            archive.seek(0, os.SEEK_END)
+            offset = archive.tell()
+            archive.write(data)
+
+        for position, bill in enumerate(bills):
+            self.__index[bill.patient.id] = (offset, len(data), position)
+
+    def __load(self, offset: int, length: int, position: int) -> BillType:
+        with open(self.__path, 'rb') as archive:
+            archive.seek(offset)
+            records = pickle.loads(self.__decompress(archive.read(length)))
+        return rebuild_bill(records[position], self.__doctors)
+
+    def bills(self) -> Iterator[BillType]:
+        """
+        Iterate every bill, live ones first. Archived ones are read through the hot cache.
+
+        Returns:
+            (Iterator[BillType]): bills.
+        """
+
+        yield from list(self.__live.values())
+        for patient_id in list(self.__index):
+            bill = self.get(patient_id)
+            if bill is not None:
+                yield bill